@@ -0,0 +1,243 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import base64
+import gzip
+import importlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+'''
+Cold start benchmark for the pipeline Lambda functions.
+
+Each function is measured in a fresh Python process: the time to import its
+handler module, the time of the first invocation (which creates the boto3
+clients) and of a second, warm invocation. AWS API calls are answered
+locally through a botocore 'before-send' hook, so no network access or
+credentials are needed and only client-side cost is measured. The local
+responses are empty, so some handlers log errors after their first call.
+
+Usage:
+    python benchmarks/cold_start.py [--runs 5] [--max-import-ms 1500]
+        [--max-first-invoke-ms 3000]
+
+The script exits with status 1 when a function exceeds a threshold, so it
+can be used to catch cold start regressions.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_PATH = os.path.join(ROOT, 'layers', 'pipeline_common')
+
+FINDINGS_INPUT = {
+    'id': 'benchmark',
+    'token': 'benchmark-token',
+    'macieFindingsInfo': {
+        'Payload': {'findingKeys': ['benchmark/a.csv'], 'findingsCount': 1}
+    }
+}
+
+JOB_STATUS_LOGS = base64.b64encode(gzip.compress(json.dumps({
+    'logEvents': [{'message': json.dumps(
+        {'jobId': 'benchmark-job', 'eventType': 'JOB_COMPLETED'})}]
+}).encode('utf-8'))).decode('utf-8')
+
+FUNCTIONS = {
+    'trigger_macie_scan': (
+        'triggerMacieScan', {'Input': {'id': 'benchmark'}}),
+    'check_macie_status': (
+        'checkMacieStatus',
+        {'Input': {'jobId': {'Payload': {'jobId': 'benchmark-job'}}}}),
+    'get_macie_findings_count': (
+        'getMacieFindingsCount',
+        {'Input': {
+            'id': 'benchmark',
+            'jobId': {'Payload': {'jobId': 'benchmark-job'}}
+        }}),
+    'move_all_scan_stage_s3_files': (
+        'moveAllScanStageS3Files', {'Input': FINDINGS_INPUT}),
+    'move_to_manual_review_s3_files': (
+        'moveToManualReviewS3Files', {'Input': FINDINGS_INPUT}),
+    'move_to_scanned_data_s3_files': (
+        'moveToScannedDataS3Files', {'Input': FINDINGS_INPUT}),
+    'delete_manual_review_s3_files': (
+        'deleteManualReviewS3Files', {'Input': FINDINGS_INPUT}),
+    'trigger_manual_approval': (
+        'triggerManualApproval',
+        {'Input': FINDINGS_INPUT, 'token': 'benchmark-token'}),
+    'receive_approval_decision_api': (
+        'receiveApprovalDecisionAPI',
+        {
+            'requestContext': {'resourcePath': '/allow'},
+            'queryStringParameters': {'token': 'benchmark-token'}
+        }),
+    'apply_approval_decisions': (
+        'applyApprovalDecisions', {'Input': FINDINGS_INPUT}),
+    'dispose_findings': (
+        'disposeFindings', {'Input': FINDINGS_INPUT}),
+    'plan_shards': (
+        'planShards', {'Input': FINDINGS_INPUT, 'source': 'findings'}),
+    'aggregate_shard_results': (
+        'aggregateShardResults',
+        {'shardResults': [{'processedCount': 1, 'failed': []}]}),
+    'register_macie_job_wait': (
+        'registerMacieJobWait',
+        {
+            'Input': {'jobId': {'Payload': {'jobId': 'benchmark-job'}}},
+            'token': 'benchmark-token'
+        }),
+    'batch_raw_object_events': (
+        'batchRawObjectEvents',
+        {'Records': [{
+            'messageId': 'benchmark-message',
+            'body': json.dumps({'Records': [{
+                'eventName': 'ObjectCreated:Put',
+                's3': {'object': {'key': 'benchmark/a.csv', 'size': 1}}
+            }]})
+        }]}),
+    'resume_macie_job_wait': (
+        'resumeMacieJobWait', {'awslogs': {'data': JOB_STATUS_LOGS}}),
+    'write_execution_timeline': (
+        'writeExecutionTimeline',
+        {'detail': {
+            'executionArn': 'arn:aws:states:us-east-1:123456789012:execution:benchmark:benchmark',
+            'name': 'benchmark',
+            'status': 'SUCCEEDED',
+            'startDate': 1767225600000,
+            'stopDate': 1767229200000,
+            'input': json.dumps({'id': 'benchmark'})
+        }})
+}
+
+ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'accountId': '123456789012',
+    'rawS3Bucket': 'benchmark-raw',
+    'scanS3Bucket': 'benchmark-scan-stage',
+    'scannedS3Bucket': 'benchmark-scanned-data',
+    'manifestS3Bucket': 'benchmark-manifests',
+    'sourceS3Bucket': 'benchmark-source',
+    'targetS3Bucket': 'benchmark-target',
+    'targetScannedS3Bucket': 'benchmark-scanned-data',
+    'apiAllowEndpoint': 'https://example.com/allow',
+    'apiDenyEndpoint': 'https://example.com/deny',
+    'snsTopicArn': 'arn:aws:sns:us-east-1:123456789012:benchmark',
+    'shardSize': '5000',
+    'stateMachineArn': 'arn:aws:states:us-east-1:123456789012:stateMachine:benchmark'
+}
+
+class BenchmarkContext:
+    def get_remaining_time_in_millis(self):
+        return 10000
+
+def _local_response(request, **kwargs):
+    from botocore.awsrequest import AWSResponse
+
+    class RawBody(io.BytesIO):
+        def stream(self, **kwargs):
+            yield self.read()
+
+    # S3 answers in XML whatever the content type of the request body
+    body = b'{}' if request.headers.get('Content-Type', b'').startswith(
+        (b'application/json', b'application/x-amz-json')) and not \
+        kwargs.get('event_name', '').startswith('before-send.s3.') else b''
+    return AWSResponse(request.url, 200, {}, RawBody(body))
+
+def measure(function_dir):
+    module_name, event = FUNCTIONS[function_dir]
+    sys.path[:0] = [LAYER_PATH, os.path.join(ROOT, 'functions', function_dir)]
+
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+
+    import boto3
+    boto3.setup_default_session()
+    boto3.DEFAULT_SESSION.events.register('before-send', _local_response)
+
+    timings = {'import_ms': (imported - started) * 1000}
+    for label in ('first_invoke_ms', 'warm_invoke_ms'):
+        started = time.perf_counter()
+        try:
+            module.lambda_handler(json.loads(json.dumps(event)), BenchmarkContext())
+        except Exception as e:
+            timings['error'] = repr(e)
+        timings[label] = (time.perf_counter() - started) * 1000
+
+    return timings
+
+def run_isolated(function_dir):
+    env = dict(os.environ)
+    env.update(ENVIRONMENT)
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--measure', function_dir],
+        env = env,
+        stdout = subprocess.PIPE,
+        stderr = subprocess.PIPE,
+        check = True
+    ).stdout.decode('utf-8')
+
+    # Handlers print their errors; the measurement is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--measure', help = argparse.SUPPRESS)
+    parser.add_argument('--runs', type = int, default = 5)
+    parser.add_argument('--function', action = 'append',
+        choices = sorted(FUNCTIONS), help = 'function directory to measure')
+    parser.add_argument('--max-import-ms', type = float)
+    parser.add_argument('--max-first-invoke-ms', type = float)
+    args = parser.parse_args()
+
+    if args.measure:
+        timings = measure(args.measure)
+        sys.stdout.flush()
+        print(json.dumps(timings))
+        return 0
+
+    regressions = []
+    print(f"{'function':34} {'import ms':>10} {'first ms':>10} {'warm ms':>10}")
+    for function_dir in args.function or sorted(FUNCTIONS):
+        runs = [run_isolated(function_dir) for _ in range(args.runs)]
+        medians = {
+            label: statistics.median(run[label] for run in runs)
+            for label in ('import_ms', 'first_invoke_ms', 'warm_invoke_ms')
+        }
+        print(f"{function_dir:34} {medians['import_ms']:10.1f} "
+            f"{medians['first_invoke_ms']:10.1f} {medians['warm_invoke_ms']:10.1f}")
+
+        if args.max_import_ms and medians['import_ms'] > args.max_import_ms:
+            regressions.append(f'{function_dir}: import took {medians["import_ms"]:.1f} ms')
+        if (args.max_first_invoke_ms
+                and medians['first_invoke_ms'] > args.max_first_invoke_ms):
+            regressions.append(
+                f'{function_dir}: first invoke took {medians["first_invoke_ms"]:.1f} ms')
+
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
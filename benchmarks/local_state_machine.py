@@ -0,0 +1,383 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import copy
+import json
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Local interpreter for the subset of the Amazon States Language used by the
+pipeline state machine: Task (lambda:invoke, with or without
+waitForTaskToken), Choice, Wait, Map, Pass, Succeed and Fail states, with
+Parameters, ItemSelector, ResultSelector, InputPath, ResultPath, OutputPath
+and Catch.
+
+The interpreter only handles the data flow. Invoking functions, completing
+task tokens, waiting and measuring states are left to a runtime object with
+the methods invoke(function_name, payload), new_task_token(),
+await_task(function_name, task_token, timeout_seconds), wait(seconds),
+measure(state_name), which is a context manager wrapped around every
+top-level Task and Map state, and now(), the time in epoch seconds.
+
+Every execution keeps a history of its top-level states in the format of
+the Step Functions GetExecutionHistory API, with the times of runtime.now().
+'''
+
+MAX_STATE_BYTES = 256 * 1024
+DEFAULT_MAX_TRANSITIONS = 100000
+
+# Errors States.ALL does not match
+UNCATCHABLE_ERRORS = ['States.Runtime', 'States.DataLimitExceeded']
+
+SUBSTITUTION = re.compile(r'^\$\{(\w+)\}$')
+
+class TaskFailed(Exception):
+    def __init__(self, error, cause=None):
+        super().__init__(f'{error}: {cause}')
+        self.error = error
+        self.cause = cause
+
+class ExecutionFailed(Exception):
+    def __init__(self, error, cause=None):
+        super().__init__(f'{error}: {cause}')
+        self.error = error
+        self.cause = cause
+
+class PathNotFound(TaskFailed):
+    def __init__(self, path):
+        super().__init__('States.Runtime', f'Invalid path {path}')
+
+def get_path(document, path, context=None):
+    if path.startswith('$$'):
+        document, path = context, path[1:]
+    if path == '$':
+        return document
+    for name in path[2:].split('.'):
+        if not isinstance(document, dict) or name not in document:
+            raise PathNotFound(path)
+        document = document[name]
+    return document
+
+def is_present(document, path):
+    try:
+        get_path(document, path)
+    except PathNotFound:
+        return False
+    return True
+
+def set_path(document, path, value):
+    if path is None:
+        return document
+    if path == '$':
+        return value
+    document = copy.deepcopy(document) if isinstance(document, dict) else {}
+    target = document
+    names = path[2:].split('.')
+    for name in names[:-1]:
+        if not isinstance(target.get(name), dict):
+            target[name] = {}
+        target = target[name]
+    target[names[-1]] = value
+
+    return document
+
+def resolve(template, document, context):
+    if isinstance(template, dict):
+        resolved = {}
+        for name, value in template.items():
+            if name.endswith('.$'):
+                resolved[name[:-2]] = copy.deepcopy(get_path(document, value, context))
+            else:
+                resolved[name] = resolve(value, document, context)
+        return resolved
+    if isinstance(template, list):
+        return [resolve(value, document, context) for value in template]
+    return template
+
+def _compare(rule, value):
+    for operator, operand in rule.items():
+        if operator in ('Variable', 'Next'):
+            continue
+        if operator == 'IsNull':
+            return (value is None) == operand
+        if operator == 'IsBoolean':
+            return isinstance(value, bool) == operand
+        if operator == 'IsString':
+            return isinstance(value, str) == operand
+        if operator == 'IsNumeric':
+            return (isinstance(value, (int, float))
+                and not isinstance(value, bool)) == operand
+        if operator.startswith('String'):
+            if not isinstance(value, str):
+                return False
+            if operator == 'StringEquals':
+                return value == operand
+            if operator == 'StringLessThan':
+                return value < operand
+            if operator == 'StringGreaterThan':
+                return value > operand
+        if operator == 'BooleanEquals':
+            return isinstance(value, bool) and value == operand
+        if operator.startswith('Numeric'):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return False
+            return {
+                'NumericEquals': value == operand,
+                'NumericLessThan': value < operand,
+                'NumericLessThanEquals': value <= operand,
+                'NumericGreaterThan': value > operand,
+                'NumericGreaterThanEquals': value >= operand
+            }[operator]
+        raise TaskFailed('States.Runtime', f'Unsupported comparison {operator}')
+
+    raise TaskFailed('States.Runtime', 'Choice rule without comparison')
+
+def evaluate(rule, document):
+    if 'And' in rule:
+        return all(evaluate(child, document) for child in rule['And'])
+    if 'Or' in rule:
+        return any(evaluate(child, document) for child in rule['Or'])
+    if 'Not' in rule:
+        return not evaluate(rule['Not'], document)
+    if 'IsPresent' in rule:
+        return is_present(document, rule['Variable']) == rule['IsPresent']
+
+    return _compare(rule, get_path(document, rule['Variable']))
+
+def error_matches(error_equals, error):
+    if error in error_equals:
+        return True
+    return 'States.ALL' in error_equals and error not in UNCATCHABLE_ERRORS
+
+def function_name(parameters):
+    # "${TriggerMacieScan}" in the definition, as substituted by the template
+    name = parameters['FunctionName']
+    match = SUBSTITUTION.match(name)
+    return match.group(1) if match else name
+
+class LocalStateMachine:
+    def __init__(self, definition, runtime, max_transitions=DEFAULT_MAX_TRANSITIONS):
+        if isinstance(definition, str):
+            definition = json.loads(definition)
+        self.definition = definition
+        self.runtime = runtime
+        self.max_transitions = max_transitions
+        self.transitions = 0
+        self.state_bytes = {}
+        self.history = []
+        self.lock = threading.Lock()
+
+    def _record(self, event_type, **details):
+        with self.lock:
+            event_id = len(self.history) + 1
+            self.history.append(dict(
+                details,
+                timestamp = self.runtime.now(),
+                type = event_type,
+                id = event_id,
+                previousEventId = event_id - 1
+            ))
+
+    def execute(self, execution_input, name=None):
+        '''
+        Run one execution. Returns a dict with the 'status' ('SUCCEEDED' or
+        'FAILED'), the 'output' or the 'error' and 'cause', the number of
+        state 'transitions' and the 'startDate' and 'stopDate' of the
+        execution. Its events are in history.
+        '''
+        name = name or str(uuid.uuid4())
+        context = {
+            'Execution': {'Id': name, 'Name': name, 'Input': execution_input}
+        }
+        self.transitions = 0
+        self.history = []
+        self._record('ExecutionStarted', executionStartedEventDetails = {
+            'input': json.dumps(execution_input)})
+        try:
+            output = self._run(
+                self.definition['States'],
+                self.definition['StartAt'],
+                execution_input,
+                context,
+                top_level = True
+            )
+        except (ExecutionFailed, TaskFailed) as e:
+            self._record('ExecutionFailed', executionFailedEventDetails = {
+                'error': e.error, 'cause': e.cause})
+            return {
+                'status': 'FAILED',
+                'error': e.error,
+                'cause': e.cause,
+                'transitions': self.transitions,
+                'startDate': self.history[0]['timestamp'],
+                'stopDate': self.history[-1]['timestamp']
+            }
+
+        self._record('ExecutionSucceeded', executionSucceededEventDetails = {
+            'output': json.dumps(output)})
+        return {
+            'status': 'SUCCEEDED',
+            'output': output,
+            'transitions': self.transitions,
+            'startDate': self.history[0]['timestamp'],
+            'stopDate': self.history[-1]['timestamp']
+        }
+
+    def _run(self, states, state_name, state_input, context, top_level=False):
+        while True:
+            with self.lock:
+                self.transitions += 1
+                transitions = self.transitions
+            if transitions > self.max_transitions:
+                raise ExecutionFailed('States.Runtime',
+                    f'More than {self.max_transitions} state transitions')
+
+            state = states[state_name]
+            state_context = dict(context, State = {'Name': state_name})
+            if top_level:
+                self._record(f"{state['Type']}StateEntered",
+                    stateEnteredEventDetails = {'name': state_name})
+            try:
+                if top_level and state['Type'] in ('Task', 'Map'):
+                    with self.runtime.measure(state_name):
+                        output, next_state = self._step(state, state_input, state_context)
+                else:
+                    output, next_state = self._step(state, state_input, state_context)
+            except TaskFailed as e:
+                catcher = next((
+                    catcher for catcher in state.get('Catch', [])
+                    if error_matches(catcher['ErrorEquals'], e.error)
+                ), None)
+                if catcher is None:
+                    raise
+                output = set_path(
+                    state_input,
+                    catcher.get('ResultPath', '$'),
+                    {'Error': e.error, 'Cause': e.cause}
+                )
+                next_state = catcher['Next']
+
+            size = len(json.dumps(output))
+            if size > MAX_STATE_BYTES:
+                raise ExecutionFailed('States.DataLimitExceeded',
+                    f'The state {state_name} returned {size} bytes')
+            if top_level:
+                self.state_bytes[state_name] = max(
+                    size, self.state_bytes.get(state_name, 0))
+                self._record(f"{state['Type']}StateExited",
+                    stateExitedEventDetails = {
+                        'name': state_name,
+                        'output': json.dumps(output)
+                    })
+
+            if next_state is None:
+                return output
+            state_name = next_state
+            state_input = output
+
+    def _step(self, state, state_input, context):
+        state_type = state['Type']
+        if state_type == 'Choice':
+            for rule in state['Choices']:
+                if evaluate(rule, state_input):
+                    return state_input, rule['Next']
+            if 'Default' not in state:
+                raise TaskFailed('States.NoChoiceMatched', 'No choice rule matched')
+            return state_input, state['Default']
+        if state_type == 'Succeed':
+            return self._output(state, state_input), None
+        if state_type == 'Fail':
+            raise ExecutionFailed(state.get('Error'), state.get('Cause'))
+
+        effective_input = get_path(state_input, state.get('InputPath', '$'), context)
+        if state_type == 'Wait':
+            if 'SecondsPath' in state:
+                seconds = get_path(effective_input, state['SecondsPath'], context)
+            else:
+                seconds = state.get('Seconds', 0)
+            self.runtime.wait(seconds)
+            result = None
+        elif state_type == 'Pass':
+            if 'Parameters' in state:
+                result = resolve(state['Parameters'], effective_input, context)
+            else:
+                result = state.get('Result', effective_input)
+        elif state_type == 'Task':
+            result = self._task(state, effective_input, context)
+        elif state_type == 'Map':
+            result = self._map(state, effective_input, context)
+        else:
+            raise TaskFailed('States.Runtime', f'Unsupported state type {state_type}')
+
+        if state_type == 'Wait':
+            output = state_input
+        else:
+            if 'ResultSelector' in state:
+                result = resolve(state['ResultSelector'], result, context)
+            output = set_path(state_input, state.get('ResultPath', '$'), result)
+        return self._output(state, output), None if state.get('End') else state['Next']
+
+    def _output(self, state, output):
+        return get_path(output, state.get('OutputPath', '$'))
+
+    def _task(self, state, effective_input, context):
+        resource = state['Resource']
+        if not resource.startswith('arn:aws:states:::lambda:invoke'):
+            raise TaskFailed('States.Runtime', f'Unsupported resource {resource}')
+
+        if resource.endswith('.waitForTaskToken'):
+            task_token = self.runtime.new_task_token()
+            context = dict(context, Task = {'Token': task_token})
+            parameters = resolve(state['Parameters'], effective_input, context)
+            self.runtime.invoke(function_name(parameters), parameters['Payload'])
+            return self.runtime.await_task(
+                function_name(parameters),
+                task_token,
+                state.get('TimeoutSeconds', 99999999)
+            )
+
+        parameters = resolve(state['Parameters'], effective_input, context)
+        payload = self.runtime.invoke(function_name(parameters), parameters['Payload'])
+        return {
+            'ExecutedVersion': '$LATEST',
+            'Payload': payload,
+            'StatusCode': 200
+        }
+
+    def _map(self, state, effective_input, context):
+        items = get_path(effective_input, state.get('ItemsPath', '$'), context)
+        selector = state.get('ItemSelector', state.get('Parameters'))
+        processor = state.get('ItemProcessor', state.get('Iterator'))
+
+        def run_item(indexed_item):
+            index, item = indexed_item
+            item_context = dict(context, Map = {'Item': {'Index': index, 'Value': item}})
+            item_input = item
+            if selector is not None:
+                item_input = resolve(selector, effective_input, item_context)
+            return self._run(
+                processor['States'],
+                processor['StartAt'],
+                item_input,
+                item_context
+            )
+
+        max_concurrency = state.get('MaxConcurrency', 0) or max(1, len(items))
+        with ThreadPoolExecutor(max_workers = max_concurrency) as executor:
+            return list(executor.map(run_item, enumerate(items)))
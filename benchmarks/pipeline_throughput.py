@@ -0,0 +1,810 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import base64
+import csv
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, redirect_stdout
+from urllib.parse import parse_qsl, quote_plus
+
+'''
+Throughput benchmark of the whole pipeline on in-process AWS stand-ins.
+
+A synthetic set of objects is uploaded to a stand-in raw data bucket and the
+state machine definition is replayed locally (see local_state_machine.py)
+with every Lambda function imported and invoked in this process against the
+S3, Macie, SNS and Step Functions stand-ins of stand_ins.py. Macie jobs and
+Wait states run on a virtual clock, so a run takes only the time spent in
+the functions. The reviewer approves or denies the manual approval (with
+--approval partial, first the files under one prefix and then denies the
+rest), and in
+event wait mode the Macie job status events are delivered to
+resumeMacieJobWait when the jobs complete.
+
+For each top-level state the report gives the number of invocations, the
+time spent, the objects of the run per second of that time, the API calls
+and throttled attempts, the peak traced Python memory and the largest state
+output. Objects per second are the objects of the run divided by the time of
+the state, so states can be compared with each other and across runs.
+Executions run one after another so that every number belongs to one state.
+
+When an execution ends writeExecutionTimeline writes its timeline, as it
+does when deployed; the report includes the timelines, with the simulated
+waits, and --timelines writes them to a directory for pipeline_timelines.py.
+--batch-shape generates objects with the sizes and file types of the batch
+of a recorded timeline.
+
+Usage:
+    python benchmarks/pipeline_throughput.py [--objects 10000]
+        [--size-distribution lognormal] [--mean-size 1048576]
+        [--batch-shape timeline.json]
+        [--findings-ratio 0.05] [--unscannable-ratio 0.1] [--trigger schedule|events]
+        [--wait-mode poll|event] [--bucket-layout single] [--handoff tag|copy]
+        [--batch-operations-threshold 1000]
+        [--listing-concurrency 8] [--inventory] [--claims sqlite]
+        [--pre-classifier] [--approval allow|deny|partial]
+        [--disposition-policy '[{"action": "allow", "severities": ["Low"]}]']
+        [--latency-ms s3=20] [--throttle-rate s3=0.01]
+        [--json report.json] [--timelines DIR]
+
+The script exits with status 1 when an execution fails.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_PATH = os.path.join(ROOT, 'layers', 'pipeline_common')
+STATE_MACHINE_PATH = os.path.join(ROOT, 'statemachine', 'macie_pipeline_scan.asl.json')
+
+BUCKETS = {
+    'raw': 'benchmark-raw',
+    'scan': 'benchmark-scan-stage',
+    'scanned': 'benchmark-scanned-data',
+    'review': 'benchmark-manual-review',
+    'manifest': 'benchmark-manifests'
+}
+ACCOUNT_ID = '123456789012'
+STATE_MACHINE_ARN = f'arn:aws:states:us-east-1:{ACCOUNT_ID}:stateMachine:benchmark'
+EXECUTION_ARN_PREFIX = f'arn:aws:states:us-east-1:{ACCOUNT_ID}:execution:benchmark'
+INVENTORY_PREFIX = f"inventory/{BUCKETS['raw']}/RawObjects"
+SERVICES = ['s3', 's3control', 'macie2', 'sns', 'stepfunctions']
+
+# Definition substitutions and the function directory and module they invoke
+FUNCTIONS = {
+    'ApplyApprovalDecisions': ('apply_approval_decisions', 'applyApprovalDecisions'),
+    'AggregateShardResults': ('aggregate_shard_results', 'aggregateShardResults'),
+    'BatchRawObjectEvents': ('batch_raw_object_events', 'batchRawObjectEvents'),
+    'CheckMacieStatus': ('check_macie_status', 'checkMacieStatus'),
+    'DeleteManualReviewS3Files': ('delete_manual_review_s3_files', 'deleteManualReviewS3Files'),
+    'DisposeFindings': ('dispose_findings', 'disposeFindings'),
+    'GetMacieFindingsCount': ('get_macie_findings_count', 'getMacieFindingsCount'),
+    'MoveAllScanStageS3Files': ('move_all_scan_stage_s3_files', 'moveAllScanStageS3Files'),
+    'MoveToManualReviewS3Files': ('move_to_manual_review_s3_files', 'moveToManualReviewS3Files'),
+    'MoveToScannedDataS3Files': ('move_to_scanned_data_s3_files', 'moveToScannedDataS3Files'),
+    'PlanShards': ('plan_shards', 'planShards'),
+    'ReceiveApprovalDecisionAPI': ('receive_approval_decision_api', 'receiveApprovalDecisionAPI'),
+    'RegisterMacieJobWait': ('register_macie_job_wait', 'registerMacieJobWait'),
+    'ResumeMacieJobWait': ('resume_macie_job_wait', 'resumeMacieJobWait'),
+    'TriggerMacieScan': ('trigger_macie_scan', 'triggerMacieScan'),
+    'TriggerManualApproval': ('trigger_manual_approval', 'triggerManualApproval'),
+    'WriteExecutionTimeline': ('write_execution_timeline', 'writeExecutionTimeline')
+}
+
+COMMON_ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'scanCacheBackend': 'none'
+}
+
+# Environment variables of each function, as set by template.yaml
+FUNCTION_ENVIRONMENT = {
+    'BatchRawObjectEvents': {
+        'stateMachineArn': STATE_MACHINE_ARN,
+        'manifestS3Bucket': BUCKETS['manifest']
+    },
+    'CheckMacieStatus': {},
+    'DeleteManualReviewS3Files': {
+        'sourceS3Bucket': BUCKETS['review'],
+        'manifestS3Bucket': BUCKETS['manifest']
+    },
+    'ApplyApprovalDecisions': {
+        'sourceS3Bucket': BUCKETS['review'],
+        'targetS3Bucket': BUCKETS['scanned'],
+        'manifestS3Bucket': BUCKETS['manifest']
+    },
+    'DisposeFindings': {
+        'sourceS3Bucket': BUCKETS['scan'],
+        'targetS3Bucket': BUCKETS['scanned']
+    },
+    'GetMacieFindingsCount': {'manifestS3Bucket': BUCKETS['manifest']},
+    'MoveAllScanStageS3Files': {
+        'sourceS3Bucket': BUCKETS['scan'],
+        'targetS3Bucket': BUCKETS['scanned'],
+        'manifestS3Bucket': BUCKETS['manifest'],
+        'accountId': ACCOUNT_ID
+    },
+    'MoveToManualReviewS3Files': {
+        'sourceS3Bucket': BUCKETS['scan'],
+        'targetS3Bucket': BUCKETS['review'],
+        'manifestS3Bucket': BUCKETS['manifest'],
+        'accountId': ACCOUNT_ID
+    },
+    'MoveToScannedDataS3Files': {
+        'sourceS3Bucket': BUCKETS['review'],
+        'targetS3Bucket': BUCKETS['scanned'],
+        'manifestS3Bucket': BUCKETS['manifest'],
+        'accountId': ACCOUNT_ID
+    },
+    'PlanShards': {
+        'manifestS3Bucket': BUCKETS['manifest'],
+        'shardSize': '5000'
+    },
+    'ReceiveApprovalDecisionAPI': {'manifestS3Bucket': BUCKETS['manifest']},
+    'RegisterMacieJobWait': {'manifestS3Bucket': BUCKETS['manifest']},
+    'ResumeMacieJobWait': {'manifestS3Bucket': BUCKETS['manifest']},
+    'TriggerMacieScan': {
+        'rawS3Bucket': BUCKETS['raw'],
+        'scanS3Bucket': BUCKETS['scan'],
+        'scannedS3Bucket': BUCKETS['scanned'],
+        'manifestS3Bucket': BUCKETS['manifest'],
+        'accountId': ACCOUNT_ID
+    },
+    'TriggerManualApproval': {
+        'apiAllowEndpoint': 'https://example.com/Prod/allow',
+        'apiDenyEndpoint': 'https://example.com/Prod/deny',
+        'snsTopicArn': 'arn:aws:sns:us-east-1:123456789012:benchmark',
+        'sourceS3Bucket': BUCKETS['scan'],
+        'targetScannedS3Bucket': BUCKETS['scanned'],
+        'manifestS3Bucket': BUCKETS['manifest']
+    },
+    'WriteExecutionTimeline': {'manifestS3Bucket': BUCKETS['manifest']}
+}
+
+def layout_environment(bucket_layout, handoff):
+    '''
+    FUNCTION_ENVIRONMENT with the bucket names template.yaml sets for the
+    bucket layout: in the single layout every stage bucket is the raw bucket,
+    and so is the scanned data bucket when objects are handed off by tag.
+    '''
+    buckets = {}
+    if bucket_layout == 'single':
+        buckets = {BUCKETS['scan']: BUCKETS['raw'], BUCKETS['review']: BUCKETS['raw']}
+        if handoff == 'tag':
+            buckets[BUCKETS['scanned']] = BUCKETS['raw']
+
+    return {
+        function_name: {
+            name: buckets.get(value, value) for name, value in environment.items()
+        }
+        for function_name, environment in FUNCTION_ENVIRONMENT.items()
+    }
+
+# Approved first by --approval partial, about a tenth of the generated keys
+PARTIAL_APPROVAL_PREFIX = 'ingest/0'
+
+# File types of the generated objects and their share of the objects
+EXTENSIONS = [
+    ('csv', 'text/csv', 0.4),
+    ('json', 'application/json', 0.25),
+    ('txt', 'text/plain', 0.15),
+    ('parquet', 'application/octet-stream', 0.1),
+    ('gz', 'application/gzip', 0.1)
+]
+# Objects of --unscannable-ratio, which the default scan exclusion rules exclude
+UNSCANNABLE_EXTENSION = ('mp4', 'video/mp4')
+MAX_OBJECT_BYTES = 5 * 1024 ** 4
+
+class LambdaContext:
+    def __init__(self, function_name, timeout_seconds):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.memory_limit_in_mb = 128
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+class StageStats:
+    def __init__(self):
+        self.invocations = 0
+        self.seconds = 0.0
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.peak_bytes = 0
+
+def object_sizes(count, distribution, mean_size, rng):
+    if distribution == 'fixed':
+        sizes = (mean_size for _ in range(count))
+    elif distribution == 'uniform':
+        sizes = (rng.randint(0, 2 * mean_size) for _ in range(count))
+    else:
+        # A long tail of large objects with the requested mean
+        sigma = 1.5
+        mu = math.log(max(1, mean_size)) - sigma ** 2 / 2
+        sizes = (int(rng.lognormvariate(mu, sigma)) for _ in range(count))
+    return [min(size, MAX_OBJECT_BYTES) for size in sizes]
+
+def load_batch_shape(path):
+    # A timeline written by writeExecutionTimeline or its batchShape alone
+    with open(path) as shape_file:
+        shape = json.load(shape_file)
+    return shape.get('batchShape', shape)
+
+def shape_sizes(shape, count, rng):
+    '''
+    Object sizes drawn from the power of two histogram of a batch shape (see
+    pipeline_common.timeline.batch_shape), uniformly within each bucket.
+    '''
+    bounds = [int(bound) for bound in shape['sizeHistogram']]
+    weights = list(shape['sizeHistogram'].values())
+    sizes = []
+    for bound in rng.choices(bounds, weights, k = count):
+        sizes.append(bound if bound <= 1 else rng.randint(bound // 2 + 1, bound))
+    return sizes
+
+def upload_objects(stand_ins, args, rng):
+    '''
+    Put the generated objects in the raw bucket and return them as S3 event
+    notification records.
+    '''
+    extensions = [(extension, content_type) for extension, content_type, _ in EXTENSIONS]
+    weights = [share for _, _, share in EXTENSIONS]
+    if args.batch_shape:
+        sizes = shape_sizes(args.batch_shape, args.objects, rng)
+        content_types = dict(extensions)
+        extensions = [
+            (extension, content_types.get(extension, 'application/octet-stream'))
+            for extension in args.batch_shape['extensions']
+        ]
+        weights = list(args.batch_shape['extensions'].values())
+    else:
+        sizes = object_sizes(args.objects, args.size_distribution, args.mean_size, rng)
+    records = []
+    for number, size in enumerate(sizes):
+        extension, content_type = rng.choices(extensions, weights)[0]
+        sensitive = rng.random() < args.findings_ratio
+        if rng.random() < args.unscannable_ratio:
+            extension, content_type = UNSCANNABLE_EXTENSION
+            sensitive = False
+        key = f'ingest/{number % 100:02d}/object-{number:07d}' + (
+            f'.{extension}' if extension else '')
+        stand_ins.s3.add_object(
+            BUCKETS['raw'],
+            key,
+            size,
+            sensitive = sensitive,
+            content_type = content_type,
+            seed = number,
+            checksum = True
+        )
+        s3_object = stand_ins.s3.bucket(BUCKETS['raw']).objects[key]
+        records.append({
+            'eventName': 'ObjectCreated:Put',
+            's3': {
+                'bucket': {'name': BUCKETS['raw']},
+                'object': {
+                    'key': key.replace(' ', '+'),
+                    'size': size,
+                    'eTag': s3_object.etag.strip('"')
+                }
+            }
+        })
+
+    return records
+
+def write_inventory_report(stand_ins):
+    '''
+    Write a CSV S3 Inventory report of the raw bucket to the manifest bucket,
+    laid out as S3 writes it for the inventory configuration in template.yaml.
+    '''
+    from stand_ins import S3Object
+
+    def put(key, body):
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        stand_ins.s3.bucket(BUCKETS['manifest']).put(key, S3Object(body, len(body), etag))
+
+    rows = io.StringIO()
+    writer = csv.writer(rows, quoting = csv.QUOTE_ALL)
+    for key, s3_object in sorted(stand_ins.s3.objects(BUCKETS['raw']).items()):
+        writer.writerow([
+            BUCKETS['raw'], quote_plus(key, safe = '/'), s3_object.size, s3_object.etag.strip('"'),
+            'SHA256' if s3_object.checksum_sha256 else ''])
+    data_key = f"{INVENTORY_PREFIX}/data/{uuid.uuid4()}.csv.gz"
+    put(data_key, gzip.compress(rows.getvalue().encode('utf-8')))
+
+    report_prefix = f'{INVENTORY_PREFIX}/2026-01-01T01-00Z'
+    manifest = json.dumps({
+        'sourceBucket': BUCKETS['raw'],
+        'destinationBucket': f"arn:aws:s3:::{BUCKETS['manifest']}",
+        'fileFormat': 'CSV',
+        'fileSchema': 'Bucket, Key, Size, ETag, ChecksumAlgorithm',
+        'files': [{'key': data_key}]
+    }).encode('utf-8')
+    put(f'{report_prefix}/manifest.json', manifest)
+    put(f'{report_prefix}/manifest.checksum', hashlib.md5(manifest).hexdigest().encode('utf-8'))
+
+class PipelineRuntime:
+    '''
+    Runs the pipeline functions for the local state machine, completes task
+    tokens the way the reviewer and the Macie job status events would, and
+    records the statistics of every measured stage.
+    '''
+    def __init__(self, stand_ins, lambda_timeout, approval, trace_memory,
+            environment=FUNCTION_ENVIRONMENT):
+        self.stand_ins = stand_ins
+        self.environment = environment
+        self.lambda_timeout = lambda_timeout
+        self.approval = approval
+        self.trace_memory = trace_memory
+        self.modules = {}
+        self.stages = OrderedDict()
+        self.waited_seconds = 0
+        self.review = None
+        self.resolvers = {
+            'RegisterMacieJobWait': self._deliver_job_events,
+            'TriggerManualApproval': self._review
+        }
+
+    def _module(self, function_name):
+        if function_name not in self.modules:
+            function_dir, module_name = FUNCTIONS[function_name]
+            sys.path.insert(0, os.path.join(ROOT, 'functions', function_dir))
+            self.modules[function_name] = importlib.import_module(module_name)
+        return self.modules[function_name]
+
+    def invoke(self, function_name, payload):
+        from local_state_machine import TaskFailed
+
+        module = self._module(function_name)
+        os.environ.update(self.environment.get(function_name, {}))
+        event = json.loads(json.dumps(payload))
+        try:
+            result = module.lambda_handler(
+                event, LambdaContext(function_name, self.lambda_timeout))
+        except Exception as e:
+            # An unhandled error fails the task with the exception name
+            raise TaskFailed(type(e).__name__, str(e))
+
+        return json.loads(json.dumps(result, default = str))
+
+    def new_task_token(self):
+        return self.stand_ins.stepfunctions.new_task_token()
+
+    def await_task(self, function_name, task_token, timeout_seconds):
+        from local_state_machine import TaskFailed
+
+        stepfunctions = self.stand_ins.stepfunctions
+        if stepfunctions.tasks[task_token]['status'] == 'PENDING':
+            resolver = self.resolvers.get(function_name)
+            if resolver:
+                resolver(task_token)
+
+        task = stepfunctions.close_task(task_token)
+        if task['status'] == 'SUCCEEDED':
+            return task['output']
+        if task['status'] == 'FAILED':
+            raise TaskFailed(task.get('error') or 'States.TaskFailed', task.get('cause'))
+
+        self.wait(timeout_seconds)
+        raise TaskFailed('States.Timeout', f'{function_name} task timed out')
+
+    def _deliver_job_events(self, task_token):
+        # Macie logs the job status once the job finishes
+        macie = self.stand_ins.macie
+        stepfunctions = self.stand_ins.stepfunctions
+        while stepfunctions.tasks[task_token]['status'] == 'PENDING':
+            completes_at = macie.next_completion()
+            if completes_at is None:
+                return
+            self.wait(completes_at - self.stand_ins.clock.now())
+            log_events = [
+                {'message': json.dumps(job_event)}
+                for job_event in macie.job_status_events()
+            ]
+            data = base64.b64encode(gzip.compress(json.dumps(
+                {'logEvents': log_events}).encode('utf-8'))).decode('utf-8')
+            self.invoke('ResumeMacieJobWait', {'awslogs': {'data': data}})
+
+    def _review(self, task_token):
+        # The reviewer follows the links of the approval notification. A
+        # partial review approves the files under PARTIAL_APPROVAL_PREFIX and
+        # denies the rest once the state machine waits again.
+        for message in self.stand_ins.sns.messages:
+            if task_token in message['Message']:
+                link = message['Message'].split('?', 1)[1].split('\n', 1)[0]
+                self.review = dict(parse_qsl(link), rounds = 0)
+        if self.review is None:
+            return
+
+        if self.approval == 'partial' and self.review['rounds'] == 0:
+            path, parameters = '/allow', {'prefix': PARTIAL_APPROVAL_PREFIX}
+        elif self.approval == 'partial' and self.review['rounds'] == 1:
+            path, parameters = '/deny', {}
+        elif self.review['rounds'] == 0:
+            path, parameters = f'/{self.approval}', {}
+        else:
+            return
+        self.review['rounds'] += 1
+        parameters.update(token = self.review['token'], id = self.review['id'])
+
+        self.invoke('ReceiveApprovalDecisionAPI', {
+            'requestContext': {'resourcePath': path},
+            'queryStringParameters': parameters,
+            'multiValueQueryStringParameters': {
+                name: [value] for name, value in parameters.items()
+            }
+        })
+
+    def wait(self, seconds):
+        self.stand_ins.clock.advance(seconds)
+        self.waited_seconds += max(0, seconds)
+
+    def now(self):
+        return self.stand_ins.clock.now()
+
+    def write_timeline(self, name, result, history):
+        '''
+        Invoke writeExecutionTimeline with the status change event of an
+        execution the way EventBridge would and return the timeline.
+        '''
+        execution_arn = f'{EXECUTION_ARN_PREFIX}:{name}'
+        stepfunctions = self.stand_ins.stepfunctions
+        stepfunctions.record_history(execution_arn, history)
+        # On the real clock, like the history returned by the stand-in
+        real_time = lambda timestamp: int(
+            self.stand_ins.clock.real_datetime(timestamp).timestamp() * 1000)
+        with self.measure('writeExecutionTimeline'):
+            written = self.invoke('WriteExecutionTimeline', {
+                'source': 'aws.states',
+                'detail-type': 'Step Functions Execution Status Change',
+                'detail': {
+                    'executionArn': execution_arn,
+                    'stateMachineArn': STATE_MACHINE_ARN,
+                    'name': name,
+                    'status': result['status'],
+                    'startDate': real_time(result['startDate']),
+                    'stopDate': real_time(result['stopDate']),
+                    'input': history[0]['executionStartedEventDetails']['input']
+                }
+            })
+        if not written:
+            return None
+
+        timeline = self.stand_ins.s3.bucket(BUCKETS['manifest']).objects[written['timelineKey']]
+        return json.loads(timeline.body)
+
+    @contextmanager
+    def measure(self, stage_name):
+        stage = self.stages.setdefault(stage_name, StageStats())
+        calls, throttled = self.stand_ins.stats.snapshot()
+        if self.trace_memory:
+            baseline = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage.seconds += time.perf_counter() - started
+            stage.invocations += 1
+            calls_after, throttled_after = self.stand_ins.stats.snapshot()
+            stage.calls.update(calls_after - calls)
+            stage.throttled.update(throttled_after - throttled)
+            if self.trace_memory:
+                stage.peak_bytes = max(
+                    stage.peak_bytes, tracemalloc.get_traced_memory()[1] - baseline)
+
+def parse_service_values(values, value_type):
+    parsed = {}
+    for value in values or []:
+        service_name, _, number = value.partition('=')
+        if service_name not in SERVICES:
+            raise argparse.ArgumentTypeError(f'unknown service {service_name}')
+        parsed[service_name] = value_type(number)
+    return parsed
+
+def sqs_batches(records, batch_size):
+    for start in range(0, len(records), batch_size):
+        yield {
+            'Records': [
+                {
+                    'messageId': str(uuid.uuid4()),
+                    'body': json.dumps({'Records': [record]})
+                }
+                for record in records[start:start + batch_size]
+            ]
+        }
+
+def run(args):
+    sys.path[:0] = [LAYER_PATH, os.path.dirname(os.path.abspath(__file__))]
+    os.environ.update(COMMON_ENVIRONMENT)
+    os.environ['jobWaitMode'] = args.wait_mode
+    if args.batch_operations_threshold:
+        # Read when pipeline_common.batch_operations is first imported
+        os.environ['batchOperationsThreshold'] = str(args.batch_operations_threshold)
+        os.environ['batchOperationsRoleArn'] = (
+            f'arn:aws:iam::{ACCOUNT_ID}:role/benchmark-batch-operations')
+    if args.listing_concurrency:
+        # Read when pipeline_common.listing is first imported
+        os.environ['listingConcurrency'] = str(args.listing_concurrency)
+    if args.inventory:
+        os.environ['inventoryS3Bucket'] = BUCKETS['manifest']
+        os.environ['inventoryPrefix'] = INVENTORY_PREFIX
+    if args.scan_cache == 'sqlite':
+        os.environ['scanCacheBackend'] = 'sqlite'
+        os.environ['scanCachePath'] = os.path.join(
+            tempfile.mkdtemp(), 'scan-cache.sqlite')
+    if args.pre_classifier:
+        os.environ['preClassifier'] = 'true'
+    if args.disposition_policy:
+        # Read when pipeline_common.disposition is first imported
+        os.environ['dispositionPolicy'] = args.disposition_policy
+    if args.batch_shape:
+        args.batch_shape = load_batch_shape(args.batch_shape)
+        if args.objects is None:
+            args.objects = args.batch_shape['objects']
+    if args.objects is None:
+        args.objects = 1000
+    if args.timelines:
+        os.makedirs(args.timelines, exist_ok = True)
+    if args.claims == 'sqlite':
+        os.environ['claimBackend'] = 'sqlite'
+        os.environ['claimPath'] = os.path.join(tempfile.mkdtemp(), 'claims.sqlite')
+
+    from local_state_machine import LocalStateMachine
+    from stand_ins import AwsStandIns, install
+
+    stand_ins = AwsStandIns(
+        latency_ms = parse_service_values(args.latency_ms, float),
+        throttle_rate = parse_service_values(args.throttle_rate, float),
+        job_seconds = args.macie_job_seconds,
+        seed = args.seed
+    )
+    install(stand_ins)
+    rng = random.Random(args.seed)
+    records = upload_objects(stand_ins, args, rng)
+    if args.inventory:
+        write_inventory_report(stand_ins)
+    total_bytes = sum(record['s3']['object']['size'] for record in records)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    runtime = PipelineRuntime(
+        stand_ins, args.lambda_timeout, args.approval, args.trace_memory,
+        layout_environment(args.bucket_layout, args.handoff))
+    with open(STATE_MACHINE_PATH) as definition_file:
+        definition = json.load(definition_file)
+
+    started = time.perf_counter()
+    if args.trigger == 'events':
+        for sqs_event in sqs_batches(records, args.sqs_batch_size):
+            with runtime.measure('batchRawObjectEvents'):
+                runtime.invoke('BatchRawObjectEvents', sqs_event)
+        executions = [
+            (execution['name'], execution['input'])
+            for execution in stand_ins.stepfunctions.executions
+        ]
+    else:
+        workflow_id = str(uuid.uuid4())
+        executions = [(workflow_id, {
+            'id': workflow_id,
+            'detail-type': 'Scheduled Event',
+            'source': 'aws.events'
+        })]
+
+    state_bytes = Counter()
+    results = []
+    timelines = []
+    for name, execution_input in executions:
+        state_machine = LocalStateMachine(definition, runtime)
+        result = state_machine.execute(execution_input, name)
+        results.append(dict(result, name = name))
+        timeline = runtime.write_timeline(name, result, state_machine.history)
+        if timeline:
+            timelines.append(timeline)
+            if args.timelines:
+                with open(os.path.join(args.timelines, f'{name}.json'), 'w') as timeline_file:
+                    json.dump(timeline, timeline_file, indent = 1)
+        for state_name, size in state_machine.state_bytes.items():
+            state_bytes[state_name] = max(state_bytes[state_name], size)
+    elapsed = time.perf_counter() - started
+
+    calls, throttled = stand_ins.stats.snapshot()
+    return {
+        'parameters': {
+            name: value for name, value in vars(args).items()
+            if name not in ('json', 'batch_shape')
+        },
+        'objects': args.objects,
+        'bytes': total_bytes,
+        'seconds': elapsed,
+        'objectsPerSecond': args.objects / elapsed if elapsed else None,
+        'simulatedWaitSeconds': runtime.waited_seconds,
+        'executions': [
+            {
+                'name': result['name'],
+                'status': result['status'],
+                'error': result.get('error'),
+                'cause': result.get('cause'),
+                'transitions': result['transitions']
+            }
+            for result in results
+        ],
+        'stages': OrderedDict(
+            (stage_name, {
+                'invocations': stage.invocations,
+                'seconds': stage.seconds,
+                'objectsPerSecond': args.objects / stage.seconds if stage.seconds else None,
+                'apiCalls': dict(stage.calls),
+                'throttled': dict(stage.throttled),
+                'peakMemoryBytes': stage.peak_bytes if args.trace_memory else None,
+                'maxStateBytes': state_bytes.get(stage_name)
+            })
+            for stage_name, stage in runtime.stages.items()
+        ),
+        'apiCalls': dict(calls),
+        'throttled': dict(throttled),
+        'macieJobs': {
+            'count': len(stand_ins.macie.jobs),
+            'objects': sum(job['objectCount'] for job in stand_ins.macie.jobs.values()),
+            'bytes': sum(job['objectBytes'] for job in stand_ins.macie.jobs.values())
+        },
+        'buckets': {
+            name: len(stand_ins.s3.objects(bucket_name))
+            for name, bucket_name in BUCKETS.items()
+        },
+        # PipelineState tags of the raw bucket objects (single bucket layout)
+        'pipelineStates': dict(Counter(
+            s3_object.tags.get('PipelineState', 'raw')
+            for s3_object in stand_ins.s3.objects(BUCKETS['raw']).values()
+        )),
+        # Written by writeExecutionTimeline, see pipeline_timelines.py
+        'timelines': timelines
+    }
+
+def print_report(report):
+    print(f"{report['objects']} objects, {report['bytes'] / 1024 ** 2:.1f} MiB, "
+        f"{len(report['executions'])} executions in {report['seconds']:.2f} s "
+        f"({report['objectsPerSecond']:.0f} objects/s), "
+        f"{report['simulatedWaitSeconds']:.0f} s of simulated waits")
+    print()
+    print(f"{'stage':42} {'runs':>5} {'seconds':>8} {'obj/s':>9} "
+        f"{'calls':>7} {'throttled':>9} {'peak MiB':>9} {'state KB':>9}")
+    for stage_name, stage in report['stages'].items():
+        peak = stage['peakMemoryBytes']
+        state = stage['maxStateBytes']
+        print(f"{stage_name:42} {stage['invocations']:5d} {stage['seconds']:8.2f} "
+            f"{stage['objectsPerSecond'] or 0:9.0f} {sum(stage['apiCalls'].values()):7d} "
+            f"{sum(stage['throttled'].values()):9d} "
+            f"{'-' if peak is None else format(peak / 1024 ** 2, '.1f'):>9} "
+            f"{'-' if state is None else format(state / 1024, '.1f'):>9}")
+    print()
+    print(f"{'API operation':42} {'calls':>7} {'throttled':>9}")
+    for name, count in sorted(report['apiCalls'].items(), key = lambda item: -item[1]):
+        print(f"{name:42} {count:7d} {report['throttled'].get(name, 0):9d}")
+    print()
+    print('objects per bucket: ' + ', '.join(
+        f'{name} {count}' for name, count in report['buckets'].items()))
+    print(f"macie jobs: {report['macieJobs']['count']}, scanned {report['macieJobs']['objects']} "
+        f"objects, {report['macieJobs']['bytes'] / 1024 ** 2:.1f} MiB")
+    phases = Counter()
+    for timeline in report['timelines']:
+        phases.update(timeline['phases'])
+    print('execution seconds per phase, simulated waits included: ' + ', '.join(
+        f'{phase} {seconds:.0f}' for phase, seconds in phases.items()))
+    if report['parameters']['bucket_layout'] == 'single':
+        print('raw bucket objects per pipeline state: ' + ', '.join(
+            f'{state} {count}' for state, count in sorted(report['pipelineStates'].items())))
+    for execution in report['executions']:
+        if execution['status'] != 'SUCCEEDED':
+            print(f"execution {execution['name']} FAILED: "
+                f"{execution['error']}: {execution['cause']}")
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type = int,
+        help = 'number of objects (default: 1000, or those of --batch-shape)')
+    parser.add_argument('--size-distribution', default = 'lognormal',
+        choices = ['fixed', 'uniform', 'lognormal'])
+    parser.add_argument('--mean-size', type = int, default = 1024 ** 2,
+        help = 'mean object size in bytes')
+    parser.add_argument('--batch-shape', metavar = 'TIMELINE',
+        help = 'draw the object sizes and file types from the batch shape of '
+            'an execution timeline instead')
+    parser.add_argument('--findings-ratio', type = float, default = 0.05,
+        help = 'share of the objects with sensitive data')
+    parser.add_argument('--unscannable-ratio', type = float, default = 0.0,
+        help = 'share of objects in a format the scan exclusion rules exclude')
+    parser.add_argument('--approval', default = 'allow', choices = ['allow', 'deny', 'partial'],
+        help = 'partial approves the files under one prefix and denies the rest')
+    parser.add_argument('--trigger', default = 'schedule', choices = ['schedule', 'events'])
+    parser.add_argument('--sqs-batch-size', type = int, default = 1000,
+        help = 'S3 event messages per batchRawObjectEvents invocation')
+    parser.add_argument('--wait-mode', default = 'poll', choices = ['poll', 'event'])
+    parser.add_argument('--bucket-layout', default = 'separate',
+        choices = ['separate', 'single'])
+    parser.add_argument('--handoff', default = 'tag', choices = ['tag', 'copy'],
+        help = 'hand-off of scanned objects in the single bucket layout')
+    parser.add_argument('--batch-operations-threshold', type = int, default = 0,
+        help = 'move batches of at least this many objects with S3 Batch '
+            'Operations jobs (default: never)')
+    parser.add_argument('--listing-concurrency', type = int, default = 0,
+        help = 'concurrent listing requests of the raw bucket (default: as deployed)')
+    parser.add_argument('--inventory', action = 'store_true',
+        help = 'stage the objects of an S3 Inventory report of the raw bucket')
+    parser.add_argument('--scan-cache', default = 'none', choices = ['none', 'sqlite'])
+    parser.add_argument('--pre-classifier', action = 'store_true',
+        help = 'clear small clean text objects without a Macie job')
+    parser.add_argument('--disposition-policy', metavar = 'JSON',
+        help = 'rules allowing or denying keys with findings without a manual review')
+    parser.add_argument('--claims', default = 'none', choices = ['none', 'sqlite'],
+        help = 'claim the raw objects before staging them')
+    parser.add_argument('--lambda-timeout', type = float, default = 10,
+        help = 'function timeout in seconds, as in template.yaml')
+    parser.add_argument('--macie-job-seconds', type = float,
+        help = 'fixed Macie job duration instead of the expected duration')
+    parser.add_argument('--latency-ms', action = 'append', metavar = 'SERVICE=MS',
+        help = 'latency added to every call to a service')
+    parser.add_argument('--throttle-rate', action = 'append', metavar = 'SERVICE=RATE',
+        help = 'probability that a call to a service is throttled')
+    parser.add_argument('--no-memory', dest = 'trace_memory', action = 'store_false',
+        help = 'do not trace memory, which slows the functions down')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--json', help = 'write the report to this file')
+    parser.add_argument('--timelines', metavar = 'DIR',
+        help = 'write the timeline of every execution to this directory')
+    parser.add_argument('--verbose', action = 'store_true',
+        help = 'show the output of the functions')
+    args = parser.parse_args()
+
+    function_output = io.StringIO()
+    if args.verbose:
+        report = run(args)
+    else:
+        # The functions print their errors, keep them for failed runs
+        with redirect_stdout(function_output):
+            report = run(args)
+
+    print_report(report)
+    failed = any(
+        execution['status'] != 'SUCCEEDED' for execution in report['executions'])
+    if failed and not args.verbose:
+        print()
+        print('last function output:')
+        print('\n'.join(function_output.getvalue().splitlines()[-20:]))
+
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(report, report_file, indent = 2, default = str)
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import argparse
+import glob
+import json
+import math
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+from collections import OrderedDict
+
+'''
+Report and replay of the execution timelines written by
+writeExecutionTimeline (see pipeline_common.timeline).
+
+report aggregates timelines into the p50, p90, p99 and maximum seconds of
+each phase and state and the objects and bytes per second of the
+executions. Timelines are read from JSON files, directories of JSON files,
+the --json reports of pipeline_throughput.py or s3://bucket/prefix (with
+boto3 and credentials).
+
+replay runs pipeline_throughput.py with the batch shape of a recorded
+timeline, its number of objects and the object sizes and file types, once
+per --config with the given pipeline_throughput.py options, and compares
+the timelines of the runs with the recorded one. Macie jobs and waits are
+simulated, so replays compare configurations with each other rather than
+with the recorded execution.
+
+Usage:
+    python benchmarks/pipeline_timelines.py report PATH [PATH ...]
+        [--json report.json]
+    python benchmarks/pipeline_timelines.py replay TIMELINE
+        [--config '--wait-mode event'] [--config ...] [--objects 1000]
+        [--runs 1] [--json report.json]
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THROUGHPUT_PATH = os.path.join(ROOT, 'benchmarks', 'pipeline_throughput.py')
+
+PERCENTILES = [50, 90, 99]
+
+def percentile(values, rank):
+    # Nearest rank
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(rank / 100 * len(ordered)) - 1)]
+
+def distribution(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    summary = OrderedDict((f'p{rank}', percentile(values, rank)) for rank in PERCENTILES)
+    summary['max'] = max(values)
+    summary['count'] = len(values)
+    return summary
+
+def _timelines_of(document):
+    # A timeline or a pipeline_throughput.py report with its timelines
+    if 'timelines' in document:
+        return document['timelines']
+    if 'execution' in document and 'phases' in document:
+        return [document]
+    return []
+
+def _s3_timelines(url):
+    import boto3
+
+    bucket_name, _, prefix = url[len('s3://'):].partition('/')
+    s3_client = boto3.client('s3')
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket = bucket_name, Prefix = prefix):
+        for key_data in page.get('Contents', []):
+            if key_data['Key'].endswith('.json'):
+                body = s3_client.get_object(Bucket = bucket_name, Key = key_data['Key'])['Body']
+                yield from _timelines_of(json.load(body))
+
+def load_timelines(paths):
+    for path in paths:
+        if path.startswith('s3://'):
+            yield from _s3_timelines(path)
+            continue
+        if os.path.isdir(path):
+            file_paths = sorted(glob.glob(os.path.join(path, '*.json')))
+        else:
+            file_paths = [path]
+        for file_path in file_paths:
+            with open(file_path) as timeline_file:
+                yield from _timelines_of(json.load(timeline_file))
+
+def aggregate(timelines):
+    '''
+    Distributions of the execution, phase and state seconds and of the
+    throughput of a set of timelines.
+    '''
+    phase_names = []
+    stage_names = []
+    statuses = OrderedDict()
+    for timeline in timelines:
+        status = timeline['execution']['status']
+        statuses[status] = statuses.get(status, 0) + 1
+        phase_names.extend(name for name in timeline['phases'] if name not in phase_names)
+        stage_names.extend(name for name in timeline['stages'] if name not in stage_names)
+
+    api_calls = OrderedDict()
+    for timeline in timelines:
+        for name, count in timeline.get('apiCalls', {}).items():
+            api_calls.setdefault(name, []).append(count)
+
+    return OrderedDict([
+        ('executions', len(timelines)),
+        ('statuses', statuses),
+        ('seconds', distribution(
+            [timeline['execution']['seconds'] for timeline in timelines])),
+        ('objects', distribution(
+            [timeline['counts'].get('stagedCount') for timeline in timelines])),
+        ('objectsPerSecond', distribution(
+            [timeline['throughput']['objectsPerSecond'] for timeline in timelines])),
+        ('bytesPerSecond', distribution(
+            [timeline['throughput']['bytesPerSecond'] for timeline in timelines])),
+        ('phases', OrderedDict(
+            (name, distribution([timeline['phases'].get(name, 0) for timeline in timelines]))
+            for name in phase_names
+        )),
+        ('stages', OrderedDict(
+            (name, distribution([
+                timeline['stages'][name]['seconds'] for timeline in timelines
+                if name in timeline['stages']
+            ]))
+            for name in stage_names
+        )),
+        ('macieQueueSeconds', distribution(
+            [timeline['macie'].get('queueSeconds') for timeline in timelines])),
+        ('macieRunToDoneSeconds', distribution(
+            [timeline['macie'].get('runToDoneSeconds') for timeline in timelines])),
+        ('apiCalls', OrderedDict(
+            (name, distribution(counts)) for name, counts in sorted(
+                api_calls.items(), key = lambda item: -sum(item[1]))
+        ))
+    ])
+
+def _row(name, summary, scale=1.0, digits=1):
+    if summary is None:
+        return f'{name:42} ' + ' '.join(f"{'-':>10}" for _ in range(len(PERCENTILES) + 1))
+    return f'{name:42} ' + ' '.join(
+        f'{summary[column] * scale:10.{digits}f}'
+        for column in [f'p{rank}' for rank in PERCENTILES] + ['max'])
+
+def print_aggregate(report):
+    print(f"{report['executions']} executions: " + ', '.join(
+        f'{status} {count}' for status, count in report['statuses'].items()))
+    print()
+    columns = ' '.join(
+        f'{column:>10}' for column in [f'p{rank}' for rank in PERCENTILES] + ['max'])
+    print(f"{'':42} {columns}")
+    print(_row('execution seconds', report['seconds']))
+    print(_row('objects', report['objects'], digits = 0))
+    print(_row('objects per second', report['objectsPerSecond'], digits = 2))
+    print(_row('MiB per second', report['bytesPerSecond'], 1 / 1024 ** 2, 2))
+    print(_row('Macie queue seconds', report['macieQueueSeconds']))
+    print(_row('Macie run to done seconds', report['macieRunToDoneSeconds']))
+    print()
+    print(f"{'phase seconds':42} {columns}")
+    for name, summary in report['phases'].items():
+        print(_row(name, summary))
+    print()
+    print(f"{'state seconds':42} {columns}")
+    for name, summary in report['stages'].items():
+        # Choice and other states that take no time are only in the JSON report
+        if summary['max'] >= 0.005:
+            print(_row(name, summary, digits = 2))
+    if report['apiCalls']:
+        print()
+        print(f"{'API calls per execution':42} {columns}")
+        for name, summary in report['apiCalls'].items():
+            print(_row(name, summary, digits = 0))
+
+def command_report(args):
+    timelines = list(load_timelines(args.paths))
+    if not timelines:
+        print('no timelines found')
+        return 1
+
+    report = aggregate(timelines)
+    print_aggregate(report)
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(report, report_file, indent = 2)
+    return 0
+
+def replay_config(shape_path, config, args, work_dir):
+    '''
+    Run pipeline_throughput.py args.runs times with the batch shape and the
+    options of config. Returns the timelines of the runs, or None when a
+    run failed.
+    '''
+    timelines = []
+    for run in range(args.runs):
+        report_path = os.path.join(work_dir, f'report-{run}.json')
+        command = [
+            sys.executable, THROUGHPUT_PATH,
+            '--batch-shape', shape_path,
+            '--no-memory',
+            '--seed', str(run),
+            '--json', report_path
+        ] + (['--objects', str(args.objects)] if args.objects else []) + shlex.split(config)
+        completed = subprocess.run(command, stdout = subprocess.PIPE,
+            stderr = subprocess.STDOUT, universal_newlines = True)
+        if completed.returncode != 0:
+            print(f"config '{config}' failed:")
+            print('\n'.join(completed.stdout.splitlines()[-20:]))
+            return None
+        with open(report_path) as report_file:
+            timelines.extend(json.load(report_file)['timelines'])
+
+    return timelines
+
+def command_replay(args):
+    with open(args.timeline) as timeline_file:
+        recorded = json.load(timeline_file)
+    if 'batchShape' not in recorded:
+        print(f'{args.timeline} has no batch shape to replay')
+        return 1
+    shape = recorded['batchShape']
+    print(f"replaying {args.objects or shape['objects']} objects of "
+        f"{shape['objects']} objects, {shape['bytes'] / 1024 ** 2:.1f} MiB "
+        f"recorded by {recorded['execution']['name']}")
+
+    results = OrderedDict([('recorded', aggregate([recorded]))])
+    failed = False
+    for number, config in enumerate(args.config or ['']):
+        with tempfile.TemporaryDirectory() as work_dir:
+            timelines = replay_config(args.timeline, config, args, work_dir)
+        if timelines is None:
+            failed = True
+            continue
+        results[config or 'default'] = aggregate(timelines)
+
+    columns = list(results)
+    width = max([12] + [len(column) for column in columns])
+    print()
+    print(f"{'p50':30} " + ' '.join(f'{column:>{width}}' for column in columns))
+    rows = [('execution', lambda report: report['seconds'])]
+    phase_names = []
+    for report in results.values():
+        phase_names.extend(name for name in report['phases'] if name not in phase_names)
+    rows.extend(
+        (name, lambda report, name=name: report['phases'].get(name)) for name in phase_names)
+    rows.append(('objects per second', lambda report: report['objectsPerSecond']))
+    for name, value in rows:
+        cells = []
+        for report in results.values():
+            summary = value(report)
+            cells.append(f"{summary['p50']:{width}.2f}" if summary else f"{'-':>{width}}")
+        print(f'{name:30} ' + ' '.join(cells))
+    print()
+    print(f"{'API calls':30} " + ' '.join(
+        f"{sum(summary['p50'] for summary in report['apiCalls'].values()):{width}.0f}"
+        for report in results.values()))
+
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(results, report_file, indent = 2)
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest = 'command')
+    commands.required = True
+
+    report = commands.add_parser('report', help = 'percentiles of a set of timelines')
+    report.add_argument('paths', nargs = '+', metavar = 'PATH',
+        help = 'timeline, directory, pipeline_throughput.py report or s3://bucket/prefix')
+    report.add_argument('--json', help = 'write the report to this file')
+    report.set_defaults(handler = command_report)
+
+    replay = commands.add_parser('replay',
+        help = 'replay the batch shape of a timeline on the local stand-ins')
+    replay.add_argument('timeline')
+    replay.add_argument('--config', action = 'append', metavar = 'OPTIONS',
+        help = 'pipeline_throughput.py options of one configuration, repeatable '
+            '(default: one run with the default options)')
+    replay.add_argument('--objects', type = int,
+        help = 'replay this many objects instead of those recorded')
+    replay.add_argument('--runs', type = int, default = 1,
+        help = 'runs per configuration, with different seeds')
+    replay.add_argument('--json', help = 'write the comparison to this file')
+    replay.set_defaults(handler = command_replay)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1227 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import base64
+import bisect
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import parse_qsl, unquote_plus
+from botocore.exceptions import ClientError
+
+'''
+In-process stand-ins for the AWS services used by the pipeline functions.
+
+The stand-ins implement the subset of the S3, S3 Control, Macie, SNS and Step
+Functions client APIs that the functions call, keep their state in memory and count
+every call per service and operation. Each call can be delayed by a fixed
+latency and throttled with a given probability; a throttled call is retried
+with exponential backoff as the SDK does and only fails once max_attempts
+attempts in a row were throttled.
+
+Time spent waiting on Macie is simulated: a VirtualClock moves forward when
+the state machine waits, and a classification job completes once the clock
+passes its expected duration. S3 Batch Operations jobs complete the same
+way. install() puts the stand-ins in the client
+cache of pipeline_common.clients, so the functions use them instead of boto3
+clients.
+'''
+
+MAX_COPY_OBJECT_BYTES = 5 * 1024 ** 3
+MAX_FINDING_IDS = 50
+
+THROTTLING_ERROR_CODES = {
+    's3': 'SlowDown',
+    'macie2': 'ThrottlingException',
+    'sns': 'Throttling',
+    'stepfunctions': 'ThrottlingException',
+    's3control': 'TooManyRequestsException'
+}
+
+FINDING_TYPES = [
+    'SensitiveData:S3Object/Personal',
+    'SensitiveData:S3Object/Financial',
+    'SensitiveData:S3Object/Credentials',
+    'SensitiveData:S3Object/Multiple'
+]
+SEVERITY_SCORES = {'Low': 1, 'Medium': 2, 'High': 3}
+
+def client_error(code, message, operation_name, status=400):
+    return ClientError(
+        {
+            'Error': {'Code': code, 'Message': message},
+            'ResponseMetadata': {'HTTPStatusCode': status}
+        },
+        operation_name
+    )
+
+def parse_range(byte_range, size):
+    first, last = byte_range.split('=', 1)[1].split('-', 1)
+    if not first:
+        return max(0, size - int(last)), size - 1
+    return int(first), min(int(last), size - 1) if last else size - 1
+
+def dotted_value(document, path):
+    for name in path.split('.'):
+        if not isinstance(document, dict) or name not in document:
+            return None
+        document = document[name]
+    return document
+
+def matches_criteria(finding, finding_criteria):
+    for field, condition in (finding_criteria or {}).get('criterion', {}).items():
+        value = dotted_value(finding, field)
+        for operator, operand in condition.items():
+            if operator in ('eq', 'eqExactMatch') and value not in operand:
+                return False
+            if operator == 'neq' and value in operand:
+                return False
+            if operator in ('gt', 'gte', 'lt', 'lte'):
+                if value is None:
+                    return False
+                if operator == 'gt' and not value > operand:
+                    return False
+                if operator == 'gte' and not value >= operand:
+                    return False
+                if operator == 'lt' and not value < operand:
+                    return False
+                if operator == 'lte' and not value <= operand:
+                    return False
+
+    return True
+
+class VirtualClock:
+    '''
+    Wall-clock time plus the time skipped by simulated waits.
+    '''
+    def __init__(self):
+        self.offset = 0.0
+        self.lock = threading.Lock()
+
+    def now(self):
+        return time.time() + self.offset
+
+    def advance(self, seconds):
+        with self.lock:
+            self.offset += max(0, seconds)
+
+    def real_datetime(self, virtual_time):
+        # The datetime that has the same age on the real clock
+        return datetime.datetime.fromtimestamp(
+            virtual_time - self.offset, datetime.timezone.utc)
+
+class ApiStats:
+    '''
+    Call and throttle counts of all stand-ins, keyed by 'service.Operation'.
+    '''
+    def __init__(self):
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, name, throttled=False):
+        with self.lock:
+            if throttled:
+                self.throttled[name] += 1
+            else:
+                self.calls[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.calls), Counter(self.throttled)
+
+def record_invocation_call(name, started, throttles, error=False):
+    # What the botocore hooks of pipeline_common.metrics record for a call,
+    # so the 'invocationMetrics' of the results count the stand-in calls
+    from pipeline_common import metrics
+
+    metrics._metrics.record_call(
+        name, (time.monotonic() - started) * 1000, throttles, throttles, error)
+
+class ServiceStandIn:
+    service_name = None
+
+    def __init__(self, stats, latency_ms=0, throttle_rate=0.0, max_attempts=5,
+            retry_base_ms=50, seed=None):
+        self.stats = stats
+        self.latency = latency_ms / 1000
+        self.throttle_rate = throttle_rate
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base_ms / 1000
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+
+    def _call(self, operation_name):
+        name = f'{self.service_name}.{operation_name}'
+        started = time.monotonic()
+        for attempt in range(self.max_attempts):
+            if self.latency:
+                time.sleep(self.latency)
+            with self.lock:
+                throttled = self.random.random() < self.throttle_rate
+                jitter = self.random.random()
+            if not throttled:
+                self.stats.record(name)
+                record_invocation_call(name, started, attempt)
+                return
+            self.stats.record(name, throttled = True)
+            if attempt + 1 < self.max_attempts:
+                time.sleep(jitter * self.retry_base * 2 ** attempt)
+
+        record_invocation_call(name, started, self.max_attempts, error = True)
+        raise client_error(
+            THROTTLING_ERROR_CODES[self.service_name],
+            'Rate exceeded',
+            operation_name,
+            503
+        )
+
+class StreamingBody(io.BytesIO):
+    def iter_chunks(self, chunk_size=1024):
+        return iter(lambda: self.read(chunk_size), b'')
+
+    def iter_lines(self, chunk_size=1024, keepends=False):
+        for line in self.read().splitlines(keepends):
+            yield line
+
+class SyntheticBody:
+    '''
+    Deterministic CSV content of a generated object, produced on read so
+    large objects take no memory. Rows have a fixed width, so a ranged read
+    starts at the right row. Every fourth row of a sensitive object holds a
+    sample name, email address and social security number.
+    '''
+    ROW_BYTES = 64
+
+    def __init__(self, seed, size, sensitive=False):
+        self.seed = seed
+        self.size = size
+        self.sensitive = sensitive
+
+    def _row(self, number):
+        if self.sensitive and number % 4 == 0:
+            row = (f'{number},Jane Doe,jane.doe{number % 100000}@example.com,'
+                f'123-45-{number % 10000:04d}')
+        else:
+            row = f'{number},item-{self.seed % 100000}-{number},{number * 7 % 97},units'
+        return row[:self.ROW_BYTES - 1].ljust(self.ROW_BYTES - 1).encode('utf-8') + b'\n'
+
+    def read(self, first=0, last=None):
+        last = self.size - 1 if last is None else min(last, self.size - 1)
+        if last < first:
+            return b''
+        first_row = first // self.ROW_BYTES
+        last_row = last // self.ROW_BYTES
+        rows = b''.join(self._row(number) for number in range(first_row, last_row + 1))
+        start = first - first_row * self.ROW_BYTES
+        return rows[start:start + last - first + 1]
+
+class S3Object:
+    __slots__ = ('body', 'size', 'etag', 'tags', 'content_type', 'metadata',
+        'last_modified', 'sensitive', 'checksum_sha256')
+
+    def __init__(self, body, size, etag, tags=None, content_type=None,
+            metadata=None, sensitive=False, checksum_sha256=None):
+        self.body = body
+        self.size = size
+        self.etag = etag
+        self.checksum_sha256 = checksum_sha256
+        self.tags = dict(tags or {})
+        self.content_type = content_type or 'binary/octet-stream'
+        self.metadata = dict(metadata or {})
+        self.last_modified = datetime.datetime.now(datetime.timezone.utc)
+        self.sensitive = sensitive
+
+    def read(self, first=0, last=None):
+        if isinstance(self.body, SyntheticBody):
+            return self.body.read(first, last)
+        last = self.size - 1 if last is None else last
+        return self.body[first:last + 1]
+
+    def copy(self, tags=None):
+        return S3Object(
+            self.body,
+            self.size,
+            self.etag,
+            self.tags if tags is None else tags,
+            self.content_type,
+            self.metadata,
+            self.sensitive,
+            self.checksum_sha256
+        )
+
+class S3Bucket:
+    '''
+    Objects of a bucket and a lazily sorted key list for listing. Deleted
+    keys stay in the list until it is next rebuilt.
+    '''
+    def __init__(self):
+        self.objects = {}
+        self._keys = []
+        self._unsorted = False
+
+    def put(self, key, s3_object):
+        if key not in self.objects:
+            if self._keys and key <= self._keys[-1]:
+                self._unsorted = True
+            self._keys.append(key)
+        self.objects[key] = s3_object
+
+    def delete(self, key):
+        return self.objects.pop(key, None) is not None
+
+    def sorted_keys(self):
+        if self._unsorted or len(self._keys) > 2 * len(self.objects) + 1000:
+            self._keys = sorted(self.objects)
+            self._unsorted = False
+        return self._keys
+
+class S3Paginator:
+    def __init__(self, operation):
+        self.operation = operation
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        if PaginationConfig and PaginationConfig.get('PageSize'):
+            kwargs['MaxKeys'] = PaginationConfig['PageSize']
+        while True:
+            page = self.operation(**kwargs)
+            yield page
+            if not page.get('IsTruncated'):
+                return
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+class S3StandIn(ServiceStandIn):
+    service_name = 's3'
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.buckets = {}
+        self.uploads = {}
+
+    def bucket(self, bucket_name):
+        with self.lock:
+            return self.buckets.setdefault(bucket_name, S3Bucket())
+
+    def add_object(self, bucket_name, key, size, sensitive=False, tags=None,
+            content_type=None, seed=0, checksum=False):
+        # Seed an object with synthetic content without counting an API call.
+        # With checksum, it has the SHA-256 checksum of an upload with one.
+        etag = '"%s"' % hashlib.md5(f'{key}:{size}:{seed}'.encode('utf-8')).hexdigest()
+        checksum_sha256 = None
+        if checksum:
+            # The synthetic content only depends on the seed, size and sensitivity
+            checksum_sha256 = base64.b64encode(hashlib.sha256(
+                f'{seed}:{size}:{sensitive}'.encode('utf-8')).digest()).decode('ascii')
+        with self.lock:
+            self.bucket(bucket_name).put(key, S3Object(
+                SyntheticBody(seed, size, sensitive),
+                size,
+                etag,
+                tags,
+                content_type,
+                sensitive = sensitive,
+                checksum_sha256 = checksum_sha256
+            ))
+
+    def objects(self, bucket_name):
+        with self.lock:
+            return dict(self.bucket(bucket_name).objects)
+
+    def _object(self, bucket_name, key, operation_name):
+        s3_object = self.bucket(bucket_name).objects.get(key)
+        if s3_object is None:
+            if operation_name == 'HeadObject':
+                raise client_error('404', 'Not Found', operation_name, 404)
+            raise client_error('NoSuchKey', 'The specified key does not exist.',
+                operation_name, 404)
+        return s3_object
+
+    def _source(self, copy_source, operation_name):
+        if isinstance(copy_source, str):
+            bucket_name, key = copy_source.lstrip('/').split('/', 1)
+        else:
+            bucket_name, key = copy_source['Bucket'], copy_source['Key']
+        return self._object(bucket_name, key, operation_name)
+
+    def get_paginator(self, operation_name):
+        return S3Paginator(getattr(self, operation_name))
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, MaxKeys=1000,
+            ContinuationToken=None, StartAfter=None, **kwargs):
+        self._call('ListObjectsV2')
+        start_key = ContinuationToken or StartAfter or ''
+        contents = []
+        common_prefixes = []
+        truncated = False
+        last_key = None
+
+        with self.lock:
+            bucket = self.bucket(Bucket)
+            keys = bucket.sorted_keys()
+            position = max(
+                bisect.bisect_right(keys, start_key) if start_key else 0,
+                bisect.bisect_left(keys, Prefix)
+            )
+            while position < len(keys):
+                key = keys[position]
+                if not key.startswith(Prefix):
+                    break
+                if key not in bucket.objects:
+                    position += 1
+                    continue
+                if len(contents) + len(common_prefixes) >= MaxKeys:
+                    truncated = True
+                    break
+
+                cut = key.find(Delimiter, len(Prefix)) if Delimiter else -1
+                if cut >= 0:
+                    common_prefix = key[:cut + len(Delimiter)]
+                    common_prefixes.append({'Prefix': common_prefix})
+                    # The token sorts after every key of the common prefix
+                    last_key = common_prefix + '\U0010ffff'
+                    position = bisect.bisect_right(keys, last_key)
+                    continue
+
+                s3_object = bucket.objects[key]
+                key_data = {
+                    'Key': key,
+                    'Size': s3_object.size,
+                    'ETag': s3_object.etag,
+                    'LastModified': s3_object.last_modified,
+                    'StorageClass': 'STANDARD'
+                }
+                if s3_object.checksum_sha256:
+                    key_data['ChecksumAlgorithm'] = ['SHA256']
+                contents.append(key_data)
+                last_key = key
+                position += 1
+
+        page = {
+            'IsTruncated': truncated,
+            'KeyCount': len(contents) + len(common_prefixes),
+            'MaxKeys': MaxKeys,
+            'Prefix': Prefix
+        }
+        if contents:
+            page['Contents'] = contents
+        if common_prefixes:
+            page['CommonPrefixes'] = common_prefixes
+        if truncated:
+            page['NextContinuationToken'] = last_key
+
+        return page
+
+    def head_object(self, Bucket, Key, ChecksumMode=None, **kwargs):
+        self._call('HeadObject')
+        with self.lock:
+            s3_object = self._object(Bucket, Key, 'HeadObject')
+
+        response = {
+            'ContentLength': s3_object.size,
+            'ContentType': s3_object.content_type,
+            'ETag': s3_object.etag,
+            'LastModified': s3_object.last_modified,
+            'Metadata': dict(s3_object.metadata)
+        }
+        if ChecksumMode == 'ENABLED' and s3_object.checksum_sha256:
+            response['ChecksumSHA256'] = s3_object.checksum_sha256
+
+        return response
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        self._call('GetObject')
+        with self.lock:
+            s3_object = self._object(Bucket, Key, 'GetObject')
+        if IfMatch and IfMatch.strip('"') != s3_object.etag.strip('"'):
+            raise client_error('PreconditionFailed',
+                'At least one of the pre-conditions you specified did not hold',
+                'GetObject', 412)
+
+        first, last = 0, s3_object.size - 1
+        if Range:
+            first, last = parse_range(Range, s3_object.size)
+        body = s3_object.read(first, last)
+
+        response = {
+            'Body': StreamingBody(body),
+            'ContentLength': len(body),
+            'ContentType': s3_object.content_type,
+            'ETag': s3_object.etag,
+            'LastModified': s3_object.last_modified,
+            'Metadata': dict(s3_object.metadata)
+        }
+        if Range:
+            response['ContentRange'] = f'bytes {first}-{last}/{s3_object.size}'
+
+        return response
+
+    def put_object(self, Bucket, Key, Body=b'', ContentType=None, Tagging=None,
+            Metadata=None, ChecksumAlgorithm=None, IfNoneMatch=None, **kwargs):
+        self._call('PutObject')
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        etag = '"%s"' % hashlib.md5(Body).hexdigest()
+        checksum_sha256 = None
+        if ChecksumAlgorithm == 'SHA256':
+            checksum_sha256 = base64.b64encode(hashlib.sha256(Body).digest()).decode('ascii')
+        with self.lock:
+            if IfNoneMatch == '*' and Key in self.bucket(Bucket).objects:
+                raise client_error('PreconditionFailed',
+                    'At least one of the pre-conditions you specified did not hold',
+                    'PutObject', 412)
+            self.bucket(Bucket).put(Key, S3Object(
+                Body,
+                len(Body),
+                etag,
+                dict(parse_qsl(Tagging)) if Tagging else None,
+                ContentType,
+                Metadata,
+                checksum_sha256 = checksum_sha256
+            ))
+
+        return {'ETag': etag}
+
+    def copy_object(self, Bucket, Key, CopySource, TaggingDirective='COPY',
+            Tagging='', **kwargs):
+        self._call('CopyObject')
+        with self.lock:
+            source = self._source(CopySource, 'CopyObject')
+            if source.size > MAX_COPY_OBJECT_BYTES:
+                raise client_error(
+                    'InvalidRequest',
+                    'The specified copy source is larger than the maximum '
+                    f'allowable size for a copy source: {MAX_COPY_OBJECT_BYTES}',
+                    'CopyObject'
+                )
+            tags = dict(parse_qsl(Tagging)) if TaggingDirective == 'REPLACE' else None
+            copied = source.copy(tags)
+            self.bucket(Bucket).put(Key, copied)
+
+        return {
+            'CopyObjectResult': {
+                'ETag': copied.etag,
+                'LastModified': copied.last_modified
+            }
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._call('DeleteObject')
+        with self.lock:
+            self.bucket(Bucket).delete(Key)
+
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._call('DeleteObjects')
+        if len(Delete['Objects']) > 1000:
+            raise client_error('MalformedXML', 'Too many objects', 'DeleteObjects')
+        with self.lock:
+            bucket = self.bucket(Bucket)
+            for entry in Delete['Objects']:
+                bucket.delete(entry['Key'])
+
+        response = {}
+        if not Delete.get('Quiet'):
+            response['Deleted'] = [{'Key': entry['Key']} for entry in Delete['Objects']]
+        return response
+
+    def get_object_tagging(self, Bucket, Key, **kwargs):
+        self._call('GetObjectTagging')
+        with self.lock:
+            tags = dict(self._object(Bucket, Key, 'GetObjectTagging').tags)
+
+        return {'TagSet': [{'Key': key, 'Value': value} for key, value in tags.items()]}
+
+    def put_object_tagging(self, Bucket, Key, Tagging, **kwargs):
+        self._call('PutObjectTagging')
+        with self.lock:
+            self._object(Bucket, Key, 'PutObjectTagging').tags = {
+                tag['Key']: tag['Value'] for tag in Tagging['TagSet']
+            }
+
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, Tagging=None, ContentType=None,
+            Metadata=None, **kwargs):
+        self._call('CreateMultipartUpload')
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {
+                'bucket': Bucket,
+                'key': Key,
+                'tags': dict(parse_qsl(Tagging)) if Tagging else {},
+                'content_type': ContentType,
+                'metadata': Metadata,
+                'parts': {}
+            }
+
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def _upload(self, upload_id, operation_name):
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            raise client_error('NoSuchUpload', 'The specified upload does not exist.',
+                operation_name, 404)
+        return upload
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource,
+            CopySourceIfMatch=None, CopySourceRange=None, **kwargs):
+        self._call('UploadPartCopy')
+        with self.lock:
+            upload = self._upload(UploadId, 'UploadPartCopy')
+            source = self._source(CopySource, 'UploadPartCopy')
+            if CopySourceIfMatch and CopySourceIfMatch != source.etag:
+                raise client_error('PreconditionFailed',
+                    'At least one of the pre-conditions you specified did not hold',
+                    'UploadPartCopy', 412)
+            first, last = 0, source.size - 1
+            if CopySourceRange:
+                first, last = parse_range(CopySourceRange, source.size)
+            etag = '"%s"' % hashlib.md5(
+                f'{source.etag}:{first}-{last}'.encode('utf-8')).hexdigest()
+            upload['parts'][PartNumber] = (source, first, last, etag)
+
+        return {'CopyPartResult': {'ETag': etag}}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload,
+            **kwargs):
+        self._call('CompleteMultipartUpload')
+        with self.lock:
+            upload = self._upload(UploadId, 'CompleteMultipartUpload')
+            parts = [
+                upload['parts'][part['PartNumber']]
+                for part in sorted(MultipartUpload['Parts'],
+                    key = lambda part: part['PartNumber'])
+            ]
+            size = sum(last - first + 1 for _, first, last, _ in parts)
+            sources = {id(source) for source, _, _, _ in parts}
+            source = parts[0][0]
+            if len(sources) == 1 and size == source.size:
+                body = source.body
+            else:
+                body = b''.join(source.read(first, last) for source, first, last, _ in parts)
+            etag = '"%s-%d"' % (hashlib.md5(''.join(
+                part[3] for part in parts).encode('utf-8')).hexdigest(), len(parts))
+            self.bucket(Bucket).put(Key, S3Object(
+                body,
+                size,
+                etag,
+                upload['tags'],
+                upload['content_type'] or source.content_type,
+                upload['metadata'],
+                any(source.sensitive for source, _, _, _ in parts)
+            ))
+            del self.uploads[UploadId]
+
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call('AbortMultipartUpload')
+        with self.lock:
+            self._upload(UploadId, 'AbortMultipartUpload')
+            del self.uploads[UploadId]
+
+        return {}
+
+def _scope_term_matches(term, key, s3_object):
+    if 'tagScopeTerm' in term:
+        term = term['tagScopeTerm']
+        found = any(
+            s3_object.tags.get(tag['key']) == tag['value']
+            for tag in term['tagValues']
+        )
+        return found if term.get('comparator', 'EQ') == 'EQ' else not found
+
+    term = term['simpleScopeTerm']
+    if term['key'] == 'OBJECT_EXTENSION':
+        value = key.rsplit('.', 1)[-1].lower() if '.' in key else ''
+    elif term['key'] == 'OBJECT_KEY':
+        value = key
+    elif term['key'] == 'OBJECT_SIZE':
+        value = s3_object.size
+    else:
+        value = s3_object.last_modified.isoformat()
+    values = term['values']
+    if term['key'] == 'OBJECT_SIZE':
+        values = [int(value) for value in values]
+
+    comparator = term.get('comparator', 'EQ')
+    if comparator == 'EQ':
+        return value in values
+    if comparator == 'NE':
+        return value not in values
+    if comparator == 'STARTS_WITH':
+        return any(value.startswith(prefix) for prefix in values)
+    if comparator == 'CONTAINS':
+        return any(part in value for part in values)
+    if comparator == 'GT':
+        return value > values[0]
+    if comparator == 'GTE':
+        return value >= values[0]
+    if comparator == 'LT':
+        return value < values[0]
+    if comparator == 'LTE':
+        return value <= values[0]
+    return False
+
+def scope_matches(scoping, key, s3_object):
+    includes = scoping.get('includes', {}).get('and', [])
+    excludes = scoping.get('excludes', {}).get('and', [])
+    if not all(_scope_term_matches(term, key, s3_object) for term in includes):
+        return False
+    return not (excludes and all(
+        _scope_term_matches(term, key, s3_object) for term in excludes))
+
+class MacieStandIn(ServiceStandIn):
+    '''
+    Classification jobs over the S3 stand-in. A job takes the objects in
+    scope when it is created and completes job_seconds later on the virtual
+    clock, or after the duration expected by pipeline_common.polling when
+    job_seconds is None. Every sensitive object gets one to three findings;
+    they become visible when the job completes.
+    '''
+    service_name = 'macie2'
+
+    def __init__(self, stats, s3, clock, job_seconds=None, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.s3 = s3
+        self.clock = clock
+        self.job_seconds = job_seconds
+        self.jobs = {}
+        self.findings = {}
+        self.listings = {}
+        self.reported = set()
+
+    def _duration(self, object_count, object_bytes):
+        if self.job_seconds is not None:
+            return self.job_seconds
+        from pipeline_common.polling import expected_job_seconds
+        return expected_job_seconds(object_count, object_bytes)
+
+    def _job(self, job_id, operation_name):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise client_error('ResourceNotFoundException',
+                f'Job {job_id} not found', operation_name, 404)
+        return job
+
+    def _status(self, job):
+        if job['cancelled']:
+            return 'CANCELLED'
+        if self.clock.now() >= job['completesAt']:
+            return 'COMPLETE'
+        return 'RUNNING'
+
+    def create_classification_job(self, name, s3JobDefinition, jobType='ONE_TIME',
+            **kwargs):
+        self._call('CreateClassificationJob')
+        job_id = uuid.uuid4().hex
+        scoping = s3JobDefinition.get('scoping', {})
+        scanned = []
+        with self.s3.lock:
+            for definition in s3JobDefinition['bucketDefinitions']:
+                for bucket_name in definition['buckets']:
+                    for key, s3_object in self.s3.bucket(bucket_name).objects.items():
+                        if scope_matches(scoping, key, s3_object):
+                            scanned.append((bucket_name, key, s3_object))
+
+        with self.lock:
+            created_at = self.clock.now()
+            job = {
+                'jobId': job_id,
+                'name': name,
+                'jobType': jobType,
+                'createdAt': created_at,
+                'completesAt': created_at + self._duration(
+                    len(scanned), sum(s3_object.size for _, _, s3_object in scanned)),
+                'cancelled': False,
+                'objectCount': len(scanned),
+                'objectBytes': sum(s3_object.size for _, _, s3_object in scanned),
+                'findingIds': []
+            }
+            for bucket_name, key, s3_object in scanned:
+                if s3_object.sensitive:
+                    for _ in range(self.random.randint(1, 3)):
+                        job['findingIds'].append(
+                            self._add_finding(job, bucket_name, key, s3_object))
+            self.jobs[job_id] = job
+
+        return {
+            'jobId': job_id,
+            'jobArn': f'arn:aws:macie2:us-east-1:123456789012:classification-job/{job_id}'
+        }
+
+    def _add_finding(self, job, bucket_name, key, s3_object):
+        finding_id = uuid.uuid4().hex
+        severity = self.random.choice(list(SEVERITY_SCORES))
+        self.findings[finding_id] = {
+            'id': finding_id,
+            'category': 'CLASSIFICATION',
+            'type': self.random.choice(FINDING_TYPES),
+            'count': 1,
+            'severity': {
+                'description': severity,
+                'score': SEVERITY_SCORES[severity]
+            },
+            'classificationDetails': {'jobId': job['jobId']},
+            'resourcesAffected': {
+                's3Bucket': {'name': bucket_name},
+                's3Object': {
+                    'key': key,
+                    'size': s3_object.size,
+                    'eTag': s3_object.etag.strip('"'),
+                    'extension': key.rsplit('.', 1)[-1] if '.' in key else ''
+                }
+            }
+        }
+        return finding_id
+
+    def describe_classification_job(self, jobId):
+        self._call('DescribeClassificationJob')
+        with self.lock:
+            job = self._job(jobId, 'DescribeClassificationJob')
+            return {
+                'jobId': jobId,
+                'name': job['name'],
+                'jobType': job['jobType'],
+                'jobStatus': self._status(job),
+                'createdAt': self.clock.real_datetime(job['createdAt']),
+                # One-time jobs run as soon as they are created
+                'lastRunTime': self.clock.real_datetime(job['createdAt']),
+                'statistics': {
+                    'approximateNumberOfObjectsToProcess': job['objectCount'],
+                    'numberOfRuns': 1
+                }
+            }
+
+    def update_classification_job(self, jobId, jobStatus):
+        self._call('UpdateClassificationJob')
+        with self.lock:
+            self._job(jobId, 'UpdateClassificationJob')['cancelled'] = (
+                jobStatus == 'CANCELLED')
+
+        return {}
+
+    def next_completion(self):
+        '''
+        Virtual time at which the next unreported job finishes, or None.
+        '''
+        with self.lock:
+            pending = [
+                job['completesAt'] for job_id, job in self.jobs.items()
+                if job_id not in self.reported
+            ]
+        return min(pending) if pending else None
+
+    def job_status_events(self):
+        '''
+        Return the job status log events of the jobs that finished since the
+        last call, as Macie writes them to CloudWatch Logs.
+        '''
+        events = []
+        with self.lock:
+            for job_id, job in self.jobs.items():
+                status = self._status(job)
+                if job_id in self.reported or status == 'RUNNING':
+                    continue
+                self.reported.add(job_id)
+                events.append({
+                    'jobId': job_id,
+                    'eventType': 'JOB_COMPLETED' if status == 'COMPLETE' else 'JOB_CANCELLED'
+                })
+        return events
+
+    def _visible_findings(self, finding_criteria):
+        for job in self.jobs.values():
+            if self._status(job) != 'COMPLETE':
+                continue
+            for finding_id in job['findingIds']:
+                finding = self.findings[finding_id]
+                if matches_criteria(finding, finding_criteria):
+                    yield finding
+
+    def list_findings(self, findingCriteria=None, maxResults=50, nextToken=None,
+            sortCriteria=None):
+        self._call('ListFindings')
+        if maxResults > MAX_FINDING_IDS:
+            raise client_error('ValidationException',
+                f'maxResults must be at most {MAX_FINDING_IDS}', 'ListFindings')
+        # Pages of a listing come from the ids matched by its first call
+        listing_id, start = (nextToken or f'{uuid.uuid4().hex}:0').split(':')
+        start = int(start)
+        with self.lock:
+            if listing_id not in self.listings:
+                self.listings[listing_id] = sorted(
+                    finding['id'] for finding in self._visible_findings(findingCriteria))
+            finding_ids = self.listings[listing_id]
+
+        response = {'findingIds': finding_ids[start:start + maxResults]}
+        if start + maxResults < len(finding_ids):
+            response['nextToken'] = f'{listing_id}:{start + maxResults}'
+        return response
+
+    def get_findings(self, findingIds, sortCriteria=None):
+        self._call('GetFindings')
+        if len(findingIds) > MAX_FINDING_IDS:
+            raise client_error('ValidationException',
+                f'At most {MAX_FINDING_IDS} finding ids are allowed', 'GetFindings')
+        with self.lock:
+            findings = [
+                json.loads(json.dumps(self.findings[finding_id]))
+                for finding_id in findingIds if finding_id in self.findings
+            ]
+
+        return {'findings': findings}
+
+    def get_finding_statistics(self, groupBy, findingCriteria=None, **kwargs):
+        self._call('GetFindingStatistics')
+        with self.lock:
+            counts = Counter(
+                dotted_value(finding, groupBy)
+                for finding in self._visible_findings(findingCriteria)
+            )
+
+        return {
+            'countsByGroup': [
+                {'groupKey': group, 'count': count}
+                for group, count in sorted(counts.items())
+            ]
+        }
+
+class S3ControlStandIn(ServiceStandIn):
+    '''
+    S3 Batch Operations jobs over S3 Inventory style CSV manifests. A job
+    runs its S3PutObjectCopy or S3PutObjectTagging tasks when it is first
+    described after its duration has passed on the clock, and then writes a
+    completion report of the failed tasks.
+    '''
+    service_name = 's3control'
+    JOB_SECONDS = 60
+    TASKS_PER_SECOND = 1000
+
+    def __init__(self, stats, s3, clock, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.s3 = s3
+        self.clock = clock
+        self.jobs = {}
+        self.tokens = {}
+
+    def _read(self, object_arn):
+        bucket_name, key = object_arn.split(':::', 1)[1].split('/', 1)
+        with self.s3.lock:
+            s3_object = self.s3.bucket(bucket_name).objects.get(key)
+        if s3_object is None:
+            raise client_error('InvalidRequest', f'Manifest {object_arn} not found',
+                'CreateJob')
+        return s3_object.read()
+
+    def _tasks(self, location):
+        manifest = json.loads(self._read(location['ObjectArn']))
+        bucket_arn = manifest['destinationBucket']
+        tasks = []
+        for part in manifest['files']:
+            text = gzip.decompress(self._read(f"{bucket_arn}/{part['key']}"))
+            for row in csv.reader(io.StringIO(text.decode('utf-8'))):
+                tasks.append((row[0], unquote_plus(row[1])))
+        return tasks
+
+    def create_job(self, AccountId, Operation, Manifest, Report, ClientRequestToken,
+            Priority, RoleArn, ConfirmationRequired=True, Description=None, **kwargs):
+        self._call('CreateJob')
+        with self.lock:
+            if ClientRequestToken in self.tokens:
+                return {'JobId': self.tokens[ClientRequestToken]}
+
+        tasks = self._tasks(Manifest['Location'])
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            created_at = self.clock.now()
+            self.tokens[ClientRequestToken] = job_id
+            self.jobs[job_id] = {
+                'operation': Operation,
+                'report': Report,
+                'tasks': tasks,
+                'completesAt': created_at + self.JOB_SECONDS
+                    + len(tasks) / self.TASKS_PER_SECOND,
+                'status': 'Active',
+                'succeeded': 0,
+                'failed': 0
+            }
+
+        return {'JobId': job_id}
+
+    def _run_task(self, operation, bucket_name, key):
+        with self.s3.lock:
+            source = self.s3.bucket(bucket_name).objects.get(key)
+            if source is None:
+                return '404', 'NoSuchKey'
+            if 'S3PutObjectCopy' in operation:
+                copy = operation['S3PutObjectCopy']
+                if source.size > MAX_COPY_OBJECT_BYTES:
+                    return '400', 'InvalidRequest'
+                tags = copy.get('NewObjectTagging')
+                copied = source.copy(None if tags is None else {
+                    tag['Key']: tag['Value'] for tag in tags
+                })
+                target = copy['TargetResource'].split(':::', 1)[1]
+                self.s3.bucket(target).put(key, copied)
+            else:
+                source.tags = {
+                    tag['Key']: tag['Value']
+                    for tag in operation['S3PutObjectTagging']['TagSet']
+                }
+        return None
+
+    def _complete(self, job_id, job):
+        rows = []
+        for bucket_name, key in job['tasks']:
+            error = self._run_task(job['operation'], bucket_name, key)
+            if error is None:
+                job['succeeded'] += 1
+            else:
+                job['failed'] += 1
+                rows.append([bucket_name, key, '', 'failed', error[1], error[0], error[1]])
+
+        report = job['report']
+        report_bucket = report['Bucket'].split(':::', 1)[1]
+        prefix = f"{report['Prefix']}/job-{job_id}"
+        text = io.StringIO()
+        csv.writer(text, lineterminator = '\n').writerows(rows)
+        results_key = f'{prefix}/results/{uuid.uuid4().hex}.csv'
+        self.s3.bucket(report_bucket).put(results_key, S3Object(
+            text.getvalue().encode('utf-8'), len(text.getvalue()), '""'))
+        body = json.dumps({
+            'Format': report['Format'],
+            'ReportCreationDate': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'Results': [{
+                'TaskExecutionStatus': 'failed',
+                'Bucket': report_bucket,
+                'Key': results_key
+            }],
+            'ReportSchema': 'Bucket, Key, VersionId, TaskStatus, ErrorCode, '
+                'HTTPStatusCode, ResultMessage'
+        }).encode('utf-8')
+        self.s3.bucket(report_bucket).put(
+            f'{prefix}/manifest.json', S3Object(body, len(body), '""'))
+        job['status'] = 'Complete'
+
+    def describe_job(self, AccountId, JobId):
+        self._call('DescribeJob')
+        with self.lock:
+            job = self.jobs.get(JobId)
+            if job is None:
+                raise client_error('NotFoundException', f'Job {JobId} not found',
+                    'DescribeJob', 404)
+            if job['status'] == 'Active' and self.clock.now() >= job['completesAt']:
+                self._complete(JobId, job)
+
+            return {
+                'Job': {
+                    'JobId': JobId,
+                    'Status': job['status'],
+                    'Priority': 10,
+                    'ProgressSummary': {
+                        'TotalNumberOfTasks': len(job['tasks']),
+                        'NumberOfTasksSucceeded': job['succeeded'],
+                        'NumberOfTasksFailed': job['failed']
+                    }
+                }
+            }
+
+class SNSStandIn(ServiceStandIn):
+    service_name = 'sns'
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.messages = []
+
+    def publish(self, TopicArn, Message, Subject=None, **kwargs):
+        self._call('Publish')
+        if len(Message.encode('utf-8')) > 256 * 1024:
+            raise client_error('InvalidParameter',
+                'Invalid parameter: Message too long', 'Publish')
+        message_id = str(uuid.uuid4())
+        with self.lock:
+            self.messages.append({
+                'MessageId': message_id,
+                'TopicArn': TopicArn,
+                'Subject': Subject,
+                'Message': Message
+            })
+
+        return {'MessageId': message_id}
+
+class StepFunctionsStandIn(ServiceStandIn):
+    '''
+    Task tokens, execution starts and execution histories. Tokens are issued
+    by the local state machine and completed by the functions through
+    send_task_success or send_task_failure; started executions are only
+    recorded. The histories of the local executions are recorded with
+    record_history and returned by get_execution_history, on the real clock
+    like the times of the Macie stand-in.
+    '''
+    service_name = 'stepfunctions'
+
+    def __init__(self, stats, clock, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.clock = clock
+        self.tasks = {}
+        self.executions = []
+        self.histories = {}
+
+    def record_history(self, execution_arn, history):
+        with self.lock:
+            self.histories[execution_arn] = list(history)
+
+    def get_execution_history(self, executionArn, maxResults=100, nextToken=None,
+            reverseOrder=False, includeExecutionData=True):
+        self._call('GetExecutionHistory')
+        with self.lock:
+            history = self.histories.get(executionArn)
+        if history is None:
+            raise client_error('ExecutionDoesNotExist',
+                f'Execution {executionArn} does not exist', 'GetExecutionHistory')
+        if reverseOrder:
+            history = history[::-1]
+
+        start = int(nextToken or 0)
+        page = {
+            'events': [
+                dict(event, timestamp = self.clock.real_datetime(event['timestamp']))
+                for event in history[start:start + maxResults]
+            ]
+        }
+        if start + maxResults < len(history):
+            page['nextToken'] = str(start + maxResults)
+
+        return page
+
+    def new_task_token(self):
+        task_token = uuid.uuid4().hex
+        with self.lock:
+            self.tasks[task_token] = {'status': 'PENDING'}
+        return task_token
+
+    def close_task(self, task_token):
+        # Return the outcome of a task and stop accepting results for it
+        with self.lock:
+            task = dict(self.tasks[task_token])
+            self.tasks[task_token]['status'] = 'CLOSED'
+        return task
+
+    def _complete(self, task_token, operation_name, **outcome):
+        with self.lock:
+            task = self.tasks.get(task_token)
+            if task is None:
+                raise client_error('InvalidToken', 'Invalid Token', operation_name)
+            if task['status'] != 'PENDING':
+                raise client_error('TaskTimedOut', 'Task Timed Out', operation_name)
+            task.update(outcome)
+
+    def send_task_success(self, taskToken, output):
+        self._call('SendTaskSuccess')
+        self._complete(taskToken, 'SendTaskSuccess',
+            status = 'SUCCEEDED', output = json.loads(output))
+
+        return {}
+
+    def send_task_failure(self, taskToken, error=None, cause=None):
+        self._call('SendTaskFailure')
+        self._complete(taskToken, 'SendTaskFailure',
+            status = 'FAILED', error = error, cause = cause)
+
+        return {}
+
+    def send_task_heartbeat(self, taskToken):
+        self._call('SendTaskHeartbeat')
+        return {}
+
+    def start_execution(self, stateMachineArn, name=None, input='{}', **kwargs):
+        self._call('StartExecution')
+        name = name or str(uuid.uuid4())
+        with self.lock:
+            if any(execution['name'] == name for execution in self.executions):
+                raise client_error('ExecutionAlreadyExists',
+                    f'Execution {name} already exists', 'StartExecution')
+            self.executions.append({
+                'stateMachineArn': stateMachineArn,
+                'name': name,
+                'input': json.loads(input)
+            })
+
+        return {
+            'executionArn': f'{stateMachineArn}:{name}',
+            'startDate': datetime.datetime.now(datetime.timezone.utc)
+        }
+
+class AwsStandIns:
+    '''
+    One set of connected stand-ins. latency_ms and throttle_rate map service
+    names ('s3', 's3control', 'macie2', 'sns', 'stepfunctions') to the
+    injected latency and throttling probability of every call to that
+    service.
+    '''
+    def __init__(self, latency_ms=None, throttle_rate=None, job_seconds=None,
+            seed=0):
+        latency_ms = latency_ms or {}
+        throttle_rate = throttle_rate or {}
+        self.clock = VirtualClock()
+        self.stats = ApiStats()
+
+        def options(service_name, offset):
+            return {
+                'latency_ms': latency_ms.get(service_name, 0),
+                'throttle_rate': throttle_rate.get(service_name, 0.0),
+                'seed': seed + offset
+            }
+
+        self.s3 = S3StandIn(self.stats, **options('s3', 1))
+        self.macie = MacieStandIn(self.stats, self.s3, self.clock,
+            job_seconds, **options('macie2', 2))
+        self.sns = SNSStandIn(self.stats, **options('sns', 3))
+        self.s3control = S3ControlStandIn(self.stats, self.s3, self.clock,
+            **options('s3control', 5))
+        self.stepfunctions = StepFunctionsStandIn(
+            self.stats, self.clock, **options('stepfunctions', 4))
+
+    def clients(self):
+        return {
+            's3': self.s3,
+            'macie2': self.macie,
+            'sns': self.sns,
+            'stepfunctions': self.stepfunctions,
+            's3control': self.s3control
+        }
+
+def install(stand_ins):
+    '''
+    Make pipeline_common.clients.get_client return the stand-ins.
+    '''
+    from pipeline_common import clients
+
+    with clients._clients_lock:
+        clients._clients.clear()
+        clients._clients.update(stand_ins.clients())
@@ -0,0 +1,53 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from pipeline_common.metrics import instrumented
+from pipeline_common.results import summarize
+
+'''
+Combine the results of the shards processed by a Map state into a single
+result the state machine can branch on.
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+@instrumented('aggregateShardResults')
+def lambda_handler(event, context):
+    shard_results = event['shardResults']
+
+    processed_count = 0
+    failed_count = 0
+    failed = []
+    for shard_result in shard_results:
+        processed_count += shard_result.get('processedCount', 0)
+        failed_count += shard_result.get('failedCount', 0)
+        failed.extend(shard_result.get('failed', []))
+        if shard_result.get('error'):
+            failed_count += 1
+            failed.append({
+                'key': None,
+                'stage': 'shard',
+                'error': shard_result['error']
+            })
+
+    return summarize(
+        processed_count,
+        failed,
+        failed_count = failed_count,
+        done = True,
+        shardCount = len(shard_results)
+    )
@@ -0,0 +1,147 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from pipeline_common.approvals import ALLOW, ApprovalDecisions, applied_count, close_approval_request, decision_log_keys, read_decision_log, save_applied_count
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import Deadline, resume_payload, run_batches
+from pipeline_common.metrics import add_metric, instrumented
+from pipeline_common.payload import finding_records
+from pipeline_common.pipeline_state import SCANNED_DATA, advance_objects
+from pipeline_common.results import error_result, log_failures, summarize
+from pipeline_common.s3_delete import delete_objects
+from pipeline_common.s3_move import object_key
+
+'''
+Apply the approval decisions received since the last round to the files in
+the manual review bucket: approved files are moved to the scanned data
+bucket and denied files are deleted, without waiting for decisions on the
+other files of the workflow (see pipeline_common.approvals).
+
+A round ends after the first batch-wide decision in the decision log. Its
+action is returned as 'finalAction' and the state machine hands the files
+still undecided to moveToScannedDataS3Files or deleteManualReviewS3Files.
+Otherwise 'undecidedCount' tells whether the state machine should wait for
+more decisions.
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+def round_requests(manifest_bucket_name, log_keys, applied, s3_client):
+    # Decisions after a batch-wide decision are left for a review that has ended
+    requests = []
+    for decisions in read_decision_log(manifest_bucket_name, log_keys[applied:], s3_client):
+        requests.append(decisions)
+        if any('key' not in decision and 'prefix' not in decision
+                for decision in decisions):
+            break
+
+    return requests
+
+@instrumented('applyApprovalDecisions')
+def lambda_handler(event, context):
+    s3_client = get_client('s3')
+
+    src_bucket_name = os.environ['sourceS3Bucket']
+    target_bucket_name = os.environ['targetS3Bucket']
+    manifest_bucket_name = os.environ['manifestS3Bucket']
+
+    prefix = event['Input']['id']
+    findings_info = event['Input']['macieFindingsInfo']['Payload']
+
+    previous = resume_payload(event, 'approvalResult')
+
+    try:
+        log_keys = decision_log_keys(manifest_bucket_name, prefix, s3_client)
+        if previous:
+            applied = previous['cursor']['applied']
+            up_to = previous['cursor']['upTo']
+            offset = previous['cursor']['offset']
+            requests = read_decision_log(
+                manifest_bucket_name, log_keys[applied:up_to], s3_client)
+        else:
+            applied = applied_count(manifest_bucket_name, prefix, s3_client)
+            offset = 0
+            requests = round_requests(manifest_bucket_name, log_keys, applied, s3_client)
+            up_to = applied + len(requests)
+        earlier = ApprovalDecisions(
+            read_decision_log(manifest_bucket_name, log_keys[:applied], s3_client))
+        current = ApprovalDecisions(requests)
+    except Exception as e:
+        return error_result(f'Could not read approval decisions of workflow {prefix}', e)
+
+    # Files already released by an earlier round keep their decision
+    decided_records = (
+        dict(record, action = current.decision_for(record['key']))
+        for record in finding_records(findings_info, s3_client = s3_client)
+        if earlier.decision_for(record['key']) is None
+            and current.decision_for(record['key']) is not None
+    )
+
+    result = {'processed': 0, 'failed': []}
+
+    def apply_batch(batch):
+        approved = [record for record in batch if record['action'] == ALLOW]
+        denied = [object_key(record) for record in batch if record['action'] != ALLOW]
+
+        move_result = advance_objects(
+            src_bucket_name,
+            target_bucket_name,
+            approved,
+            SCANNED_DATA,
+            s3_client = s3_client
+        )
+        delete_result = delete_objects(src_bucket_name, denied, s3_client = s3_client)
+        result['processed'] += len(move_result['moved']) + len(move_result.get('skipped', [])) \
+            + len(delete_result['deleted'])
+        result['failed'].extend(move_result['failed'] + delete_result['failed'])
+        add_metric('ApprovedObjectsReleased', len(move_result['moved']))
+        add_metric('DeniedObjectsDeleted', len(delete_result['deleted']))
+
+    try:
+        offset, done = run_batches(decided_records, apply_batch, Deadline(context), offset)
+    except Exception as e:
+        return error_result(f'Could not apply approval decisions of workflow {prefix}', e)
+    log_failures('Could not apply approval decisions', result['failed'])
+
+    cursor = {'applied': applied, 'upTo': up_to, 'offset': offset}
+    if not done:
+        return summarize(
+            result['processed'], result['failed'], previous, done = False, cursor = cursor)
+
+    try:
+        save_applied_count(manifest_bucket_name, prefix, up_to, s3_client)
+        decided = ApprovalDecisions(
+            read_decision_log(manifest_bucket_name, log_keys[:up_to], s3_client))
+        undecided_count = sum(
+            1 for record in finding_records(findings_info, s3_client = s3_client)
+            if decided.decision_for(record['key']) is None
+        )
+        if current.final_action or not undecided_count:
+            close_approval_request(manifest_bucket_name, prefix, s3_client)
+    except Exception as e:
+        return error_result(f'Could not record approval decisions of workflow {prefix}', e)
+
+    return summarize(
+        result['processed'],
+        result['failed'],
+        previous,
+        done = True,
+        cursor = cursor,
+        finalAction = current.final_action or 'none',
+        undecidedCount = undecided_count
+    )
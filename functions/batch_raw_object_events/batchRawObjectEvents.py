@@ -0,0 +1,134 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import os
+import uuid
+from urllib.parse import unquote_plus
+from pipeline_common.clients import get_client
+from pipeline_common.manifest import manifest_key, write_manifest
+from pipeline_common.metrics import instrumented
+
+'''
+Start the sensitive data scan workflow for micro-batches of new raw objects.
+
+S3 event notifications of the raw data bucket are delivered through an SQS
+queue. The queue event source accumulates messages until the batch size or
+the batching window (the key count and age thresholds) is reached; the
+function then splits the new objects into batches of at most maxBatchKeys
+keys and maxBatchBytes bytes, writes each batch to the manifest bucket and
+starts one execution per batch. triggerMacieScan moves and scans only the
+keys of its batch.
+
+Messages of a batch whose execution could not be started are reported as
+failed so SQS delivers them again.
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+BATCH_MANIFEST = 'batch'
+
+def created_objects(message_body):
+    # S3 sends a test event without records when the notification is set up
+    for record in json.loads(message_body).get('Records', []):
+        if not record.get('eventName', '').startswith('ObjectCreated:'):
+            continue
+        s3_object = record['s3']['object']
+        yield {
+            'Key': unquote_plus(s3_object['key']),
+            'Size': s3_object.get('size', 0),
+            'ETag': s3_object.get('eTag')
+        }
+
+def plan_batches(messages, max_keys, max_bytes):
+    '''
+    Group (message id, objects) pairs into batches of at most max_keys keys
+    and max_bytes bytes, keeping the objects of a message together. The last
+    notification of a key wins.
+    '''
+    batches = []
+    current = None
+    for message_id, objects in messages:
+        if not objects:
+            continue
+        size = sum(key_data['Size'] for key_data in objects)
+        if (current is None
+                or len(current['objects']) + len(objects) > max_keys
+                or current['bytes'] + size > max_bytes):
+            current = {'objects': {}, 'bytes': 0, 'messageIds': []}
+            batches.append(current)
+        for key_data in objects:
+            current['objects'][key_data['Key']] = key_data
+        current['bytes'] += size
+        current['messageIds'].append(message_id)
+
+    return batches
+
+@instrumented('batchRawObjectEvents')
+def lambda_handler(event, context):
+    s3_client = get_client('s3')
+    sfn_client = get_client('stepfunctions')
+
+    state_machine_arn = os.environ['stateMachineArn']
+    manifest_bucket_name = os.environ['manifestS3Bucket']
+    max_keys = int(os.environ.get('maxBatchKeys', '1000'))
+    max_bytes = int(os.environ.get('maxBatchBytes', str(10 * 1024 ** 3)))
+
+    messages = []
+    failed_message_ids = []
+    for record in event['Records']:
+        try:
+            messages.append(
+                (record['messageId'], list(created_objects(record['body']))))
+        except Exception as e:
+            print(f"Could not parse S3 event message {record['messageId']}")
+            print(e)
+            failed_message_ids.append(record['messageId'])
+
+    for batch in plan_batches(messages, max_keys, max_bytes):
+        workflow_id = str(uuid.uuid4())
+        batch_key = manifest_key(workflow_id, BATCH_MANIFEST)
+        try:
+            write_manifest(
+                manifest_bucket_name,
+                batch_key,
+                list(batch['objects'].values()),
+                s3_client = s3_client
+            )
+            sfn_client.start_execution(
+                stateMachineArn = state_machine_arn,
+                name = f'batch-{workflow_id}',
+                input = json.dumps({
+                    'id': workflow_id,
+                    'batch': {
+                        'bucket': manifest_bucket_name,
+                        'key': batch_key,
+                        'keyCount': len(batch['objects']),
+                        'bytes': batch['bytes']
+                    }
+                })
+            )
+        except Exception as e:
+            print(f'Could not start workflow for batch {workflow_id}')
+            print(e)
+            failed_message_ids.extend(batch['messageIds'])
+
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': message_id} for message_id in failed_message_ids
+        ]
+    }
@@ -14,31 +14,78 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
-import boto3
-import json
-from botocore.exceptions import ClientError
+import os
+from pipeline_common.clients import get_client
+from pipeline_common.metrics import add_metric, instrumented
+from pipeline_common.polling import job_age_seconds, recommended_wait
+from pipeline_common.scan_jobs import combined_job_status, job_ids
 
 '''
-Check status of Macie classification job. 
+Check status of Macie classification job. When the staged objects were
+split across several jobs the status of the job set is returned: COMPLETE
+once every job is complete, otherwise the status of the least advanced job.
+
+Besides the job status the function returns the number of seconds the state
+machine should wait before the next check, based on the job age, the number
+of checks so far and the staged object count and bytes, and the configured
+wait mode: 'poll' waits for that time, 'event' waits for the Macie job
+status event through a task token (see registerMacieJobWait).
 
 This proof of concept is used as part of a data pipeline workflow as part of
 the data ingestion pipeline. 
 '''
 
-macie_client = boto3.client('macie2')
-
+@instrumented('checkMacieStatus')
 def lambda_handler(event, context):
-    job_id = event['Input']['jobId']['Payload']
+    macie_client = get_client('macie2')
+
+    wait_mode = os.environ.get('jobWaitMode', 'poll')
+
+    try:
+        job_info = event['Input']['jobId']['Payload']
+        job_id = job_info['jobId']
+    except Exception as e:
+        print('Could not retrieve jobId')
+        print(e)
+        return
 
     if job_id == 'NoKeysFound':
-        return 'NoKeysFound'
+        return {'jobStatus': 'NoKeysFound'}
     else:
         try:
-            response = macie_client.describe_classification_job(jobId = job_id)
+            scan_job_ids = job_ids(job_info)
+            jobs = [
+                macie_client.describe_classification_job(jobId = scan_job_id)
+                for scan_job_id in scan_job_ids
+            ]
         except Exception as e:
             print(f'Could not get status of jobId {job_id}')
             print(e)
             return
 
-    return response['jobStatus']
+    previous = event['Input'].get('jobStatus')
+    if isinstance(previous, dict) and isinstance(previous.get('Payload'), dict):
+        poll_count = previous['Payload'].get('pollCount', 0)
+    else:
+        poll_count = 0
+
+    # The jobs run concurrently, so the wait is estimated for one shard of
+    # the objects not excluded from the scan
+    wait_seconds = recommended_wait(
+        job_age_seconds(min(job['createdAt'] for job in jobs)),
+        poll_count,
+        (job_info.get('stagedCount', 0) - job_info.get('excludedCount', 0)) / len(jobs),
+        (job_info.get('stagedBytes', 0) - job_info.get('excludedBytes', 0)) / len(jobs)
+    )
+    add_metric('RecommendedWait', wait_seconds)
+
+    return {
+        'jobStatus': combined_job_status([job['jobStatus'] for job in jobs]),
+        'jobStatuses': {
+            scan_job_id: job['jobStatus']
+            for scan_job_id, job in zip(scan_job_ids, jobs)
+        },
+        'waitSeconds': wait_seconds,
+        'pollCount': poll_count + 1,
+        'waitMode': wait_mode
+    }
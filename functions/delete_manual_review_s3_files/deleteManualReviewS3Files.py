@@ -14,35 +14,71 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
-import boto3
-import json
 import os
-from botocore.exceptions import ClientError
+from pipeline_common.approvals import applied_decisions, undecided
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import Deadline, resume_payload
+from pipeline_common.metrics import instrumented
+from pipeline_common.payload import finding_records
+from pipeline_common.results import error_result, log_failures, summarize
+from pipeline_common.s3_delete import delete_in_batches
+from pipeline_common.sharding import shard_items
 
 '''
-Delete files from S3 manual review bucket.
+Delete files from S3 manual review bucket. Files approved or denied one by
+one have already been released by applyApprovalDecisions and are skipped.
 
 This proof of concept is used as part of a data pipeline workflow as part of
 the data ingestion pipeline. 
 '''
 
-s3_client = boto3.client('s3')
-
+@instrumented('deleteManualReviewS3Files')
 def lambda_handler(event, context):
+    s3_client = get_client('s3')
+
     src_bucket_name = os.environ['sourceS3Bucket']
-    s3_key_names = event['Input']['macieFindingsInfo']['Payload']
 
     try:
-        for s3_key_name in s3_key_names:
-            response = s3_client.delete_object(
-                Bucket=src_bucket_name,
-                Key = s3_key_name
-            )
+        decisions = applied_decisions(
+            os.environ['manifestS3Bucket'],
+            event['Input']['id'],
+            s3_client = s3_client
+        )
     except Exception as e:
-        print(f'Could not delete S3 object')
-        print(e)
-        return
+        return error_result('Could not read approval decisions', e)
+    s3_key_names = (
+        record['key'] for record in undecided(
+            shard_items(
+                finding_records(
+                    event['Input']['macieFindingsInfo']['Payload'],
+                    s3_client = s3_client
+                ),
+                event['Input'].get('shard')
+            ),
+            decisions
+        )
+    )
+
+    previous = resume_payload(event, 'fileOperationResult')
+    offset = previous['cursor']['offset'] if previous else 0
 
-    return 
+    # The finding records are read while the keys are deleted
+    try:
+        delete_result = delete_in_batches(
+            src_bucket_name,
+            s3_key_names,
+            Deadline(context),
+            offset,
+            s3_client = s3_client
+        )
+    except Exception as e:
+        return error_result('Could not delete S3 objects', e)
+    log_failures('Could not delete S3 objects', delete_result['failed'])
 
+    return summarize(
+        delete_result['deleted'],
+        delete_result['failed'],
+        previous,
+        done = delete_result['done'],
+        cursor = {'offset': delete_result['offset']}
+    )
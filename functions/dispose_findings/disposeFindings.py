@@ -0,0 +1,96 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from itertools import groupby
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import Deadline, resume_payload, run_batches
+from pipeline_common.disposition import ALLOW, disposition_records
+from pipeline_common.metrics import add_metric, instrumented
+from pipeline_common.pipeline_state import SCANNED_DATA, advance_objects
+from pipeline_common.results import error_result, log_failures, summarize
+from pipeline_common.s3_delete import delete_objects
+
+'''
+Dispose of the keys with findings matched by the disposition policy (see
+pipeline_common.disposition) without a manual review: allowed objects are
+moved from the scan stage bucket to the scanned data bucket, tagged with
+the rule that allowed them, and denied objects are deleted. The steps that
+move the rest of the workflow skip these keys.
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+@instrumented('disposeFindings')
+def lambda_handler(event, context):
+    s3_client = get_client('s3')
+
+    src_bucket_name = os.environ['sourceS3Bucket']
+    target_bucket_name = os.environ['targetS3Bucket']
+
+    prefix = event['Input']['id']
+    records = disposition_records(
+        event['Input']['macieFindingsInfo']['Payload'],
+        s3_client = s3_client
+    )
+
+    previous = resume_payload(event, 'dispositionResult')
+    offset = previous['cursor']['offset'] if previous else 0
+
+    result = {'processed': 0, 'failed': []}
+
+    def dispose_batch(batch):
+        allowed = sorted(
+            (record for record in batch if record['disposition'] == ALLOW),
+            key = lambda record: record['rule']
+        )
+        denied = [record['key'] for record in batch if record['disposition'] != ALLOW]
+
+        for rule, rule_records in groupby(allowed, key = lambda record: record['rule']):
+            move_result = advance_objects(
+                src_bucket_name,
+                target_bucket_name,
+                list(rule_records),
+                SCANNED_DATA,
+                tags = {
+                    'SensitiveDataFound': 'true',
+                    'WorkflowId': prefix,
+                    'AutoDisposition': rule
+                },
+                s3_client = s3_client
+            )
+            result['processed'] += len(move_result['moved']) + len(move_result.get('skipped', []))
+            result['failed'].extend(move_result['failed'])
+            add_metric('AutoAllowedObjectsMoved', len(move_result['moved']))
+
+        delete_result = delete_objects(src_bucket_name, denied, s3_client = s3_client)
+        result['processed'] += len(delete_result['deleted'])
+        result['failed'].extend(delete_result['failed'])
+
+    try:
+        offset, done = run_batches(records, dispose_batch, Deadline(context), offset)
+    except Exception as e:
+        return error_result(f'Could not dispose of findings of workflow {prefix}', e)
+    log_failures('Could not dispose of S3 objects', result['failed'])
+
+    return summarize(
+        result['processed'],
+        result['failed'],
+        previous,
+        done = done,
+        cursor = {'offset': offset}
+    )
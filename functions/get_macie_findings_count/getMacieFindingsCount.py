@@ -14,60 +14,135 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
-from pip._internal import main
-
-main(['install', '-I', '-q', 'boto3', '--target', '/tmp/', '--no-cache-dir', '--disable-pip-version-check'])
-sys.path.insert(0,'/tmp/')
-import boto3
-import json
 import os
-from botocore.exceptions import ClientError
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import Deadline, resume_payload
+from pipeline_common.disposition import dispose, disposition_payload
+from pipeline_common.findings import FindingsCollector, FindingsIndex
+from pipeline_common.manifest import manifest_key, read_manifest, read_manifest_parts, write_manifest
+from pipeline_common.metrics import add_metric, instrumented
+from pipeline_common.payload import findings_payload
+from pipeline_common.scan_cache import SENSITIVE, open_scan_cache, record_verdicts
+from pipeline_common.scan_jobs import job_ids
 
 '''
-Get number of findings from Macie classification job. 
+Get number of findings from Macie classification job. Finding pages are
+listed while the finding details of earlier pages are fetched concurrently,
+and only the S3 object key, severity and type of each finding are kept.
+
+Each invocation that does not finish writes its findings to a partial
+manifest part instead of carrying the keys in the state. The final
+invocation merges the parts and returns the keys inline when there are few,
+or a pointer to a findings manifest otherwise, and records a SENSITIVE verdict
+in the scan cache for every key with findings, under the SHA-256 checksum
+recorded in the staged manifest.
+
+The keys matched by a rule of the disposition policy (see
+pipeline_common.disposition) are returned separately under 'disposition'
+and left out of the findings keys and 'findingsCount', so only the other
+keys go to manual review.
 
 This proof of concept is used as part of a data pipeline workflow as part of
 the data ingestion pipeline. 
 '''
 
-macie_client = boto3.client('macie2')
+PARTIAL_FINDINGS_MANIFEST = 'partial-findings'
 
+@instrumented('getMacieFindingsCount')
 def lambda_handler(event, context):    
-    job_id = event['Input']['jobId']['Payload']
-    file_keys = set()
-    return_info = []
+    macie_client = get_client('macie2')
+    s3_client = get_client('s3')
+
+    manifest_bucket_name = os.environ['manifestS3Bucket']
+
+    prefix = event['Input']['id']
+    # Findings of all scan shard jobs of the workflow are collected together
+    scan_job_ids = job_ids(event['Input']['jobId']['Payload'])
+
+    previous = resume_payload(event, 'macieFindingsInfo')
+    if previous:
+        next_token = previous['cursor']['nextToken']
+        partial_parts = previous['cursor']['partialParts']
+    else:
+        next_token = None
+        partial_parts = 0
+
+    collector = FindingsCollector(macie_client, scan_job_ids)
+    index = FindingsIndex()
 
     try:
-        paginator = macie_client.get_paginator('list_findings')
-        
-        page_iterator = paginator.paginate(
-            findingCriteria = {
-                'criterion': {
-                    'classificationDetails.jobId': {
-                        'eq': [job_id]
+        next_token, done = collector.collect(index, Deadline(context), next_token)
+
+        if partial_parts or not done:
+            # Only parts of this run are merged, stale parts are ignored
+            if len(index):
+                write_manifest(
+                    manifest_bucket_name,
+                    manifest_key(prefix, PARTIAL_FINDINGS_MANIFEST, partial_parts),
+                    index.records(),
+                    s3_client = s3_client
+                )
+                partial_parts += 1
+
+            if not done:
+                return {
+                    'done': False,
+                    'cursor': {
+                        'nextToken': next_token,
+                        'partialParts': partial_parts
                     }
                 }
-            }
-        )
-    except Exception as e:
-        print(f'Could not get findings from job {job_id}')
-        print(e)
-        return
 
-    try:
-        for page in page_iterator:
-            findings_list = page['findingIds']
-            findings = macie_client.get_findings(findingIds=findings_list)
-            for finding in findings['findings']:
-                if 's3Object' in finding['resourcesAffected']:
-                    file_keys.add(finding['resourcesAffected']['s3Object']['key'])
+            index = FindingsIndex()
+            for part in range(partial_parts):
+                for record in read_manifest(
+                        manifest_bucket_name,
+                        manifest_key(prefix, PARTIAL_FINDINGS_MANIFEST, part),
+                        s3_client = s3_client):
+                    index.add_entry(record)
+
+        records = index.records()
+        scan_cache = open_scan_cache()
+        if scan_cache is not None and records:
+            # Findings carry no checksum, the staged records do
+            finding_keys = set(record['key'] for record in records)
+            record_verdicts(
+                scan_cache,
+                (
+                    record for record in read_manifest_parts(
+                        manifest_bucket_name, prefix, s3_client = s3_client)
+                    if record['key'] in finding_keys
+                ),
+                SENSITIVE
+            )
+
+        disposed, records = dispose(records)
+        return_info = findings_payload(
+            records,
+            manifest_bucket_name,
+            prefix,
+            s3_client = s3_client
+        )
+        return_info.update({
+            'findingsCount': len(records),
+            'disposedCount': len(disposed),
+            'done': True,
+            'cursor': {'nextToken': None, 'partialParts': partial_parts},
+            # Counted on the server, no finding documents are fetched
+            'severityCounts': collector.statistics('severity.description')
+        })
+        if disposed:
+            return_info['disposition'] = disposition_payload(
+                disposed,
+                manifest_bucket_name,
+                prefix,
+                s3_client = s3_client
+            )
+            add_metric('FindingsAutoAllowed', return_info['disposition']['allowCount'])
+            add_metric('FindingsAutoDenied', return_info['disposition']['denyCount'])
     except Exception as e:
-        print('Error reteiving findings details')
+        print(f'Error retrieving findings from jobs {scan_job_ids}')
         print(e)
         return
 
-    
-    return_info = list(file_keys)
-
     return return_info
@@ -14,70 +14,106 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
-import boto3
-import json
 import os
-from botocore.exceptions import ClientError
+from pipeline_common.batch_operations import BATCH_OPERATIONS_BACKEND, BatchMove, planned_backend, wait_fields
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import Deadline, resume_payload
+from pipeline_common.disposition import disposed_keys
+from pipeline_common.manifest import read_manifest_parts
+from pipeline_common.metrics import instrumented
+from pipeline_common.pipeline_state import SCANNED_DATA, advance_in_batches
+from pipeline_common.results import error_result, log_failures, summarize
+from pipeline_common.scan_cache import CLEAN, moved_verdict_recorder, open_scan_cache
+from pipeline_common.sharding import shard_items
 
 '''
 Move all files from scan stage bucket to the scanned data bucket. This function 
 is called when there are no sensitive data discovery findings from the Macie
 job.
 
+Above the S3 Batch Operations threshold, planShards selects the
+batchOperations backend and the objects are copied by an S3 Batch Operations
+job instead of by this function, which then polls the job and removes the
+copied sources.
+
+In the single-bucket layout, unless the objects are handed off to the
+scanned data bucket, both buckets are the raw bucket and the objects are
+only tagged with the scanned-data PipelineState (see
+pipeline_common.pipeline_state).
+
+Keys disposed of by disposeFindings are not in the scan stage anymore and
+are skipped.
+
 This proof of concept is used as part of a data pipeline workflow as part of
 the data ingestion pipeline. 
 '''
 
-s3_client = boto3.client('s3')
-    
+@instrumented('moveAllScanStageS3Files')
 def lambda_handler(event, context):
+    s3_client = get_client('s3')
+
     target_bucket_name = os.environ['targetS3Bucket']
     src_bucket_name = os.environ['sourceS3Bucket']
+    manifest_bucket_name = os.environ['manifestS3Bucket']
     
     prefix = event['Input']['id']
-    check_key = ''
 
-    try:
-        paginator = s3_client.get_paginator('list_objects_v2')
-        
-        page_iterator = paginator.paginate(
-            Bucket=src_bucket_name)
-        for page in page_iterator:
-            if ('Contents' in page):
-                s3_keys_remaining = page['Contents']
-            else:
-                s3_keys_remaining = []
-                
-            for s3_key_info in s3_keys_remaining:
-                object_tags = s3_client.get_object_tagging(
-                    Bucket=src_bucket_name,
-                    Key=s3_key_info['Key']
-                )
-                for tag_set in object_tags['TagSet']:
-                    if tag_set['Key'] == 'WorkflowId':
-                        check_key = tag_set['Value']
-                if check_key == prefix:
-                    response = s3_client.copy_object(
-                        Bucket = target_bucket_name,
-                        CopySource = {
-                            'Bucket': src_bucket_name,
-                            'Key': s3_key_info['Key']
-                        },
-                        Key = s3_key_info['Key']
-                    )
-                    response = s3_client.delete_object(
-                        Bucket=src_bucket_name,
-                        Key = s3_key_info['Key']
-                    )
-                    check_key = ''
-                else:
-                    print(f"Object tag not matching for {s3_key_info['Key']}")
+    previous = resume_payload(event, 'fileOperationResult')
 
-    except Exception as e:
-        print(f'Could not complete S3 object move')
-        print(e)
-        return
+    # Manifest records carry the object size used to pick the copy method
+    workflow_keys = lambda: (
+        record for record in shard_items(
+            read_manifest_parts(
+                manifest_bucket_name,
+                prefix,
+                s3_client = s3_client
+            ),
+            event['Input'].get('shard')
+        )
+        if record['key'] not in disposed
+    )
+    # Nothing was found, remember the staged objects as clean
+    record_clean = moved_verdict_recorder(open_scan_cache(), CLEAN)
 
-    return 
+    try:
+        disposed = disposed_keys(
+            event['Input']['macieFindingsInfo']['Payload'],
+            s3_client = s3_client
+        )
+        if planned_backend(event['Input'], 'stagedShardPlan') == BATCH_OPERATIONS_BACKEND:
+            move_result = BatchMove(
+                src_bucket_name,
+                target_bucket_name,
+                workflow_keys,
+                prefix,
+                'moveAllScanStageS3Files',
+                os.environ['accountId'],
+                manifest_bucket_name,
+                s3_client = s3_client,
+                after_batch = record_clean,
+                state = SCANNED_DATA
+            ).run(Deadline(context), previous['cursor'] if previous else None)
+        else:
+            move_result = advance_in_batches(
+                src_bucket_name,
+                target_bucket_name,
+                workflow_keys(),
+                SCANNED_DATA,
+                Deadline(context),
+                previous['cursor']['offset'] if previous else 0,
+                s3_client = s3_client,
+                after_batch = record_clean
+            )
+            move_result['cursor'] = {'offset': move_result['offset']}
+    except Exception as e:
+        return error_result(f'Could not move objects of workflow {prefix}', e)
+    log_failures('Could not complete S3 object move', move_result['failed'])
 
+    return summarize(
+        move_result['moved'],
+        move_result['failed'],
+        previous,
+        done = move_result['done'],
+        cursor = move_result['cursor'],
+        **wait_fields(move_result)
+    )
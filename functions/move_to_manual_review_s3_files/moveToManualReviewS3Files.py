@@ -0,0 +1,102 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from pipeline_common.batch_operations import BATCH_OPERATIONS_BACKEND, BatchMove, planned_backend, wait_fields
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import Deadline, resume_payload
+from pipeline_common.metrics import instrumented
+from pipeline_common.payload import finding_records
+from pipeline_common.pipeline_state import MANUAL_REVIEW, advance_in_batches
+from pipeline_common.results import error_result, log_failures, summarize
+from pipeline_common.sharding import shard_items
+
+'''
+Tag objects with sensitive data findings and move them from the scan stage
+bucket to the manual review bucket. This function is called before the
+manual approval notification is sent, once per shard when the findings are
+processed by a Map state. Above the S3 Batch Operations threshold the objects
+are copied and tagged by an S3 Batch Operations job (see
+moveAllScanStageS3Files). In the single-bucket layout the objects stay in
+place and are tagged with the manual-review PipelineState instead.
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+@instrumented('moveToManualReviewS3Files')
+def lambda_handler(event, context):
+    s3_client = get_client('s3')
+
+    target_bucket_name = os.environ['targetS3Bucket']
+    src_bucket_name = os.environ['sourceS3Bucket']
+
+    prefix = event['Input']['id']
+    s3_key_names = lambda: shard_items(
+        finding_records(
+            event['Input']['macieFindingsInfo']['Payload'],
+            s3_client = s3_client
+        ),
+        event['Input'].get('shard')
+    )
+
+    previous = resume_payload(event, 'reviewMoveResult')
+
+    # Tag sensitive objects as part of the copy to the manual review bucket,
+    # or in place
+    tags = {
+        'SensitiveDataFound': 'true',
+        'WorkflowId': prefix
+    }
+
+    try:
+        if planned_backend(event['Input'], 'findingsShardPlan') == BATCH_OPERATIONS_BACKEND:
+            move_result = BatchMove(
+                src_bucket_name,
+                target_bucket_name,
+                s3_key_names,
+                prefix,
+                'moveToManualReviewS3Files',
+                os.environ['accountId'],
+                os.environ['manifestS3Bucket'],
+                group_tags = lambda group: tags,
+                s3_client = s3_client,
+                state = MANUAL_REVIEW
+            ).run(Deadline(context), previous['cursor'] if previous else None)
+        else:
+            move_result = advance_in_batches(
+                src_bucket_name,
+                target_bucket_name,
+                s3_key_names(),
+                MANUAL_REVIEW,
+                Deadline(context),
+                previous['cursor']['offset'] if previous else 0,
+                tags = tags,
+                s3_client = s3_client
+            )
+            move_result['cursor'] = {'offset': move_result['offset']}
+    except Exception as e:
+        return error_result('Could not move objects to manual review', e)
+    log_failures('Could not complete S3 object move', move_result['failed'])
+
+    return summarize(
+        move_result['moved'],
+        move_result['failed'],
+        previous,
+        done = move_result['done'],
+        cursor = move_result['cursor'],
+        **wait_fields(move_result)
+    )
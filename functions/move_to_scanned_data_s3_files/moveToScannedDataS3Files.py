@@ -14,45 +14,94 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
-import boto3
-import json
 import os
-from botocore.exceptions import ClientError
+from pipeline_common.approvals import applied_decisions, undecided
+from pipeline_common.batch_operations import BATCH_OPERATIONS_BACKEND, BatchMove, planned_backend, wait_fields
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import Deadline, resume_payload
+from pipeline_common.metrics import instrumented
+from pipeline_common.payload import finding_records
+from pipeline_common.pipeline_state import SCANNED_DATA, advance_in_batches
+from pipeline_common.results import error_result, log_failures, summarize
+from pipeline_common.sharding import shard_items
 
 '''
 Move all files from scan stage bucket to the scanned data bucket. This function 
 is called when a manual approval was received from the manual approval step.
 
+Above the S3 Batch Operations threshold the objects are copied by an S3 Batch
+Operations job (see moveAllScanStageS3Files). In the single-bucket layout the
+objects are tagged with the scanned-data PipelineState in place unless they
+are handed off to the scanned data bucket. Files approved or denied one by
+one have already been released by applyApprovalDecisions and are skipped.
+
 This proof of concept is used as part of a data pipeline workflow as part of
 the data ingestion pipeline. 
 '''
 
-s3_client = boto3.client('s3')
-
+@instrumented('moveToScannedDataS3Files')
 def lambda_handler(event, context):
+    s3_client = get_client('s3')
+
     target_bucket_name = os.environ['targetS3Bucket']
     src_bucket_name = os.environ['sourceS3Bucket']
-    s3_key_names = event['Input']['macieFindingsInfo']['Payload']
+    s3_key_names = lambda: undecided(
+        shard_items(
+            finding_records(
+                event['Input']['macieFindingsInfo']['Payload'],
+                s3_client = s3_client
+            ),
+            event['Input'].get('shard')
+        ),
+        decisions
+    )
+
+    previous = resume_payload(event, 'fileOperationResult')
 
     try:
-        for s3_key_name in s3_key_names:
-            response = s3_client.copy_object(
-                Bucket = target_bucket_name,
-                CopySource = {
-                    'Bucket': src_bucket_name,
-                    'Key': s3_key_name
+        decisions = applied_decisions(
+            os.environ['manifestS3Bucket'],
+            event['Input']['id'],
+            s3_client = s3_client
+        )
+        if planned_backend(event['Input'], 'findingsShardPlan') == BATCH_OPERATIONS_BACKEND:
+            move_result = BatchMove(
+                src_bucket_name,
+                target_bucket_name,
+                s3_key_names,
+                event['Input']['id'],
+                'moveToScannedDataS3Files',
+                os.environ['accountId'],
+                os.environ['manifestS3Bucket'],
+                # The tags set by moveToManualReviewS3Files, as a tagging job
+                # replaces the tag set in the single-bucket layout
+                group_tags = lambda group: {
+                    'SensitiveDataFound': 'true',
+                    'WorkflowId': event['Input']['id']
                 },
-                Key = s3_key_name
-            )
-            response = s3_client.delete_object(
-                Bucket=src_bucket_name,
-                Key = s3_key_name
+                s3_client = s3_client,
+                state = SCANNED_DATA
+            ).run(Deadline(context), previous['cursor'] if previous else None)
+        else:
+            move_result = advance_in_batches(
+                src_bucket_name,
+                target_bucket_name,
+                s3_key_names(),
+                SCANNED_DATA,
+                Deadline(context),
+                previous['cursor']['offset'] if previous else 0,
+                s3_client = s3_client
             )
+            move_result['cursor'] = {'offset': move_result['offset']}
     except Exception as e:
-        print(f'Could not complete S3 object move')
-        print(e)
-        return
-
-    return 
+        return error_result('Could not move approved objects', e)
+    log_failures('Could not complete S3 object move', move_result['failed'])
 
+    return summarize(
+        move_result['moved'],
+        move_result['failed'],
+        previous,
+        done = move_result['done'],
+        cursor = move_result['cursor'],
+        **wait_fields(move_result)
+    )
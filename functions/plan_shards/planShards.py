@@ -0,0 +1,75 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from pipeline_common.batch_operations import BATCH_OPERATIONS_BACKEND, LAMBDA_BACKEND, use_batch_operations
+from pipeline_common.clients import get_client
+from pipeline_common.manifest import read_manifest_parts
+from pipeline_common.metrics import instrumented
+from pipeline_common.sharding import plan_shards
+
+'''
+Split the keys of a pipeline step into shards. The 'source' of the event is
+either 'staged' (every key in the workflow manifest) or 'findings' (the keys
+with Macie findings). When more than one shard is needed the state machine
+processes them in parallel with a Map state.
+
+Above the S3 Batch Operations threshold, the keys are moved by S3 Batch
+Operations jobs instead (see pipeline_common.batch_operations) and a single
+shard covering every key is returned with the 'batchOperations' backend.
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+@instrumented('planShards')
+def lambda_handler(event, context):
+    s3_client = get_client('s3')
+
+    manifest_bucket_name = os.environ['manifestS3Bucket']
+    shard_size = int(os.environ['shardSize'])
+
+    prefix = event['Input']['id']
+    source = event['source']
+
+    try:
+        if source == 'staged':
+            key_count = sum(1 for record in read_manifest_parts(
+                manifest_bucket_name,
+                prefix,
+                s3_client = s3_client
+            ))
+        else:
+            # Counted by getMacieFindingsCount, the keys may be in a manifest
+            key_count = event['Input']['macieFindingsInfo']['Payload']['findingsCount']
+    except Exception as e:
+        print(f'Could not count {source} keys for workflow {prefix}')
+        print(e)
+        return
+
+    if use_batch_operations(key_count):
+        backend = BATCH_OPERATIONS_BACKEND
+        shards = plan_shards(key_count, key_count)
+    else:
+        backend = LAMBDA_BACKEND
+        shards = plan_shards(key_count, shard_size)
+
+    return {
+        'sharded': len(shards) > 1,
+        'keyCount': key_count,
+        'shards': shards,
+        'backend': backend
+    }
@@ -14,44 +14,127 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
-import boto3
 import json
+import os
 from botocore.exceptions import ClientError
+from pipeline_common.approvals import load_approval_request, parse_decisions, put_decisions, secret_hash
+from pipeline_common.clients import get_client
+from pipeline_common.metrics import add_metric, instrumented
 
 '''
-Get number of findings from Macie classification job. 
+Receive the decision of a reviewer on the manual approval of a workflow.
+
+GET /allow and /deny decide every file of the workflow, or only the files
+given with one or more 'key' or 'prefix' query parameters. POST /decisions
+takes a JSON body with the 'id', the 'token' and a list of 'decisions', each
+with an 'action' ('allow' or 'deny') and an optional 'key' or 'prefix', so
+several decisions can be sent in one request.
+
+The decisions are appended to the approval decision log of the workflow, and
+the task token waiting for them is then read again and completed (see
+pipeline_common.approvals).
+When the state machine is still applying earlier decisions no token is
+waiting, and the decisions are picked up by the next wait. Links without an
+'id', as sent before per-file decisions, complete their task token with a
+batch-wide decision directly.
 
 This proof of concept is used as part of a data pipeline workflow as part of
 the data ingestion pipeline. 
 '''
 
-step_function_client = boto3.client('stepfunctions')
+def response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body),
+        'headers': {
+            'Content-Type': 'application/json'
+        }
+    }
+
+def parse_request(event):
+    if event['requestContext']['resourcePath'] == '/decisions':
+        body = json.loads(event.get('body') or '{}')
+        decisions = []
+        for decision in body.get('decisions') or [{'action': body.get('action')}]:
+            decisions.extend(parse_decisions(
+                decision.get('action'),
+                [decision['key']] if 'key' in decision else None,
+                [decision['prefix']] if 'prefix' in decision else None
+            ))
+        return body.get('id'), body.get('token'), decisions
 
-def lambda_handler(event, context):    
     if event['requestContext']['resourcePath'] == '/allow':
         next_action = 'allow'
     else:
         next_action = 'delete'
+    parameters = event.get('queryStringParameters') or {}
+    multi_parameters = event.get('multiValueQueryStringParameters') or {}
 
-    task_token = event['queryStringParameters']['token']
+    return parameters.get('id'), parameters.get('token'), parse_decisions(
+        next_action,
+        multi_parameters.get('key', [parameters['key']] if 'key' in parameters else None),
+        multi_parameters.get('prefix', [parameters['prefix']] if 'prefix' in parameters else None)
+    )
+
+@instrumented('receiveApprovalDecisionAPI')
+def lambda_handler(event, context):    
+    step_function_client = get_client('stepfunctions')
+    s3_client = get_client('s3')
+
+    try:
+        workflow_id, task_token, decisions = parse_request(event)
+    except ValueError as e:
+        return response(400, {'error': str(e)})
+    if not task_token:
+        return response(400, {'error': 'token is required'})
     task_token_clean = task_token.replace(" ", "+")
 
+    if not workflow_id:
+        next_action = decisions[0]['action']
+        try:
+            step_function_client.send_task_success(
+                taskToken = task_token_clean,
+                output = json.dumps({'action': next_action})
+            )
+        except Exception as e:
+            print(f'Could not send task success with token {task_token_clean}')
+            print(e)
+            return
+
+        return response(200, {'action': next_action})
+
+    manifest_bucket_name = os.environ['manifestS3Bucket']
     try:
-        response = step_function_client.send_task_success(
-            taskToken = task_token_clean,
-            output = f'{{"action": "{next_action}"}}'
-        )
+        request = load_approval_request(manifest_bucket_name, workflow_id, s3_client)
     except Exception as e:
-        print(f'Could not send task success with token {task_token_clean}')
+        print(f'Could not read approval request of workflow {workflow_id}')
         print(e)
         return
+    if request is None or request['secretHash'] != secret_hash(task_token_clean):
+        return response(403, {'error': f'No approval pending for workflow {workflow_id}'})
 
-    return {
-        'statusCode': 200,
-        'body': json.dumps({'action': next_action}),
-        'headers': {
-            'Content-Type': 'application/json'
-        }
-    }
-    
\ No newline at end of file
+    try:
+        put_decisions(manifest_bucket_name, workflow_id, decisions, s3_client)
+    except Exception as e:
+        print(f'Could not record approval decisions of workflow {workflow_id}')
+        print(e)
+        return
+    add_metric('ApprovalDecisions', len(decisions))
+
+    # A wait that started while the decisions were written saved a new token
+    try:
+        request = load_approval_request(manifest_bucket_name, workflow_id, s3_client)
+        if request is not None:
+            step_function_client.send_task_success(
+                taskToken = request['token'],
+                output = json.dumps({'action': 'decided'})
+            )
+    except ClientError as e:
+        # The decisions are applied by the next wait for decisions
+        print(f'No task waiting for decisions of workflow {workflow_id}')
+        print(e)
+
+    return response(200, {
+        'workflowId': workflow_id,
+        'decisions': decisions
+    })
@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from pipeline_common.clients import get_client
+from pipeline_common.job_waits import ACTIVE_JOB_STATUSES, pop_job_wait, release_job_wait, save_job_wait
+from pipeline_common.metrics import instrumented
+from pipeline_common.scan_jobs import job_ids
+
+'''
+Register the task token of an execution waiting for its Macie classification
+jobs. The token is saved for every job that was still active at the last
+status check, and resumeMacieJobWait completes it when Macie logs that one
+of them finished; checkMacieStatus then decides whether to wait again. The
+job status is checked again after the token is saved, so a job that finished
+before the registration does not leave the execution waiting. Once the
+token is completed, the copies saved for the other jobs are stale;
+resumeMacieJobWait logs the failure to complete them and drops them.
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+@instrumented('registerMacieJobWait')
+def lambda_handler(event, context):
+    macie_client = get_client('macie2')
+    s3_client = get_client('s3')
+
+    manifest_bucket_name = os.environ['manifestS3Bucket']
+
+    task_token = event['token']
+    scan_job_ids = job_ids(event['Input']['jobId']['Payload'])
+    try:
+        statuses = event['Input']['jobStatus']['Payload']['jobStatuses']
+        scan_job_ids = [
+            scan_job_id for scan_job_id in scan_job_ids
+            if statuses.get(scan_job_id) in ACTIVE_JOB_STATUSES
+        ] or scan_job_ids
+    except (KeyError, TypeError):
+        pass
+
+    try:
+        for scan_job_id in scan_job_ids:
+            save_job_wait(manifest_bucket_name, scan_job_id, task_token, s3_client)
+        jobs = [
+            macie_client.describe_classification_job(jobId = scan_job_id)
+            for scan_job_id in scan_job_ids
+        ]
+    except Exception as e:
+        print(f'Could not register wait for jobIds {scan_job_ids}')
+        print(e)
+        # The state machine falls back to checking the job status
+        try:
+            get_client('stepfunctions').send_task_failure(
+                taskToken = task_token,
+                error = 'JobWaitRegistrationFailed',
+                cause = str(e)[:32768]
+            )
+        except Exception as e:
+            print('Could not send task failure')
+            print(e)
+        return
+
+    job_statuses = {
+        scan_job_id: job['jobStatus']
+        for scan_job_id, job in zip(scan_job_ids, jobs)
+    }
+    finished = [
+        (scan_job_id, job_status) for scan_job_id, job_status in job_statuses.items()
+        if job_status not in ACTIVE_JOB_STATUSES
+    ]
+    if finished:
+        # A job finished before the token was saved. A missing token means
+        # resumeMacieJobWait already completed it.
+        waiting_tokens = [
+            pop_job_wait(manifest_bucket_name, scan_job_id, s3_client)
+            for scan_job_id in scan_job_ids
+        ]
+        if all(waiting_tokens):
+            release_job_wait(
+                task_token,
+                finished[0][0],
+                finished[0][1],
+                get_client('stepfunctions')
+            )
+
+    return {
+        'jobIds': scan_job_ids,
+        'jobStatuses': job_statuses
+    }
@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import os
+import base64
+import gzip
+from pipeline_common.clients import get_client
+from pipeline_common.job_waits import FINAL_JOB_EVENTS, pop_job_wait, release_job_wait
+from pipeline_common.metrics import instrumented
+
+'''
+Resume executions waiting for a Macie classification job. Invoked by a
+CloudWatch Logs subscription on the Macie classification job log group, it
+completes the task token registered by registerMacieJobWait when Macie logs
+that the job completed or was cancelled.
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+def job_events(event):
+    data = json.loads(gzip.decompress(base64.b64decode(event['awslogs']['data'])))
+
+    for log_event in data.get('logEvents', []):
+        try:
+            message = json.loads(log_event['message'])
+        except ValueError:
+            continue
+        if message.get('eventType') in FINAL_JOB_EVENTS and message.get('jobId'):
+            yield message['jobId'], message['eventType']
+
+@instrumented('resumeMacieJobWait')
+def lambda_handler(event, context):
+    s3_client = get_client('s3')
+    sfn_client = get_client('stepfunctions')
+
+    manifest_bucket_name = os.environ['manifestS3Bucket']
+
+    released = []
+    for job_id, job_event in job_events(event):
+        try:
+            task_token = pop_job_wait(manifest_bucket_name, job_id, s3_client)
+            if task_token:
+                release_job_wait(task_token, job_id, job_event, sfn_client)
+                released.append(job_id)
+        except Exception as e:
+            # The execution falls back to checking the job status on timeout
+            print(f'Could not resume wait for jobId {job_id}')
+            print(e)
+
+    return {'released': released}
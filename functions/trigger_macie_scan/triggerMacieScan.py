@@ -14,12 +14,25 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
-import boto3
-import json
 import datetime
 import os
-from botocore.exceptions import ClientError
+import time
+from itertools import islice
+from pipeline_common.batch_operations import BatchMove, batch_operations_enabled, use_batch_operations
+from pipeline_common.claims import claim_objects, claims_enabled, open_claim_store, release_objects
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import DEFAULT_BATCH_SIZE, Deadline, resume_payload, run_batches
+from pipeline_common.listing import ParallelLister, inventory_enabled, inventory_pages, not_found
+from pipeline_common.manifest import manifest_key, manifest_part_keys, read_manifest, read_manifest_parts, staged_records, write_manifest
+from pipeline_common.metrics import add_metric, instrumented
+from pipeline_common.pipeline_state import PIPELINE_STATE_TAG, SCANNED_DATA, SCAN_STAGE, advance_objects, drop_settled, in_place, load_settled_before, save_settled_before
+from pipeline_common.pre_classifier import CLEAN, PRE_CLASSIFIED_TAG, open_pre_classifier
+from pipeline_common.results import log_failures
+from pipeline_common.s3_move import object_key, object_size
+from pipeline_common.scan_cache import open_scan_cache, split_cached_clean
+from pipeline_common.scan_jobs import SCAN_SHARD_TAG, ScanShardPlanner
+from pipeline_common.scan_scope import EXCLUDED_SHARD, SCAN_EXCLUDED_TAG, exclusion_scope, split_excluded
+from pipeline_common.tracing import subsegment
 
 '''
 Perform a sensitive data discovery scan using Amazon Macie based on scheduled
@@ -27,19 +40,197 @@ execution of Amazon EventBridge event.
 
 This proof of concept is used as part of a data pipeline workflow as part of
 the data ingestion pipeline. 
+
+The raw bucket is listed as concurrent key ranges (see
+pipeline_common.listing), or read from its latest S3 Inventory report when
+one is configured. Staging stops before the Lambda deadline. The function then
+returns the listing cursor and the state machine invokes it again; the
+classification job is created once the listing is complete. Objects an
+inventory report still lists but that were moved since are skipped.
+
+Objects whose content already has a recent CLEAN verdict in the scan cache
+are moved straight to the scanned data bucket and never reach the scan stage
+bucket, so the classification job does not scan them again.
+
+Executions started by batchRawObjectEvents carry a 'batch' pointer to a
+manifest of the raw keys to stage. Only those keys are moved, and the cursor
+is an offset into that manifest instead of a listing continuation token.
+
+Large batches are split into scan shards balanced by size and file type
+(see pipeline_common.scan_jobs). Each shard is tagged with its ScanShard
+value and scanned by its own classification job, and all jobs run
+concurrently.
+
+When S3 Batch Operations are enabled, the listing only records the objects to
+stage, with their scan shard, in a 'pending' manifest. Once the listing is
+complete and the number of objects is known, they are staged by one S3 Batch
+Operations copy job per scan shard above the threshold, or by this function
+otherwise (see pipeline_common.batch_operations).
+
+When object claims are enabled, each page of raw keys is claimed for the
+workflow before it is staged, and keys claimed by an overlapping execution
+are left to that execution (see pipeline_common.claims). The claims are
+released once the staged keys are recorded in the workflow manifest.
+
+Objects matching the pre-scan scoping rules, such as empty objects, _SUCCESS
+markers or media files, are staged with a ScanExcluded tag instead of a scan
+shard and excluded from the classification jobs (see
+pipeline_common.scan_scope). The result reports their number and bytes.
+
+When the pre-classifier is enabled, small plain text objects are first read
+and searched for common PII patterns in this function (see
+pipeline_common.pre_classifier). Objects without a match are tagged
+PreClassified and moved straight to the scanned data bucket; a batch whose
+objects are all cleared this way needs no classification job.
+
+In the single-bucket layout the scan stage bucket is the raw bucket. Objects
+are then staged in place by setting their PipelineState tag (see
+pipeline_common.pipeline_state), objects that are already further along the
+pipeline are skipped, and the classification jobs are also scoped on the
+scan-stage state. Staging in place always runs in this function, since S3
+Batch Operations tagging jobs cannot check the current state. Listed objects
+last modified before the last sweep that settled every raw object are
+dropped before they are claimed or tagged; a sweep that leaves no raw object
+behind records its own start time for the next one.
 '''
 
-macie_client = boto3.client('macie2')
-s3_client = boto3.client('s3')
-paginator = s3_client.get_paginator('list_objects_v2')
-    
+PENDING_MANIFEST = 'pending'
+
+# Attempts at creating the classification jobs before the execution fails
+JOB_CREATION_ATTEMPTS = 3
+JOB_CREATION_RETRY_SECONDS = 60
+
+def scan_job_scope(prefix, shard=None, state=None):
+    tag_values = [('WorkflowId', prefix)]
+    if shard is not None:
+        tag_values.append((SCAN_SHARD_TAG, str(shard)))
+    if state is not None:
+        tag_values.append((PIPELINE_STATE_TAG, state))
+
+    return {
+        'includes': {
+            'and': [
+                {
+                    'tagScopeTerm': {
+                        'comparator': 'EQ',
+                        'key': 'TAG',
+                        'tagValues': [{'key': key, 'value': value}],
+                        'target': 'S3_OBJECT'
+                    }
+                }
+                for key, value in tag_values
+            ]
+        },
+        'excludes': exclusion_scope()
+    }
+
+def staging_tags(prefix, shard):
+    if shard == EXCLUDED_SHARD:
+        return {'WorkflowId': prefix, SCAN_EXCLUDED_TAG: 'true'}
+    return {'WorkflowId': prefix, SCAN_SHARD_TAG: str(shard)}
+
+def batch_pages(batch_records, cursor):
+    while True:
+        contents = list(islice(batch_records, DEFAULT_BATCH_SIZE))
+        cursor = {'offset': cursor['offset'] + len(contents)}
+        last_page = len(contents) < DEFAULT_BATCH_SIZE
+        yield contents, cursor, last_page
+        if last_page:
+            return
+
+def sweeps_settled_objects(upload_bucket_name, scan_bucket_name, batch):
+    # Only a listing of the whole bucket in the single-bucket layout can tell
+    # that every raw object older than its start was settled
+    return (in_place(upload_bucket_name, scan_bucket_name) and not batch
+        and not inventory_enabled())
+
+def staging_failures(failures):
+    # An inventory report still lists the objects moved since it was written,
+    # and a listing the objects another execution staged since it was read
+    if inventory_enabled() or claims_enabled():
+        return [failure for failure in failures if not not_found(failure)]
+    return failures
+
+def pending_records(key_data_list, shard):
+    return [
+        {
+            'key': key_data['Key'],
+            'size': key_data.get('Size', 0),
+            'etag': key_data.get('ETag'),
+            'checksumSha256': key_data.get('ChecksumSHA256'),
+            'shard': shard,
+            'excluded': key_data.get('excluded')
+        }
+        for key_data in key_data_list
+    ]
+
+def stage_pending(upload_bucket_name, scan_bucket_name, manifest_bucket_name,
+        prefix, acct_id, pending_manifest, pending_count, staging_cursor,
+        deadline, staged, s3_client):
+    '''
+    Stage the objects of the pending manifest, appending the staged records
+    to staged. Returns whether staging is done, the cursor to resume from and
+    the seconds to wait while a copy job runs.
+    '''
+    pending = lambda: read_manifest_parts(
+        manifest_bucket_name, prefix, pending_manifest, s3_client = s3_client)
+    shard_tags = lambda shard: staging_tags(prefix, shard)
+
+    if use_batch_operations(pending_count) and not in_place(
+            upload_bucket_name, scan_bucket_name):
+        move_result = BatchMove(
+            upload_bucket_name,
+            scan_bucket_name,
+            pending,
+            prefix,
+            pending_manifest,
+            acct_id,
+            manifest_bucket_name,
+            group_of = lambda record: str(record['shard']),
+            group_tags = shard_tags,
+            s3_client = s3_client,
+            after_batch = lambda batch, batch_result: staged.extend(
+                staged_records(batch, batch_result))
+        ).run(deadline, staging_cursor)
+        log_failures('Could not move S3 objects to scan bucket', staging_failures(move_result['failed']))
+
+        return move_result['done'], move_result['cursor'], move_result.get('waitSeconds')
+
+    def stage_batch(batch):
+        shard_records = {}
+        for record in batch:
+            shard_records.setdefault(record['shard'], []).append(record)
+        for shard, records in sorted(shard_records.items(), key = lambda item: str(item[0])):
+            move_result = advance_objects(
+                upload_bucket_name,
+                scan_bucket_name,
+                records,
+                SCAN_STAGE,
+                tags = shard_tags(shard),
+                s3_client = s3_client
+            )
+            log_failures('Could not move S3 objects to scan bucket', staging_failures(move_result['failed']))
+            staged.extend(staged_records(records, move_result))
+
+    offset, done = run_batches(
+        pending(), stage_batch, deadline, (staging_cursor or {}).get('offset', 0))
+
+    return done, {'offset': offset}, None
+
+@instrumented('triggerMacieScan')
 def lambda_handler(event, context):
+    macie_client = get_client('macie2')
+    s3_client = get_client('s3')
+
     acct_id = os.environ['accountId']
     upload_bucket_name = os.environ['rawS3Bucket']
     scan_bucket_name = os.environ['scanS3Bucket']
+    manifest_bucket_name = os.environ['manifestS3Bucket']
+    scanned_bucket_name = os.environ['scannedS3Bucket']
+    scan_cache = open_scan_cache()
+    claim_store = open_claim_store()
 
     date_time = datetime.datetime.now().strftime("%Y-%m-%d-%H%M%S%Z")
-    keys_found = False
 
     try:
         prefix = event['Input']['id']
@@ -48,85 +239,343 @@ def lambda_handler(event, context):
         print(e)
         return  
 
-    try:
-        # Check if upload bucket contains objects
-        page_iterator = paginator.paginate(
-            Bucket=upload_bucket_name
+    batch = event['Input'].get('batch')
+
+    finished = event['Input'].get('jobId', {}).get('Payload')
+    if isinstance(finished, dict) and finished.get('done') is True:
+        # The jobs of this workflow were created already, never create them twice
+        return finished
+
+    previous = resume_payload(event, 'jobId')
+    if previous:
+        cursor = previous['cursor']
+        staged_count = previous['stagedCount']
+        staged_bytes = previous.get('stagedBytes', 0)
+        cached_clean_count = previous.get('cachedCleanCount', 0)
+        excluded_count = previous.get('excludedCount', 0)
+        pre_classified_count = previous.get('preClassifiedCleanCount', 0)
+        excluded_bytes = previous.get('excludedBytes', 0)
+        manifest_part = previous['manifestParts']
+        planner = ScanShardPlanner(previous.get('scanShardLoads'))
+        deferred = previous.get('deferredStaging', False)
+        pending_manifest = previous.get('pendingManifest')
+        pending_count = previous.get('pendingCount', 0)
+        pending_part = previous.get('pendingParts', 0)
+        staging_cursor = previous.get('stagingCursor')
+        sweep_started = previous.get('sweepStartedAt')
+        settled_before = previous.get('settledBefore')
+        unsettled_count = previous.get('unsettledCount', 0)
+        # Set once every object is staged and the jobs are being created
+        created_job_ids = previous.get('createdJobIds')
+        job_attempts = previous.get('jobAttempts', 0)
+    else:
+        cursor = {'offset': 0} if batch else {}
+        staged_count = 0
+        staged_bytes = 0
+        cached_clean_count = 0
+        excluded_count = 0
+        excluded_bytes = 0
+        pre_classified_count = 0
+        planner = ScanShardPlanner(total_bytes = batch['bytes'] if batch else None)
+        # Staging in place never runs as an S3 Batch Operations job
+        deferred = batch_operations_enabled() and not in_place(
+            upload_bucket_name, scan_bucket_name)
+        # Named per attempt, so parts of an earlier attempt are never read
+        pending_manifest = f'{PENDING_MANIFEST}-{date_time}'
+        pending_count = 0
+        pending_part = 0
+        staging_cursor = None
+        created_job_ids = None
+        job_attempts = 0
+        sweep_started = time.time()
+        settled_before = None
+        unsettled_count = 0
+        try:
+            # Never overwrite parts written by an earlier attempt of this workflow
+            manifest_part = len(manifest_part_keys(
+                manifest_bucket_name, prefix, s3_client = s3_client))
+            if sweeps_settled_objects(upload_bucket_name, scan_bucket_name, batch):
+                settled_before = load_settled_before(manifest_bucket_name, s3_client)
+        except Exception as e:
+            print(f'Could not list manifest for workflow {prefix}')
+            print(e)
+            return
+    deadline = Deadline(context)
+    staged = []
+    # Keys claimed by this workflow that are no longer raw
+    settled = []
+    # Raw keys this invocation listed but left raw
+    unsettled = []
+    pre_classifier = open_pre_classifier(upload_bucket_name, s3_client)
+
+    def move_clean(key_data_list, tags, message):
+        # Clean objects skip the scan stage and go straight to scanned data
+        clean_result = advance_objects(
+            upload_bucket_name,
+            scanned_bucket_name,
+            key_data_list,
+            SCANNED_DATA,
+            tags = dict(tags, WorkflowId = prefix),
+            s3_client = s3_client
         )
+        failures = staging_failures(clean_result['failed'])
+        log_failures(message, failures)
+        settled.extend(clean_result['moved'] + clean_result.get('skipped', []))
+        unsettled.extend(failure['key'] for failure in failures)
+        return len(clean_result['moved'])
 
-        for page in page_iterator:
-            # Move objects to scan bucket
-            if 'Contents' in page: 
-                for key_data in page['Contents']:
-                    keys_found = True
-    
-                    response = s3_client.copy_object(
-                        Bucket = scan_bucket_name,
-                        CopySource = {
-                            'Bucket': upload_bucket_name,
-                            'Key': key_data['Key']
-                        },
-                        Key = key_data['Key']
-                    )
-    
-                    response = s3_client.delete_object(
-                        Bucket=upload_bucket_name,
-                        Key = key_data['Key']
-                    )
-    
-                    response = s3_client.put_object_tagging(
-                        Bucket = scan_bucket_name,
-                        Key = key_data['Key'],
-                        Tagging = {
-                            'TagSet': [
-                                {
-                                    'Key': 'WorkflowId',
-                                    'Value': prefix
-                                }
-                            ]
-                        }
+    pending = []
+    creating_jobs = created_job_ids is not None
+    # The staging cursor is only set once the listing is complete
+    listing_done = creating_jobs or staging_cursor is not None
+    listing_failed = False
+    staging_done = creating_jobs or not deferred
+    wait_seconds = None
+
+    try:
+        if batch:
+            batch_records = islice(
+                read_manifest(batch['bucket'], batch['key'], s3_client),
+                cursor['offset'],
+                None
+            )
+            pages = batch_pages(batch_records, cursor)
+        elif inventory_enabled():
+            pages = inventory_pages(upload_bucket_name, cursor, s3_client = s3_client)
+        else:
+            pages = ParallelLister(upload_bucket_name, s3_client).pages(cursor)
+
+        # Move objects to scan bucket page by page while time remains
+        while not listing_done and not deadline.expired():
+            started = time.monotonic()
+            with subsegment('listObjects'):
+                page_contents, cursor, last_page = next(pages)
+            if settled_before is not None:
+                listed_count = len(page_contents)
+                page_contents = drop_settled(page_contents, settled_before)
+                add_metric('SettledObjectsDropped', listed_count - len(page_contents))
+            # Keys claimed by another execution are left to it
+            claimed = claim_objects(
+                claim_store, upload_bucket_name, page_contents, prefix)
+            if len(claimed) < len(page_contents):
+                claimed_keys = set(object_key(key_data) for key_data in claimed)
+                unsettled.extend(
+                    object_key(key_data) for key_data in page_contents
+                    if object_key(key_data) not in claimed_keys)
+            page_contents = claimed
+
+            cached_clean, contents = split_cached_clean(
+                scan_cache, upload_bucket_name, page_contents, s3_client,
+                listed = not batch)
+            if cached_clean:
+                moved_count = move_clean(
+                    cached_clean, {}, 'Could not move cached clean S3 objects')
+                cached_clean_count += moved_count
+                add_metric('CachedCleanObjects', moved_count)
+
+            # Objects Macie need not scan are staged without a scan shard
+            excluded, contents = split_excluded(upload_bucket_name, contents, s3_client)
+
+            if pre_classifier is not None:
+                pre_classified_clean, contents = pre_classifier.split_clean(contents)
+                if pre_classified_clean:
+                    pre_classified_count += move_clean(
+                        pre_classified_clean,
+                        {PRE_CLASSIFIED_TAG: CLEAN},
+                        'Could not move pre-classified clean S3 objects'
                     )
+            shard_contents = {EXCLUDED_SHARD: excluded} if excluded else {}
+            for key_data in contents:
+                shard = planner.assign(object_key(key_data), object_size(key_data))
+                shard_contents.setdefault(shard, []).append(key_data)
+
+            for shard, key_data_list in sorted(shard_contents.items(), key = lambda item: str(item[0])):
+                if deferred:
+                    # Staged once the listing is complete
+                    pending.extend(pending_records(key_data_list, shard))
+                    continue
+                # Tag objects with the workflow id and scan shard as part of the copy
+                move_result = advance_objects(
+                    upload_bucket_name,
+                    scan_bucket_name,
+                    key_data_list,
+                    SCAN_STAGE,
+                    tags = staging_tags(prefix, shard),
+                    s3_client = s3_client
+                )
+                failures = staging_failures(move_result['failed'])
+                log_failures('Could not move S3 objects to scan bucket', failures)
+                staged.extend(staged_records(key_data_list, move_result))
+                settled.extend(move_result.get('skipped', []))
+                unsettled.extend(failure['key'] for failure in failures)
+
+            deadline.record_step(started)
+            if last_page:
+                listing_done = True
+                break
+        # Stops the listing threads of pages fetched ahead
+        pages.close()
+
+        if pending:
+            write_manifest(
+                manifest_bucket_name,
+                manifest_key(prefix, pending_manifest, pending_part),
+                pending,
+                s3_client = s3_client
+            )
+            pending_count += len(pending)
+            pending_part += 1
+
+        if deferred and listing_done and not staging_done:
+            staging_done, staging_cursor, wait_seconds = stage_pending(
+                upload_bucket_name,
+                scan_bucket_name,
+                manifest_bucket_name,
+                prefix,
+                acct_id,
+                pending_manifest,
+                pending_count,
+                staging_cursor,
+                deadline,
+                staged,
+                s3_client
+            )
     except Exception as e:
         print('Could not retrieve S3 contents')
         print(e)
-        return    
+        listing_failed = True
+
+    # Record the staged keys so later steps never list the scan bucket
+    if staged:
+        try:
+            write_manifest(
+                manifest_bucket_name,
+                manifest_key(prefix, part = manifest_part),
+                staged,
+                s3_client = s3_client
+            )
+        except Exception as e:
+            print(f'Could not write manifest for workflow {prefix}')
+            print(e)
+            return
+        staged_count += len(staged)
+        staged_bytes += sum(record['size'] for record in staged)
+        excluded_count += sum(1 for record in staged if record.get('excluded'))
+        excluded_bytes += sum(record['size'] for record in staged if record.get('excluded'))
+        manifest_part += 1
+        add_metric('ObjectsStaged', len(staged))
+        add_metric('BytesStaged', sum(record['size'] for record in staged))
+
+    release_objects(
+        claim_store,
+        upload_bucket_name,
+        settled + [record['key'] for record in staged],
+        prefix
+    )
 
-    # Create sensitive data discovery job if upload bucket is not empty
+    if listing_failed:
+        return
+
+    unsettled_count += len(unsettled)
+    if (listing_done and staging_done and not creating_jobs and not unsettled_count
+            and sweeps_settled_objects(upload_bucket_name, scan_bucket_name, batch)):
+        try:
+            save_settled_before(manifest_bucket_name, sweep_started, s3_client)
+        except Exception as e:
+            # The next sweep checks the state of every listed object
+            print('Could not record settled raw objects')
+            print(e)
+
+    counts = {
+        'stagedCount': staged_count,
+        'stagedBytes': staged_bytes,
+        'cachedCleanCount': cached_clean_count,
+        'excludedCount': excluded_count,
+        'excludedBytes': excluded_bytes,
+        'preClassifiedCleanCount': pre_classified_count,
+        'scanShardLoads': planner.loads,
+        'manifestParts': manifest_part
+    }
+
+    if not listing_done or not staging_done:
+        result = dict(
+            counts,
+            done = False,
+            cursor = cursor,
+            deferredStaging = deferred,
+            pendingManifest = pending_manifest,
+            pendingCount = pending_count,
+            pendingParts = pending_part,
+            stagingCursor = staging_cursor if listing_done else None
+        )
+        if sweeps_settled_objects(upload_bucket_name, scan_bucket_name, batch):
+            result.update(
+                sweepStartedAt = sweep_started,
+                settledBefore = settled_before,
+                unsettledCount = unsettled_count
+            )
+        if wait_seconds is not None:
+            result['waitSeconds'] = wait_seconds
+        return result
+
+    # Parts from earlier attempts of this workflow are scanned as well
+    keys_found = manifest_part > 0
+
+    # Objects staged by an earlier attempt without shard loads are scanned by
+    # a single job scoped on the workflow id only
+    shards = [shard for shard, load in enumerate(planner.loads) if load > 0]
+    if not shards:
+        shards = [None]
+
+    # Objects staged in place share the raw bucket with objects in other states
+    scan_state = SCAN_STAGE if in_place(upload_bucket_name, scan_bucket_name) else None
+
+    # Create one sensitive data discovery job per scan shard if objects were
+    # staged. Shards with a job created by an earlier attempt are skipped.
+    job_ids = list(created_job_ids or [])
     try:
         if keys_found == True:
-            response = macie_client.create_classification_job(
-                description = 'File upload scan',
-                initialRun = True,
-                jobType = 'ONE_TIME',
-                name = f'PipelineScan-{date_time}',
-                s3JobDefinition = {
-                    'bucketDefinitions': [{
-                        'accountId': acct_id, 
-                        'buckets': [scan_bucket_name]
-                    }],
-                    'scoping': {
-                        'includes': {
-                            'and': [{
-                                'tagScopeTerm': {
-                                    'comparator': 'EQ',
-                                    'key': 'TAG',
-                                    'tagValues': [{
-                                            'key': 'WorkflowId',
-                                            'value': prefix
-                                    }],
-                                    'target': 'S3_OBJECT'
-                                }
-                            }]
-                        }
+            for shard in shards[len(job_ids):]:
+                response = macie_client.create_classification_job(
+                    description = 'File upload scan',
+                    initialRun = True,
+                    jobType = 'ONE_TIME',
+                    name = f'PipelineScan-{date_time}' + (
+                        f'-{shard}' if shard is not None else ''),
+                    s3JobDefinition = {
+                        'bucketDefinitions': [{
+                            'accountId': acct_id, 
+                            'buckets': [scan_bucket_name]
+                        }],
+                        'scoping': scan_job_scope(prefix, shard, scan_state)
                     }
-                }
-            )
+                )
+                job_ids.append(response['jobId'])
+                add_metric('ScanJobsCreated')
     except Exception as e:
         print(f'Could not scan bucket {scan_bucket_name}')
         print(e)
-        return
+        if job_attempts + 1 >= JOB_CREATION_ATTEMPTS:
+            return
+        # Keep the jobs created so far and retry the remaining shards
+        return dict(
+            counts,
+            done = False,
+            cursor = cursor,
+            createdJobIds = job_ids,
+            jobAttempts = job_attempts + 1,
+            waitSeconds = JOB_CREATION_RETRY_SECONDS
+        )
 
     if keys_found == True:
-        return response['jobId']
+        job_id = job_ids[0]
     else:
-        return 'NoKeysFound'
+        job_id = 'NoKeysFound'
+
+    return dict(
+        counts,
+        done = True,
+        jobId = job_id,
+        jobIds = job_ids
+    )
+
@@ -14,122 +14,195 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
-import boto3
 import json
 import os
-from botocore.exceptions import ClientError
+from pipeline_common.approvals import applied_count, decision_log_keys, save_approval_request
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import Deadline
+from pipeline_common.disposition import disposed_keys
+from pipeline_common.manifest import read_manifest_parts
+from pipeline_common.metrics import instrumented
+from pipeline_common.payload import finding_keys
+from pipeline_common.pipeline_state import SCANNED_DATA, advance_in_batches
+from pipeline_common.results import error_result, log_failures, summarize
+from pipeline_common.scan_cache import CLEAN, moved_verdict_recorder, open_scan_cache
 
 '''
-Tag all objects and move to the manual review S3 bucket if sensitive data 
-found. Move files to the scanned data S3 bucket if no sensitive data found. 
-Trigger a manual approval notification to SNS topic if sensitive data is 
-found.
+Move files to the scanned data S3 bucket if no sensitive data found. Objects
+with sensitive data have already been tagged and moved to the manual review
+S3 bucket by moveToManualReviewS3Files. Trigger a manual approval
+notification to SNS topic if sensitive data is found. In the single-bucket
+layout the files without findings are tagged scanned-data in place instead of
+being moved, unless they are handed off to the scanned data bucket.
+
+When the moves do not fit in one invocation the task token is completed with
+a 'continue' action and a cursor, and the state machine invokes this function
+again to resume. The notification is only sent by the final invocation. It
+lists the files when the findings keys are passed inline and otherwise
+points to the findings manifest.
+
+The links of the notification can decide single files or prefixes (see
+pipeline_common.approvals). Once applyApprovalDecisions has released the
+decided files, this function is invoked again to wait for the decisions on
+the remaining files: it only saves its new task token for
+receiveApprovalDecisionAPI, or completes it right away when decisions
+arrived in the meantime.
 
 This proof of concept is used as part of a data pipeline workflow as part of
 the data ingestion pipeline. 
 '''
 
-sns_client = boto3.client('sns')
-s3_client = boto3.client('s3')
-step_function_client = boto3.client('stepfunctions')
+def fail_task(task_token, result):
+    # Release the waiting state machine instead of leaving it to time out
+    try:
+        get_client('stepfunctions').send_task_failure(
+            taskToken = task_token,
+            error = 'S3ObjectMoveFailed',
+            cause = json.dumps(result)[:32768]
+        )
+    except Exception as e:
+        print('Could not send task failure')
+        print(e)
+
+    return result
+
+def wait_for_decisions(manifest_bucket_name, prefix, task_token, s3_client):
+    try:
+        save_approval_request(manifest_bucket_name, prefix, task_token, s3_client)
+        pending = len(decision_log_keys(manifest_bucket_name, prefix, s3_client)) \
+            > applied_count(manifest_bucket_name, prefix, s3_client)
+        if pending:
+            get_client('stepfunctions').send_task_success(
+                taskToken = task_token,
+                output = json.dumps({'action': 'decided'})
+            )
+    except Exception as e:
+        return fail_task(
+            task_token,
+            error_result(f'Could not wait for decisions of workflow {prefix}', e)
+        )
+
+    return {'done': True, 'pending': pending}
+
+def continue_task(task_token, cursor):
+    get_client('stepfunctions').send_task_success(
+        taskToken = task_token,
+        output = json.dumps({'action': 'continue', 'cursor': cursor})
+    )
 
+    return {'done': False, 'cursor': cursor}
+
+@instrumented('triggerManualApproval')
 def lambda_handler(event, context):    
+    sns_client = get_client('sns')
+    s3_client = get_client('s3')
+
     api_allow_endpoint = os.environ['apiAllowEndpoint']
     api_deny_endpoint = os.environ['apiDenyEndpoint']
     sns_topic_arn = os.environ['snsTopicArn']
-    target_bucket_name = os.environ['targetS3Bucket']
     src_bucket_name = os.environ['sourceS3Bucket']
     target_scanned_bucket_name = os.environ['targetScannedS3Bucket']
+    manifest_bucket_name = os.environ['manifestS3Bucket']
 
     prefix = event['Input']['id']
-    s3_key_names = event['Input']['macieFindingsInfo']['Payload']
-    check_key = ''
+    findings_info = event['Input']['macieFindingsInfo']['Payload']
 
+    previous = event['Input'].get('taskresult')
+    if previous and previous.get('action') == 'decided':
+        # The reviewer was notified already, wait for the remaining files
+        return wait_for_decisions(manifest_bucket_name, prefix, event['token'], s3_client)
+    if previous and previous.get('action') == 'continue':
+        offset = previous['cursor']['offset']
+    else:
+        offset = 0
+
+    # Staged keys without findings go straight to the scanned data bucket,
+    # keys disposed of by disposeFindings are gone from the scan stage
     try:
-        for s3_key_name in s3_key_names:
-            response = s3_client.put_object_tagging(
-                Bucket = src_bucket_name,
-                Key = s3_key_name,
-                Tagging = {
-                    'TagSet': [
-                        {
-                            'Key': 'SensitiveDataFound',
-                            'Value': 'true'
-                        },
-                        {
-                            'Key': 'WorkflowId',
-                            'Value': prefix
-                        }
-                    ]
-                }
-            )
-            response = s3_client.copy_object(
-                Bucket = target_bucket_name,
-                CopySource = {
-                    'Bucket': src_bucket_name,
-                    'Key': s3_key_name
-                },
-                Key = s3_key_name
-            )
-            response = s3_client.delete_object(
-                Bucket=src_bucket_name,
-                Key = s3_key_name
-            )
+        sensitive_keys = set(finding_keys(findings_info, s3_client = s3_client))
+        sensitive_keys.update(disposed_keys(findings_info, s3_client = s3_client))
     except Exception as e:
-        print(f'Could not complete S3 object move')
-        print(e)
-        return
+        return fail_task(
+            event['token'],
+            error_result(f'Could not read findings for workflow {prefix}', e)
+        )
+    workflow_keys = (
+        record for record in read_manifest_parts(
+            manifest_bucket_name,
+            prefix,
+            s3_client = s3_client
+        )
+        if record['key'] not in sensitive_keys
+    )
 
     try:
-        paginator = s3_client.get_paginator('list_objects_v2')
-        
-        page_iterator = paginator.paginate(
-            Bucket=src_bucket_name)
-        for page in page_iterator:
-            if ('Contents' in page):
-                s3_keys_remaining = page['Contents']
-            else:
-                s3_keys_remaining = []
-                
-            for s3_key_info in s3_keys_remaining:
-                object_tags = s3_client.get_object_tagging(
-                    Bucket=src_bucket_name,
-                    Key=s3_key_info['Key']
-                )
-                for tag_set in object_tags['TagSet']:
-                    if tag_set['Key'] == 'WorkflowId':
-                        check_key = tag_set['Value']
-
-                if check_key == prefix:
-                    response = s3_client.copy_object(
-                        Bucket = target_scanned_bucket_name,
-                        CopySource = {
-                            'Bucket': src_bucket_name,
-                            'Key': s3_key_info['Key']
-                        },
-                        Key = s3_key_info['Key']
-                    )
-                    response = s3_client.delete_object(
-                        Bucket=src_bucket_name,
-                        Key = s3_key_info['Key']
-                    )
-                    check_key = ''
-                else:
-                    print(f"Object tag not matching for {s3_key_info['Key']}")
+        move_result = advance_in_batches(
+            src_bucket_name,
+            target_scanned_bucket_name,
+            workflow_keys,
+            SCANNED_DATA,
+            Deadline(context),
+            offset,
+            s3_client = s3_client,
+            # Objects without findings are remembered as clean
+            after_batch = moved_verdict_recorder(open_scan_cache(), CLEAN)
+        )
     except Exception as e:
-        print(f'Could not complete S3 object move')
-        print(e)
-        return
+        return fail_task(
+            event['token'],
+            error_result(f'Could not read manifest for workflow {prefix}', e)
+        )
+    if move_result['failed']:
+        log_failures('Could not complete S3 object move', move_result['failed'])
+        return fail_task(
+            event['token'],
+            summarize(move_result['moved'], move_result['failed'])
+        )
+    if not move_result['done']:
+        return continue_task(
+            event['token'],
+            {'offset': move_result['offset']}
+        )
+
+    if 'findingsManifest' in findings_info:
+        pointer = findings_info['findingsManifest']
+        files = f"{findings_info['findingsCount']} files, listed in "\
+            f"s3://{pointer['bucket']}/{pointer['key']}"
+    else:
+        files = findings_info['findingKeys']
+    disposition = findings_info.get('disposition')
+    if disposition:
+        disposed = f"\n\nThe disposition policy allowed {disposition['allowCount']} "\
+            f"and denied {disposition['denyCount']} other files with findings."
+    else:
+        disposed = ''
+
+    # The token of the links stays valid for the decisions on single files
+    try:
+        save_approval_request(
+            manifest_bucket_name,
+            prefix,
+            event['token'],
+            s3_client,
+            reviewer_token = event['token']
+        )
+    except Exception as e:
+        return fail_task(
+            event['token'],
+            error_result(f'Could not save approval request of workflow {prefix}', e)
+        )
+    query = f'token={event["token"]}&id={prefix}'
 
     try:
         response = sns_client.publish(
             TopicArn = sns_topic_arn,
             Subject = 'APPROVAL REQUIRED: Sensitive data identified in pipeline',
             Message = f'Sensitive data discovered in data pipeline run.\n\n'\
-                f'Approve: {api_allow_endpoint}?token={event["token"]}\n\n'\
-                f'Deny: {api_deny_endpoint}?token={event["token"]}\n\n'\
-                f'Files: {s3_key_names}'
+                f'Approve: {api_allow_endpoint}?{query}\n\n'\
+                f'Deny: {api_deny_endpoint}?{query}\n\n'\
+                f'To decide single files, add &key=<file> or &prefix=<prefix> '\
+                f'to a link; the other files keep waiting for a decision.\n\n'\
+                f'Files: {files}{disposed}'
         )
     except Exception as e:
         print(f'Could not publish to SNS topic {sns_topic_arn}')
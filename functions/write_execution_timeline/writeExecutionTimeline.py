@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import os
+from pipeline_common.clients import get_client
+from pipeline_common.manifest import read_manifest_parts
+from pipeline_common.metrics import instrumented
+from pipeline_common.scan_jobs import job_ids
+from pipeline_common.timeline import batch_shape, build_timeline, state_result, top_level_spans, write_timeline
+
+'''
+Write the timeline of an execution of the state machine to the manifest
+bucket. Invoked by the EventBridge "Step Functions Execution Status Change"
+event when an execution ends, it reads the history of the execution, the
+Macie jobs it started and its workflow manifest and writes
+timelines/<execution name>.json (see pipeline_common.timeline).
+
+This proof of concept is used as part of a data pipeline workflow as part of
+the data ingestion pipeline. 
+'''
+
+def execution_history(execution_arn, sfn_client):
+    history_args = {
+        'executionArn': execution_arn,
+        'maxResults': 1000,
+        'includeExecutionData': True
+    }
+    while True:
+        page = sfn_client.get_execution_history(**history_args)
+        yield from page['events']
+        if not page.get('nextToken'):
+            break
+        history_args['nextToken'] = page['nextToken']
+
+@instrumented('writeExecutionTimeline')
+def lambda_handler(event, context):
+    sfn_client = get_client('stepfunctions')
+    macie_client = get_client('macie2')
+    s3_client = get_client('s3')
+
+    manifest_bucket_name = os.environ['manifestS3Bucket']
+
+    execution = event['detail']
+    try:
+        spans = list(top_level_spans(
+            execution_history(execution['executionArn'], sfn_client)))
+    except Exception as e:
+        print(f"Could not read history of execution {execution['executionArn']}")
+        print(e)
+        return
+
+    workflow_id = json.loads(execution.get('input') or '{}').get('id')
+    job_info = state_result(spans, 'triggerMacieScan') or {}
+
+    jobs = []
+    if job_info.get('jobId') not in (None, 'NoKeysFound'):
+        try:
+            jobs = [
+                macie_client.describe_classification_job(jobId = scan_job_id)
+                for scan_job_id in job_ids(job_info)
+            ]
+        except Exception as e:
+            # The timeline is still written, without the job statistics
+            print(f"Could not describe jobId {job_info['jobId']}")
+            print(e)
+
+    shape = None
+    if workflow_id:
+        try:
+            shape = batch_shape(read_manifest_parts(
+                manifest_bucket_name,
+                workflow_id,
+                s3_client = s3_client
+            ))
+        except Exception as e:
+            print(f'Could not read manifest of workflow {workflow_id}')
+            print(e)
+
+    timeline = build_timeline(
+        {
+            'name': execution['name'],
+            'workflowId': workflow_id,
+            'status': execution['status'],
+            # Milliseconds since the epoch in the event
+            'startDate': execution['startDate'] / 1000,
+            'stopDate': (execution.get('stopDate') or execution['startDate']) / 1000
+        },
+        spans,
+        jobs,
+        shape
+    )
+
+    try:
+        key = write_timeline(manifest_bucket_name, timeline, s3_client)
+    except Exception as e:
+        print(f"Could not write timeline of execution {execution['name']}")
+        print(e)
+        return
+
+    return {
+        'timelineKey': key,
+        'seconds': timeline['execution']['seconds'],
+        'phases': timeline['phases']
+    }
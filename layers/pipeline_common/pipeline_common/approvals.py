@@ -0,0 +1,231 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import hashlib
+import itertools
+import json
+from botocore.exceptions import ClientError
+from pipeline_common.clients import get_client
+
+'''
+Per-key and per-prefix approval decisions.
+
+The approval notification links carry the workflow id and the task token it
+was sent with, which stays the reviewer's secret for the whole review. Every
+decision received by receiveApprovalDecisionAPI is appended to a log in the
+manifest bucket under approvals/<workflow id>/decisions/, one object per
+request named after its sequence number and written only if that number is
+still free, and the waiting task is completed with a 'decided' action.
+applyApprovalDecisions then releases the keys decided since the last round:
+approved keys are moved to the scanned data bucket and denied keys are
+deleted. While keys remain undecided, triggerManualApproval waits again with
+a new task token, saved in approvals/<workflow id>/request.json so the API
+can complete it, without sending another notification.
+
+A decision without a key or prefix applies to every key still undecided and
+ends the review through the existing batch-wide move or delete steps. The
+first decision for a key wins once it has been applied; within one round the
+latest decision wins.
+'''
+
+APPROVAL_PREFIX = 'approvals'
+# Requests racing for the same sequence number of the decision log
+DECISION_WRITE_ATTEMPTS = 10
+
+ALLOW = 'allow'
+DELETE = 'delete'
+# Actions accepted from reviewers, mapped to the state machine actions
+DECISION_ACTIONS = {
+    'allow': ALLOW,
+    'approve': ALLOW,
+    'deny': DELETE,
+    'delete': DELETE
+}
+
+def approval_key(workflow_id, name):
+    return f'{APPROVAL_PREFIX}/{workflow_id}/{name}'
+
+def decisions_prefix(workflow_id):
+    return approval_key(workflow_id, 'decisions/')
+
+def secret_hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _get_json(bucket_name, key, s3_client):
+    try:
+        response = s3_client.get_object(Bucket = bucket_name, Key = key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+    return json.loads(response['Body'].read())
+
+def _put_json(bucket_name, key, document, s3_client):
+    s3_client.put_object(
+        Bucket = bucket_name,
+        Key = key,
+        Body = json.dumps(document).encode('utf-8'),
+        ContentType = 'application/json'
+    )
+
+def save_approval_request(bucket_name, workflow_id, task_token, s3_client,
+        reviewer_token=None):
+    '''
+    Record task_token as the token waiting for the decisions of workflow_id.
+    reviewer_token is the token of the notification links, kept for the
+    whole review; it defaults to the one of the previous request.
+    '''
+    if reviewer_token is None:
+        request = load_approval_request(bucket_name, workflow_id, s3_client)
+        hashed = request['secretHash']
+    else:
+        hashed = secret_hash(reviewer_token)
+
+    _put_json(bucket_name, approval_key(workflow_id, 'request.json'), {
+        'workflowId': workflow_id,
+        'token': task_token,
+        'secretHash': hashed
+    }, s3_client)
+
+def load_approval_request(bucket_name, workflow_id, s3_client):
+    return _get_json(bucket_name, approval_key(workflow_id, 'request.json'), s3_client)
+
+def close_approval_request(bucket_name, workflow_id, s3_client):
+    # Later decisions are refused once the review has ended
+    s3_client.delete_object(
+        Bucket = bucket_name, Key = approval_key(workflow_id, 'request.json'))
+
+def parse_decisions(action, keys=None, prefixes=None):
+    '''
+    Normalize the decisions of one request: one entry per key and prefix,
+    or a single batch-wide entry when neither is given.
+    '''
+    action = DECISION_ACTIONS.get((action or '').lower())
+    if action is None:
+        raise ValueError('action must be one of ' + ', '.join(sorted(DECISION_ACTIONS)))
+
+    decisions = [{'action': action, 'key': key} for key in keys or [] if key]
+    decisions.extend(
+        {'action': action, 'prefix': prefix} for prefix in prefixes or [] if prefix)
+
+    return decisions or [{'action': action}]
+
+def decision_log_key(workflow_id, sequence):
+    # Zero-padded so the names sort in log order
+    return decisions_prefix(workflow_id) + f'{sequence:010d}.json'
+
+def put_decisions(bucket_name, workflow_id, decisions, s3_client):
+    '''
+    Append decisions to the decision log of workflow_id under the next
+    sequence number. The write only succeeds if no other request took that
+    number first, so a request always lands after every entry already in the
+    log, whatever the clocks of the writers. The conditional write needs
+    boto3 1.35.2 or later, as pinned in the layer requirements.
+    '''
+    sequence = len(decision_log_keys(bucket_name, workflow_id, s3_client))
+    for attempt in range(DECISION_WRITE_ATTEMPTS):
+        try:
+            s3_client.put_object(
+                Bucket = bucket_name,
+                Key = decision_log_key(workflow_id, sequence),
+                Body = json.dumps({'decisions': decisions}).encode('utf-8'),
+                ContentType = 'application/json',
+                IfNoneMatch = '*'
+            )
+            return sequence
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict') \
+                    or attempt == DECISION_WRITE_ATTEMPTS - 1:
+                raise
+            sequence += 1
+
+def decision_log_keys(bucket_name, workflow_id, s3_client):
+    log_keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(
+            Bucket = bucket_name, Prefix = decisions_prefix(workflow_id)):
+        log_keys.extend(key_data['Key'] for key_data in page.get('Contents', []))
+
+    return sorted(log_keys)
+
+def read_decision_log(bucket_name, log_keys, s3_client):
+    return [
+        _get_json(bucket_name, key, s3_client)['decisions']
+        for key in log_keys
+    ]
+
+def applied_count(bucket_name, workflow_id, s3_client):
+    applied = _get_json(bucket_name, approval_key(workflow_id, 'applied.json'), s3_client)
+    return applied['count'] if applied else 0
+
+def save_applied_count(bucket_name, workflow_id, count, s3_client):
+    _put_json(
+        bucket_name, approval_key(workflow_id, 'applied.json'), {'count': count}, s3_client)
+
+class ApprovalDecisions:
+    '''
+    Decisions of a range of the decision log. decision_for() returns the
+    action of the last key or prefix decision matching key.
+    '''
+    def __init__(self, requests=None):
+        self.by_key = {}
+        self.prefixes = []
+        self.final_action = None
+        self.sequence = itertools.count()
+        for decisions in requests or []:
+            for decision in decisions:
+                self.add(decision)
+
+    def add(self, decision):
+        if 'key' in decision:
+            self.by_key[decision['key']] = (next(self.sequence), decision['action'])
+        elif 'prefix' in decision:
+            self.prefixes.append((next(self.sequence), decision['prefix'], decision['action']))
+        else:
+            self.final_action = decision['action']
+
+    def decision_for(self, key):
+        latest = self.by_key.get(key)
+        for sequence, prefix, action in self.prefixes:
+            if key.startswith(prefix) and (latest is None or sequence > latest[0]):
+                latest = (sequence, action)
+
+        return latest[1] if latest else None
+
+    def __bool__(self):
+        return bool(self.by_key or self.prefixes)
+
+def applied_decisions(bucket_name, workflow_id, s3_client=None):
+    '''
+    Key and prefix decisions already applied by applyApprovalDecisions. The
+    batch-wide move and delete steps leave the keys they match untouched.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    count = applied_count(bucket_name, workflow_id, s3_client)
+    if not count:
+        return ApprovalDecisions()
+    log_keys = decision_log_keys(bucket_name, workflow_id, s3_client)[:count]
+
+    return ApprovalDecisions(read_decision_log(bucket_name, log_keys, s3_client))
+
+def undecided(records, decisions):
+    return (
+        record for record in records
+        if decisions.decision_for(record['key']) is None
+    )
@@ -0,0 +1,454 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+import uuid
+from urllib.parse import quote, unquote_plus
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import DEFAULT_BATCH_SIZE, run_batches
+from pipeline_common.metrics import add_metric
+from pipeline_common.pipeline_state import in_place, state_tags, transition_objects
+from pipeline_common.s3_delete import delete_objects
+from pipeline_common.s3_move import move_objects, object_key, object_size
+from pipeline_common.s3_multipart import needs_multipart
+
+'''
+S3 Batch Operations backend for very large moves.
+
+Above BATCH_OPERATIONS_THRESHOLD objects, copying every object from a Lambda
+function is dominated by per-request overhead. The objects are instead
+copied by S3 Batch Operations copy jobs, one per group of objects that share
+the same tags:
+
+1. The keys are written as gzipped CSV parts to the manifest bucket, one part
+   per invocation and group, and listed in a manifest.json in the S3
+   Inventory format so a single job covers the parts of every invocation.
+2. A copy job is created per group with a completion report of the failed
+   tasks, and polled until it ends.
+3. The sources of the copied objects are removed with batched DeleteObjects
+   requests. Keys that the job failed to copy, and every key of a job that
+   did not complete, are moved by the Lambda move engine instead.
+
+Objects large enough for a multipart copy are always moved by the Lambda
+move engine, as copy jobs are limited to 5 GB objects. S3 Batch Operations
+has no delete operation, hence step 3.
+
+In the single-bucket layout the source and target bucket are the same and
+the jobs set the PipelineState tag with S3PutObjectTagging instead (see
+pipeline_common.pipeline_state). Such a job replaces the whole tag set and
+does not check the current state of the objects, so it is only used for
+keys that this workflow already brought to the previous state. Nothing is
+deleted afterwards.
+'''
+
+BATCH_OPERATIONS_THRESHOLD = int(os.environ.get('batchOperationsThreshold', '0'))
+BATCH_OPERATIONS_ROLE_ARN = os.environ.get('batchOperationsRoleArn', '')
+BATCH_OPERATIONS_POLL_SECONDS = int(os.environ.get('batchOperationsPollSeconds', '30'))
+BATCH_OPERATIONS_PRIORITY = 10
+BATCH_OPERATIONS_PREFIX = 'batch-operations'
+MANIFEST_PART_KEYS = 100000
+
+BATCH_OPERATIONS_BACKEND = 'batchOperations'
+LAMBDA_BACKEND = 'lambda'
+
+TERMINAL_JOB_STATUSES = ['Complete', 'Failed', 'Cancelled']
+
+def batch_operations_enabled(threshold=BATCH_OPERATIONS_THRESHOLD):
+    return threshold > 0 and bool(BATCH_OPERATIONS_ROLE_ARN)
+
+def use_batch_operations(key_count, threshold=BATCH_OPERATIONS_THRESHOLD):
+    return batch_operations_enabled(threshold) and key_count >= threshold
+
+def planned_backend(workflow_input, plan_name):
+    # The backend chosen by planShards, stored at $.<plan_name>.Payload
+    plan = workflow_input.get(plan_name) or {}
+    return (plan.get('Payload') or {}).get('backend', LAMBDA_BACKEND)
+
+def wait_fields(move_result):
+    # waitSeconds is only present while a job runs, see the ASL Choice states
+    if move_result.get('waitSeconds') is None:
+        return {}
+    return {'waitSeconds': move_result['waitSeconds']}
+
+def bucket_arn(bucket_name):
+    return f'arn:aws:s3:::{bucket_name}'
+
+def job_prefix(workflow_id, job_name):
+    return f'{BATCH_OPERATIONS_PREFIX}/{workflow_id}/{job_name}'
+
+def copy_operation(target_bucket_name, tags=None):
+    operation = {'TargetResource': bucket_arn(target_bucket_name)}
+    if tags is not None:
+        # Replaces the tag set, as TaggingDirective REPLACE does for CopyObject
+        operation['NewObjectTagging'] = [
+            {'Key': key, 'Value': value} for key, value in tags.items()
+        ]
+
+    return {'S3PutObjectCopy': operation}
+
+def tagging_operation(tags):
+    return {
+        'S3PutObjectTagging': {
+            'TagSet': [{'Key': key, 'Value': value} for key, value in tags.items()]
+        }
+    }
+
+def write_csv_part(bucket_name, key, source_bucket_name, keys, s3_client=None):
+    '''
+    Write keys as a gzipped Bucket,Key CSV part and return its entry for the
+    'files' list of the job manifest.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator = '\n')
+    for object_key_name in keys:
+        # Keys are URL-encoded in S3 Batch Operations manifests
+        writer.writerow([source_bucket_name, quote(object_key_name, safe = '/')])
+    body = gzip.compress(text.getvalue().encode('utf-8'))
+
+    s3_client.put_object(Bucket = bucket_name, Key = key, Body = body)
+
+    return {
+        'key': key,
+        'size': len(body),
+        'MD5checksum': hashlib.md5(body).hexdigest()
+    }
+
+def write_job_manifest(bucket_name, key, source_bucket_name, files, s3_client=None):
+    '''
+    Write the S3 Inventory style manifest.json listing the CSV parts and
+    return the manifest location for create_job.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    manifest = {
+        'sourceBucket': source_bucket_name,
+        'destinationBucket': bucket_arn(bucket_name),
+        'version': '2016-11-30',
+        'creationTimestamp': str(int(time.time() * 1000)),
+        'fileFormat': 'CSV',
+        'fileSchema': 'Bucket, Key',
+        'files': files
+    }
+    response = s3_client.put_object(
+        Bucket = bucket_name,
+        Key = key,
+        Body = json.dumps(manifest).encode('utf-8'),
+        ContentType = 'application/json'
+    )
+
+    return {
+        'ObjectArn': f'{bucket_arn(bucket_name)}/{key}',
+        'ETag': response['ETag'].strip('"')
+    }
+
+def create_job(account_id, operation, manifest_location, report_bucket_name,
+        report_prefix, description, s3control_client=None):
+    if s3control_client is None:
+        s3control_client = get_client('s3control')
+
+    response = s3control_client.create_job(
+        AccountId = account_id,
+        ConfirmationRequired = False,
+        Operation = operation,
+        Manifest = {
+            'Spec': {'Format': 'S3InventoryReport_CSV_20161130'},
+            'Location': manifest_location
+        },
+        Report = {
+            'Bucket': bucket_arn(report_bucket_name),
+            'Format': 'Report_CSV_20180820',
+            'Enabled': True,
+            'Prefix': report_prefix,
+            'ReportScope': 'FailedTasksOnly'
+        },
+        # The same manifest never creates a second job
+        ClientRequestToken = str(uuid.uuid5(
+            uuid.NAMESPACE_URL,
+            f"{manifest_location['ObjectArn']}#{manifest_location['ETag']}"
+        )),
+        Description = description[:256],
+        Priority = BATCH_OPERATIONS_PRIORITY,
+        RoleArn = BATCH_OPERATIONS_ROLE_ARN
+    )
+    add_metric('BatchOperationsJobs')
+
+    return response['JobId']
+
+def describe_job(account_id, job_id, s3control_client=None):
+    if s3control_client is None:
+        s3control_client = get_client('s3control')
+
+    job = s3control_client.describe_job(AccountId = account_id, JobId = job_id)['Job']
+    progress = job.get('ProgressSummary', {})
+
+    return {
+        'status': job['Status'],
+        'total': progress.get('TotalNumberOfTasks', 0),
+        'succeeded': progress.get('NumberOfTasksSucceeded', 0),
+        'failed': progress.get('NumberOfTasksFailed', 0),
+        'failureReasons': [
+            reason.get('FailureReason') for reason in job.get('FailureReasons', [])
+        ]
+    }
+
+def job_failures(report_bucket_name, report_prefix, job_id, s3_client=None):
+    '''
+    Return the failed tasks of a completed job as a dict of key to error
+    message, read from its completion report.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    response = s3_client.get_object(
+        Bucket = report_bucket_name,
+        Key = f'{report_prefix}/job-{job_id}/manifest.json'
+    )
+    report = json.loads(response['Body'].read())
+
+    failures = {}
+    for result in report.get('Results', []):
+        body = s3_client.get_object(
+            Bucket = report_bucket_name, Key = result['Key'])['Body'].read()
+        # Bucket, Key, VersionId, TaskStatus, ErrorCode, HTTPStatusCode, ResultMessage
+        for row in csv.reader(io.StringIO(body.decode('utf-8'))):
+            if len(row) < 4 or row[3] == 'succeeded':
+                continue
+            failures[unquote_plus(row[1])] = ' '.join(
+                value for value in row[4:] if value)
+
+    return failures
+
+class BatchMove:
+    '''
+    Resumable move of keys with S3 Batch Operations copy jobs.
+
+    keys_factory returns the ordered key source again on every invocation
+    (key names or records with a size), group_of maps a key to the name of
+    its group and group_tags a group name to the tags of its objects. state
+    is the pipeline state the keys are brought to when both buckets are the
+    same.
+    '''
+    def __init__(self, src_bucket_name, target_bucket_name, keys_factory,
+            workflow_id, job_name, account_id, manifest_bucket_name,
+            group_of=None, group_tags=None, s3_client=None,
+            s3control_client=None, after_batch=None, state=None):
+        self.src_bucket_name = src_bucket_name
+        self.target_bucket_name = target_bucket_name
+        self.keys_factory = keys_factory
+        self.prefix = job_prefix(workflow_id, job_name)
+        self.workflow_id = workflow_id
+        self.account_id = account_id
+        self.manifest_bucket_name = manifest_bucket_name
+        self.group_of = group_of or (lambda key_data: 'all')
+        self.group_tags = group_tags or (lambda group: None)
+        self.s3_client = s3_client or get_client('s3')
+        self.s3control_client = s3control_client or get_client('s3control')
+        self.after_batch = after_batch
+        self.state = state
+        self.in_place = in_place(src_bucket_name, target_bucket_name)
+
+    def run(self, deadline, cursor=None):
+        '''
+        Advance the move from cursor until it is done, a job is still
+        running or the deadline is reached. Returns a dict with the 'moved'
+        keys and 'failed' entries of this invocation, whether the move is
+        'done', the 'cursor' to resume from and, while jobs run,
+        'waitSeconds' before the next invocation.
+        '''
+        cursor = dict(cursor or {'phase': 'manifest', 'offset': 0, 'parts': {}})
+        result = {'moved': [], 'failed': []}
+
+        if cursor['phase'] == 'manifest':
+            self._write_manifests(deadline, cursor, result)
+        if cursor['phase'] == 'job':
+            statuses = {
+                group: describe_job(self.account_id, job_id, self.s3control_client)
+                for group, job_id in cursor['jobs'].items()
+            }
+            if any(status['status'] not in TERMINAL_JOB_STATUSES
+                    for status in statuses.values()):
+                return dict(result, done = False, cursor = cursor,
+                    waitSeconds = BATCH_OPERATIONS_POLL_SECONDS)
+            for group, status in statuses.items():
+                if status['status'] != 'Complete':
+                    print(f"Batch operations job {cursor['jobs'][group]} "
+                        f"ended {status['status']}: {status['failureReasons']}")
+            cursor = {
+                'phase': 'delete',
+                'offset': 0,
+                'jobs': cursor['jobs'],
+                'completed': [
+                    group for group, status in statuses.items()
+                    if status['status'] == 'Complete'
+                ]
+            }
+        if cursor['phase'] == 'delete':
+            self._remove_sources(deadline, cursor, result)
+
+        return dict(result, done = cursor['phase'] == 'done', cursor = cursor)
+
+    def _write_manifests(self, deadline, cursor, result):
+        parts = cursor['parts']
+
+        def write_parts(batch):
+            groups = {}
+            direct = []
+            for key_data in batch:
+                if self._needs_direct_move(key_data):
+                    direct.append(key_data)
+                else:
+                    groups.setdefault(self.group_of(key_data), []).append(
+                        object_key(key_data))
+            if direct:
+                self._report(direct, self._move_directly(direct), result)
+
+            for group, keys in sorted(groups.items()):
+                group_parts = parts.setdefault(group, [])
+                group_parts.append(write_csv_part(
+                    self.manifest_bucket_name,
+                    f'{self.prefix}/{group}/part-{len(group_parts):05d}.csv.gz',
+                    self.src_bucket_name,
+                    keys,
+                    self.s3_client
+                ))
+
+        cursor['offset'], done = run_batches(
+            self.keys_factory(), write_parts, deadline, cursor['offset'],
+            batch_size = MANIFEST_PART_KEYS)
+        if not done:
+            return
+
+        jobs = {}
+        for group, files in sorted(parts.items()):
+            manifest_location = write_job_manifest(
+                self.manifest_bucket_name,
+                f'{self.prefix}/{group}/manifest.json',
+                self.src_bucket_name,
+                files,
+                self.s3_client
+            )
+            jobs[group] = create_job(
+                self.account_id,
+                self._operation(group),
+                manifest_location,
+                self.manifest_bucket_name,
+                f'{self.prefix}/reports',
+                f'Pipeline move {self.prefix}/{group}',
+                self.s3control_client
+            )
+        cursor.clear()
+        cursor.update({'phase': 'job', 'jobs': jobs})
+
+    def _needs_direct_move(self, key_data):
+        # Tagging jobs have no object size limit
+        return not self.in_place and needs_multipart(object_size(key_data))
+
+    def _operation(self, group):
+        if self.in_place:
+            # The tag set is replaced, keep the workflow id
+            tags = {'WorkflowId': self.workflow_id}
+            tags.update(self.group_tags(group) or {})
+            return tagging_operation(state_tags(tags, self.state))
+        return copy_operation(self.target_bucket_name, self.group_tags(group))
+
+    def _move_directly(self, key_data_list):
+        result = {'moved': [], 'failed': []}
+        groups = {}
+        for key_data in key_data_list:
+            groups.setdefault(self.group_of(key_data), []).append(key_data)
+        for group, group_keys in sorted(groups.items()):
+            if self.in_place:
+                move_result = transition_objects(
+                    self.src_bucket_name,
+                    group_keys,
+                    self.state,
+                    tags = self.group_tags(group),
+                    s3_client = self.s3_client
+                )
+                result['moved'].extend(move_result['moved'])
+                result['failed'].extend(move_result['failed'])
+                continue
+            move_result = move_objects(
+                self.src_bucket_name,
+                self.target_bucket_name,
+                group_keys,
+                tags = self.group_tags(group),
+                s3_client = self.s3_client
+            )
+            result['moved'].extend(move_result['moved'])
+            result['failed'].extend(move_result['failed'])
+
+        return result
+
+    def _report(self, batch, batch_result, result):
+        result['moved'].extend(batch_result['moved'])
+        result['failed'].extend(batch_result['failed'])
+        if self.after_batch:
+            self.after_batch(batch, batch_result)
+
+    def _remove_sources(self, deadline, cursor, result):
+        failures = {}
+        for group in cursor['completed']:
+            failures.update(job_failures(
+                self.manifest_bucket_name,
+                f'{self.prefix}/reports',
+                cursor['jobs'][group],
+                self.s3_client
+            ))
+        completed = set(cursor['completed'])
+
+        def remove_batch(batch):
+            copied = []
+            retry = []
+            for key_data in batch:
+                if self._needs_direct_move(key_data):
+                    # Moved while the manifest was written
+                    continue
+                if (self.group_of(key_data) in completed
+                        and object_key(key_data) not in failures):
+                    copied.append(object_key(key_data))
+                else:
+                    retry.append(key_data)
+
+            if self.in_place:
+                # Tagged in place, there is no source to remove
+                delete_result = {'deleted': copied, 'failed': []}
+                add_metric('ObjectsTransitioned', len(copied))
+            else:
+                delete_result = delete_objects(
+                    self.src_bucket_name, copied, s3_client = self.s3_client)
+                add_metric('ObjectsMoved', len(delete_result['deleted']))
+            batch_result = self._move_directly(retry)
+            batch_result['moved'].extend(delete_result['deleted'])
+            batch_result['failed'].extend(delete_result['failed'])
+            self._report(batch, batch_result, result)
+
+        cursor['offset'], done = run_batches(
+            self.keys_factory(), remove_batch, deadline, cursor['offset'],
+            batch_size = DEFAULT_BATCH_SIZE)
+        if done:
+            cursor.clear()
+            cursor['phase'] = 'done'
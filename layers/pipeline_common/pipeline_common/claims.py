@@ -0,0 +1,226 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from pipeline_common.clients import get_client
+from pipeline_common.metrics import add_metric
+from pipeline_common.s3_move import object_key
+from pipeline_common.tracing import subsegment
+
+'''
+Leased claims on raw objects.
+
+Executions of the state machine share the raw bucket. When a run takes
+longer than the schedule interval, or runs are started by object events,
+two executions can list the same raw object and both stage it.
+triggerMacieScan therefore claims every raw key before staging it: a claim
+is a conditional write of the key with the workflow id as owner, which only
+succeeds when the key is not claimed, its lease has expired, or it is
+already claimed by the same workflow. Keys claimed by another execution are
+left to that execution.
+
+The claims are released once the keys are staged and recorded in the
+workflow manifest, after which the objects are no longer raw. Claims of keys
+that could not be staged are kept until they expire after
+CLAIM_LEASE_SECONDS, and the keys are then picked up by a later run, as are
+the keys of an execution that stopped before releasing its claims. The lease
+must therefore be longer than staging takes, including S3 Batch Operations
+copy jobs.
+
+The production backend is a DynamoDB table with TTL enabled on 'expiresAt',
+written with one conditional PutItem per key, as BatchWriteItem does not
+support conditions. A SQLite file backend can be used for local runs and
+tests. open_claim_store() returns None when no backend is configured, and
+every key is then processed as before.
+'''
+
+CLAIM_LEASE_SECONDS = int(os.environ.get('claimLeaseSeconds', '3600'))
+DEFAULT_MAX_WORKERS = int(os.environ.get('claimConcurrency', '16'))
+
+def claims_enabled():
+    return os.environ.get('claimBackend', 'none') != 'none'
+
+def claim_key(bucket_name, key):
+    return f'{bucket_name}/{key}'
+
+class DynamoDBClaimStore:
+    def __init__(self, table_name, dynamodb_client=None,
+            lease_seconds=CLAIM_LEASE_SECONDS, max_workers=DEFAULT_MAX_WORKERS):
+        self.table_name = table_name
+        self.dynamodb_client = dynamodb_client or get_client('dynamodb')
+        self.lease_seconds = lease_seconds
+        self.max_workers = max_workers
+
+    def _claim(self, key, owner, now):
+        try:
+            self.dynamodb_client.put_item(
+                TableName = self.table_name,
+                Item = {
+                    'claimKey': {'S': key},
+                    'ownerId': {'S': owner},
+                    'expiresAt': {'N': str(now + self.lease_seconds)}
+                },
+                ConditionExpression = (
+                    'attribute_not_exists(claimKey) OR expiresAt <= :now '
+                    'OR ownerId = :owner'),
+                ExpressionAttributeValues = {
+                    ':now': {'N': str(now)},
+                    ':owner': {'S': owner}
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def _release(self, key, owner):
+        try:
+            self.dynamodb_client.delete_item(
+                TableName = self.table_name,
+                Key = {'claimKey': {'S': key}},
+                ConditionExpression = 'ownerId = :owner',
+                ExpressionAttributeValues = {':owner': {'S': owner}}
+            )
+        except ClientError as e:
+            # Expired and claimed by another execution since
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def claim(self, keys, owner):
+        '''
+        Claim keys for owner. Returns the keys now claimed by owner.
+        '''
+        keys = sorted(set(keys))
+        now = int(time.time())
+        if not keys:
+            return []
+        with ThreadPoolExecutor(max_workers = min(self.max_workers, len(keys))) as executor:
+            claimed = list(executor.map(lambda key: self._claim(key, owner, now), keys))
+
+        return [key for key, ok in zip(keys, claimed) if ok]
+
+    def release(self, keys, owner):
+        keys = sorted(set(keys))
+        if not keys:
+            return
+        with ThreadPoolExecutor(max_workers = min(self.max_workers, len(keys))) as executor:
+            list(executor.map(lambda key: self._release(key, owner), keys))
+
+class SQLiteClaimStore:
+    def __init__(self, path, lease_seconds=CLAIM_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread = False, isolation_level = None)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS claims ('
+            'claim_key TEXT PRIMARY KEY, owner_id TEXT, expires_at INTEGER)')
+
+    def claim(self, keys, owner):
+        now = int(time.time())
+        expires_at = now + self.lease_seconds
+        claimed = []
+        with self.lock:
+            # IMMEDIATE takes the write lock, so claims of other processes
+            # sharing the file wait for this one
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                for key in sorted(set(keys)):
+                    cursor = self.connection.execute(
+                        'UPDATE claims SET owner_id = ?, expires_at = ? '
+                        'WHERE claim_key = ? AND (expires_at <= ? OR owner_id = ?)',
+                        [owner, expires_at, key, now, owner]
+                    )
+                    if cursor.rowcount == 0:
+                        cursor = self.connection.execute(
+                            'INSERT OR IGNORE INTO claims VALUES (?, ?, ?)',
+                            [key, owner, expires_at]
+                        )
+                    if cursor.rowcount == 1:
+                        claimed.append(key)
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+        return claimed
+
+    def release(self, keys, owner):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.connection.executemany(
+                    'DELETE FROM claims WHERE claim_key = ? AND owner_id = ?',
+                    [(key, owner) for key in set(keys)]
+                )
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+def open_claim_store():
+    backend = os.environ.get('claimBackend', 'none')
+    if backend == 'dynamodb':
+        return DynamoDBClaimStore(os.environ['claimTable'])
+    if backend == 'sqlite':
+        return SQLiteClaimStore(os.environ.get('claimPath', '/tmp/claims.db'))
+    return None
+
+def claim_objects(claim_store, bucket_name, key_data_list, owner):
+    '''
+    Return the list_objects_v2 'Contents' entries or manifest records of
+    key_data_list whose keys owner could claim. Without a claim store every
+    entry is returned. A claim store error is raised, as staging unclaimed
+    keys could process them twice.
+    '''
+    if claim_store is None:
+        return list(key_data_list)
+
+    key_data_list = list(key_data_list)
+    with subsegment('claimObjects'):
+        claimed = set(claim_store.claim(
+            [claim_key(bucket_name, object_key(key_data)) for key_data in key_data_list],
+            owner
+        ))
+    owned = [
+        key_data for key_data in key_data_list
+        if claim_key(bucket_name, object_key(key_data)) in claimed
+    ]
+    add_metric('ObjectsClaimed', len(owned))
+    add_metric('ClaimConflicts', len(key_data_list) - len(owned))
+
+    return owned
+
+def release_objects(claim_store, bucket_name, keys, owner):
+    '''
+    Release the claims of owner on keys. Errors are logged, the claims then
+    expire.
+    '''
+    if claim_store is None or not keys:
+        return
+
+    try:
+        with subsegment('releaseObjects'):
+            claim_store.release([claim_key(bucket_name, key) for key in keys], owner)
+    except Exception as e:
+        print(f'Could not release claims of workflow {owner}')
+        print(e)
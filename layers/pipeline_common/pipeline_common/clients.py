@@ -0,0 +1,70 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import threading
+import boto3
+from botocore.config import Config
+from pipeline_common.metrics import register_api_hooks
+from pipeline_common.rate_control import MAX_CONCURRENCY, register_limiter_hooks
+
+'''
+Pooled boto3 clients shared by the pipeline Lambda functions.
+
+Clients are created lazily on first use, not at import, and cached for the
+lifetime of the execution environment so warm invocations reuse open
+connections. boto3 clients are thread safe, so a single client is shared by
+all worker threads of the S3 move engine; the connection pool is sized to
+match. Each client reports its calls to pipeline_common.metrics. boto3
+itself is packaged in this layer from requirements.txt, so no function
+installs dependencies at runtime.
+
+Clients retry throttled and transient errors with botocore's standard retry
+mode (up to apiMaxAttempts attempts, with exponential backoff), and the
+number of concurrent attempts of each operation is limited by
+pipeline_common.rate_control. The connection pool is never smaller than the
+concurrency limit allows.
+'''
+
+DEFAULT_MAX_POOL_CONNECTIONS = max(
+    int(os.environ.get('maxPoolConnections', '50')), MAX_CONCURRENCY)
+RETRY_MODE = os.environ.get('apiRetryMode', 'standard')
+MAX_ATTEMPTS = int(os.environ.get('apiMaxAttempts', '10'))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(service_name, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS):
+    client = _clients.get(service_name)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(service_name)
+        if client is None:
+            client = boto3.client(
+                service_name,
+                config = Config(
+                    max_pool_connections = max_pool_connections,
+                    retries = {'mode': RETRY_MODE, 'max_attempts': MAX_ATTEMPTS}
+                )
+            )
+            # Count and time every call for the invocation metrics
+            register_api_hooks(client)
+            register_limiter_hooks(client)
+            _clients[service_name] = client
+
+    return client
@@ -0,0 +1,102 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import itertools
+import os
+import time
+
+'''
+Time budget and continuation helpers for resumable pipeline functions.
+
+A handler works through its input in batches and stops before the Lambda
+deadline, leaving room for the slowest batch seen so far plus a safety
+margin. It then returns 'done': false and a cursor (an S3 ContinuationToken,
+a Macie nextToken or an offset into a key list or manifest). The state
+machine loops back to the same function, which picks up its previous result
+from the state input and resumes from the cursor.
+
+The first step of an invocation always runs, however little time is left,
+so every invocation makes progress and the state machine loop cannot spin
+without moving the cursor. If that step does not fit in the remaining time
+the invocation times out, and the execution fails rather than looping.
+'''
+
+DEFAULT_SAFETY_MARGIN_MS = int(os.environ.get('timeBudgetMarginMs', '2000'))
+DEFAULT_BATCH_SIZE = int(os.environ.get('batchSize', '250'))
+
+class Deadline:
+    def __init__(self, context, safety_margin_ms=DEFAULT_SAFETY_MARGIN_MS):
+        self.context = context
+        self.safety_margin_ms = safety_margin_ms
+        self.longest_step_ms = 0
+        self.steps = 0
+
+    def remaining_ms(self):
+        if self.context is None:
+            return float('inf')
+        return self.context.get_remaining_time_in_millis()
+
+    def record_step(self, started):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.longest_step_ms = max(self.longest_step_ms, elapsed_ms)
+        self.steps += 1
+
+    def expired(self):
+        if not self.steps:
+            return False
+        return self.remaining_ms() < self.safety_margin_ms + self.longest_step_ms
+
+def batches(items, batch_size):
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def run_batches(items, process_batch, deadline, offset=0,
+        batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    Call process_batch on successive batches of items, skipping the first
+    offset items, until the items are exhausted or the deadline leaves no
+    time for another batch. At least one batch is processed.
+
+    Returns the new offset and whether all items were processed.
+    '''
+    remaining = itertools.islice(items, offset, None)
+    for batch in batches(remaining, batch_size):
+        if deadline.expired():
+            return offset, False
+        started = time.monotonic()
+        process_batch(batch)
+        deadline.record_step(started)
+        offset += len(batch)
+
+    return offset, True
+
+def resume_payload(event, result_name):
+    '''
+    Return the unfinished result a previous invocation stored at
+    $.<result_name>.Payload, or None when starting fresh.
+    '''
+    try:
+        payload = event['Input'][result_name]['Payload']
+    except (KeyError, TypeError):
+        return None
+
+    if isinstance(payload, dict) and payload.get('done') is False:
+        return payload
+    return None
@@ -0,0 +1,165 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import os
+from pipeline_common.manifest import manifest_key, read_manifest, write_manifest
+from pipeline_common.payload import INLINE_KEY_LIMIT
+
+'''
+Automatic disposition of the keys with findings.
+
+getMacieFindingsCount builds a per-key index of the findings (see
+pipeline_common.findings.FindingsIndex) and evaluates a declarative policy
+on it. Keys the policy allows are released to the scanned data bucket and
+keys it denies are deleted by disposeFindings, without a manual review. Only
+the keys no rule matches are moved to the manual review bucket and listed in
+the approval notification.
+
+The policy is a JSON list of rules read from the dispositionPolicy
+environment variable. Every rule has an 'action', 'allow' or 'deny', and
+matches a key when all of its conditions hold; a key is disposed of by the
+first rule that matches, so deny rules are usually listed first. The
+optional 'name' of the rule is the value of the AutoDisposition tag of the
+objects it allows.
+
+    severities   the highest severity of the key's findings is one of these
+                 ('Low', 'Medium', 'High')
+    onlyTypes    every finding type of the key starts with one of these, such
+                 as "SensitiveData:S3Object/Personal"
+    anyTypes     at least one finding type of the key starts with one of these
+    maxFindings  the key has at most this many findings
+
+For example, to allow keys with only a few low severity personal findings
+and deny any key with credentials:
+
+    [{"action": "deny", "anyTypes": ["SensitiveData:S3Object/Credentials"]},
+     {"action": "allow", "severities": ["Low"],
+      "onlyTypes": ["SensitiveData:S3Object/Personal"], "maxFindings": 5}]
+
+Macie reports objects with several categories of sensitive data with the
+SensitiveData:S3Object/Multiple type. An empty policy, the default, sends
+every key with findings to manual review.
+'''
+
+ALLOW = 'allow'
+DENY = 'deny'
+DISPOSITION_MANIFEST = 'disposition'
+
+RULE_CONDITIONS = ['severities', 'onlyTypes', 'anyTypes', 'maxFindings']
+
+class DispositionRule:
+    def __init__(self, rule):
+        if rule.get('action') not in (ALLOW, DENY):
+            raise ValueError(f'Disposition rule {rule} needs an action of allow or deny')
+        conditions = [name for name in RULE_CONDITIONS if name in rule]
+        if not conditions:
+            raise ValueError(f'Disposition rule {rule} has no conditions')
+        self.action = rule['action']
+        self.name = rule.get('name', '-'.join([self.action] + conditions))
+        self.severities = set(
+            severity.lower() for severity in rule.get('severities', []))
+        self.only_types = tuple(rule.get('onlyTypes', []))
+        self.any_types = tuple(rule.get('anyTypes', []))
+        self.max_findings = rule.get('maxFindings')
+
+    def matches(self, entry):
+        if self.severities and (entry['severity'] or '').lower() not in self.severities:
+            return False
+        if self.only_types and not (entry['types'] and all(
+                finding_type.startswith(self.only_types)
+                for finding_type in entry['types'])):
+            return False
+        if self.any_types and not any(
+                finding_type.startswith(self.any_types)
+                for finding_type in entry['types']):
+            return False
+        if self.max_findings is not None and entry['count'] > self.max_findings:
+            return False
+        return True
+
+def load_disposition_rules():
+    rules = os.environ.get('dispositionPolicy')
+    if rules is None or not rules.strip():
+        return []
+
+    return [DispositionRule(rule) for rule in json.loads(rules)]
+
+DISPOSITION_RULES = load_disposition_rules()
+
+def dispose(records, rules=None):
+    '''
+    Split FindingsIndex records into the records disposed of by a rule and
+    those left to manual review. The disposed records are returned as
+    copies with the 'disposition' action and the name of the 'rule'.
+    '''
+    rules = DISPOSITION_RULES if rules is None else rules
+    disposed = []
+    review = []
+    for record in records:
+        rule = next((rule for rule in rules if rule.matches(record)), None)
+        if rule is None:
+            review.append(record)
+        else:
+            disposed.append(dict(record, disposition = rule.action, rule = rule.name))
+
+    return disposed, review
+
+def disposition_payload(disposed, bucket_name, workflow_id, s3_client=None):
+    '''
+    Payload fields describing the disposed records: the counts and the
+    records themselves when there are few, otherwise a pointer to a
+    disposition manifest, as for the findings (see pipeline_common.payload).
+    '''
+    info = {
+        'allowCount': sum(1 for record in disposed if record['disposition'] == ALLOW),
+        'denyCount': sum(1 for record in disposed if record['disposition'] == DENY)
+    }
+    records = [
+        {
+            'key': record['key'],
+            'size': record.get('size'),
+            'disposition': record['disposition'],
+            'rule': record['rule']
+        }
+        for record in disposed
+    ]
+    if len(records) <= INLINE_KEY_LIMIT:
+        info['records'] = records
+    else:
+        key = manifest_key(workflow_id, DISPOSITION_MANIFEST)
+        write_manifest(bucket_name, key, records, s3_client)
+        info['manifest'] = {'bucket': bucket_name, 'key': key}
+
+    return info
+
+def disposition_records(findings_info, s3_client=None):
+    info = findings_info.get('disposition')
+    if not info:
+        return iter([])
+    if 'records' in info:
+        return iter(info['records'])
+
+    pointer = info['manifest']
+    return read_manifest(pointer['bucket'], pointer['key'], s3_client)
+
+def disposed_keys(findings_info, s3_client=None):
+    '''
+    Keys of the workflow already disposed of by disposeFindings, which the
+    steps moving the rest of the workflow leave alone.
+    '''
+    return set(
+        record['key'] for record in disposition_records(findings_info, s3_client))
@@ -0,0 +1,196 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import collections
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pipeline_common.metrics import add_metric
+from pipeline_common.tracing import subsegment
+
+'''
+Macie findings collector.
+
+list_findings is paginated on the calling thread while get_findings calls
+for the pages already listed run concurrently on a small thread pool. Pages
+are requested with at most MAX_FINDING_IDS_PER_CALL ids so that every page
+maps to exactly one get_findings call. No more get_findings calls are in
+flight than there are workers, and the time from submitting a call to its
+result counts as a step of the deadline, so the calls still running when
+the deadline is reached finish within the time it keeps. Full finding documents are projected
+down to the S3 object key, severity and finding type as soon as they arrive
+and are not kept.
+'''
+
+MAX_FINDING_IDS_PER_CALL = 50
+DEFAULT_MAX_WORKERS = int(os.environ.get('findingsConcurrency', '4'))
+
+SEVERITY_ORDER = ['Low', 'Medium', 'High']
+
+def finding_record(finding):
+    resources = finding.get('resourcesAffected', {})
+    if 's3Object' not in resources:
+        return None
+
+    return {
+        'key': resources['s3Object']['key'],
+        'severity': finding.get('severity', {}).get('description'),
+        'type': finding.get('type'),
+        'size': resources['s3Object'].get('size'),
+        'etag': resources['s3Object'].get('eTag')
+    }
+
+def job_criteria(job_id, criteria=None):
+    # job_id may be a list to match the findings of a set of jobs
+    job_ids = job_id if isinstance(job_id, list) else [job_id]
+    criterion = {
+        'classificationDetails.jobId': {
+            'eq': job_ids
+        }
+    }
+    if criteria:
+        criterion.update(criteria)
+
+    return {'criterion': criterion}
+
+class FindingsIndex:
+    '''
+    Compact per-key view of the findings: number of findings, highest
+    severity and the finding types seen for each S3 object key.
+    '''
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    def add(self, record):
+        entry = self.entries.setdefault(record['key'], self._new_entry())
+        entry['count'] += 1
+        self._merge_details(entry, record, [record['type']])
+
+    def add_entry(self, record):
+        # Merge a record written by records(), e.g. from a manifest part
+        entry = self.entries.setdefault(record['key'], self._new_entry())
+        entry['count'] += record['count']
+        self._merge_details(entry, record, record['types'])
+
+    def _new_entry(self):
+        return {
+            'count': 0,
+            'severity': None,
+            'types': [],
+            'size': None,
+            'etag': None
+        }
+
+    def _merge_details(self, entry, record, types):
+        entry['size'] = record.get('size') or entry['size']
+        entry['etag'] = record.get('etag') or entry['etag']
+        severity = record['severity']
+        if (severity in SEVERITY_ORDER and (entry['severity'] is None
+                or SEVERITY_ORDER.index(severity)
+                > SEVERITY_ORDER.index(entry['severity']))):
+            entry['severity'] = severity
+        for finding_type in types:
+            if finding_type and finding_type not in entry['types']:
+                entry['types'].append(finding_type)
+
+    def keys(self):
+        return list(self.entries)
+
+    def records(self):
+        return [dict(entry, key = key) for key, entry in self.entries.items()]
+
+    def __len__(self):
+        return len(self.entries)
+
+class FindingsCollector:
+    def __init__(self, macie_client, job_id, criteria=None,
+            sort_criteria=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.macie_client = macie_client
+        self.finding_criteria = job_criteria(job_id, criteria)
+        self.sort_criteria = sort_criteria
+        self.max_workers = max_workers
+
+    def _fetch(self, finding_ids):
+        response = self.macie_client.get_findings(findingIds = finding_ids)
+        add_metric('FindingsFetched', len(response['findings']))
+        records = []
+        for finding in response['findings']:
+            record = finding_record(finding)
+            if record is not None:
+                records.append(record)
+
+        return records
+
+    def collect(self, index, deadline, next_token=None):
+        '''
+        Add the findings of the job to index until all pages are read or the
+        deadline is reached. Returns the nextToken to resume from and whether
+        every page has been read.
+        '''
+        in_flight = collections.deque()
+        done = False
+
+        def add_oldest_fetch():
+            submitted, future = in_flight.popleft()
+            for record in future.result():
+                index.add(record)
+            deadline.record_step(submitted)
+
+        with subsegment('collectFindings'), \
+                ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            while not deadline.expired():
+                started = time.monotonic()
+                list_args = {
+                    'findingCriteria': self.finding_criteria,
+                    'maxResults': MAX_FINDING_IDS_PER_CALL
+                }
+                if self.sort_criteria:
+                    list_args['sortCriteria'] = self.sort_criteria
+                if next_token:
+                    list_args['nextToken'] = next_token
+                page = self.macie_client.list_findings(**list_args)
+
+                if page['findingIds']:
+                    in_flight.append(
+                        (time.monotonic(), executor.submit(self._fetch, page['findingIds'])))
+                if len(in_flight) >= self.max_workers:
+                    add_oldest_fetch()
+
+                deadline.record_step(started)
+                next_token = page.get('nextToken')
+                if not next_token:
+                    done = True
+                    break
+
+            while in_flight:
+                add_oldest_fetch()
+
+        return next_token, done
+
+    def statistics(self, group_by):
+        '''
+        Count the findings of the job per group ('severity.description' or
+        'type') on the server, without fetching any finding documents.
+        '''
+        response = self.macie_client.get_finding_statistics(
+            findingCriteria = self.finding_criteria,
+            groupBy = group_by
+        )
+
+        return {
+            group['groupKey']: group['count']
+            for group in response.get('countsByGroup', [])
+        }
@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+from botocore.exceptions import ClientError
+
+'''
+Task tokens of state machine executions waiting for a Macie classification
+job to finish, stored in the manifest bucket under job-waits/<job id>.json
+so the function receiving the Macie job status events can find them.
+'''
+
+JOB_WAIT_PREFIX = 'job-waits'
+
+# Macie job status events that end the wait
+FINAL_JOB_EVENTS = ['JOB_COMPLETED', 'JOB_CANCELLED']
+ACTIVE_JOB_STATUSES = ['RUNNING', 'IDLE', 'PAUSED']
+
+def job_wait_key(job_id):
+    return f'{JOB_WAIT_PREFIX}/{job_id}.json'
+
+def save_job_wait(bucket_name, job_id, task_token, s3_client):
+    s3_client.put_object(
+        Bucket = bucket_name,
+        Key = job_wait_key(job_id),
+        Body = json.dumps({'jobId': job_id, 'token': task_token}).encode('utf-8'),
+        ContentType = 'application/json'
+    )
+
+def pop_job_wait(bucket_name, job_id, s3_client):
+    '''
+    Return the task token waiting for job_id and remove it, or None when no
+    execution is waiting.
+    '''
+    try:
+        response = s3_client.get_object(
+            Bucket = bucket_name,
+            Key = job_wait_key(job_id)
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+    s3_client.delete_object(Bucket = bucket_name, Key = job_wait_key(job_id))
+    return json.loads(response['Body'].read())['token']
+
+def release_job_wait(task_token, job_id, job_event, sfn_client):
+    sfn_client.send_task_success(
+        taskToken = task_token,
+        output = json.dumps({'jobId': job_id, 'eventType': job_event})
+    )
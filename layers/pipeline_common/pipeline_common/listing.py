@@ -0,0 +1,302 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import copy
+import csv
+import gzip
+import io
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+from botocore.exceptions import ClientError
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import DEFAULT_BATCH_SIZE
+
+'''
+Concurrent bucket listing.
+
+A single list_objects_v2 paginator returns at most 1000 keys per request,
+one request at a time, so listing a bucket with millions of keys takes
+longer than a Lambda timeout. ParallelLister splits the key space into
+ranges and lists them concurrently:
+
+1. Common prefixes are discovered with a '/' delimiter, one level at a time
+   up to LISTING_DISCOVERY_DEPTH levels, until there are enough of them.
+2. Up to LISTING_PARTITIONS - 1 of them, evenly spread, become range
+   boundaries. Each range lists the keys after its lower boundary with
+   StartAfter and stops at its upper boundary, so every key belongs to
+   exactly one range, including keys outside any prefix.
+3. The ranges are listed on a thread pool of LISTING_CONCURRENCY workers.
+   Pages are handed to the caller through a bounded queue as they arrive,
+   so the caller processes keys while the listing continues.
+
+pages() is a generator of (contents, cursor, last) tuples. The cursor holds
+the continuation token of every range up to the page just yielded and can
+be passed to a later pages() call to resume, so pages fetched ahead but not
+processed are listed again rather than lost. Key spaces without common
+prefixes are listed as a single range.
+
+inventory_pages() reads the keys from the latest S3 Inventory report of the
+bucket instead, which needs one GET per inventory file rather than one
+request per 1000 keys. The report is up to a day old: newer objects are only
+found in a later report, and objects removed since are still listed.
+'''
+
+LISTING_CONCURRENCY = int(os.environ.get('listingConcurrency', '8'))
+LISTING_PARTITIONS = int(os.environ.get('listingPartitions', '32'))
+LISTING_DISCOVERY_DEPTH = int(os.environ.get('listingDiscoveryDepth', '2'))
+DISCOVERY_MAX_PAGES = 10
+LISTING_DELIMITER = '/'
+
+INVENTORY_S3_BUCKET = os.environ.get('inventoryS3Bucket', '')
+INVENTORY_PREFIX = os.environ.get('inventoryPrefix', '')
+
+def inventory_enabled():
+    return bool(INVENTORY_S3_BUCKET and INVENTORY_PREFIX)
+
+def not_found(failure):
+    # Move failures of keys that no longer exist, see inventory_pages()
+    return any(code in failure['error'] for code in ('(NoSuchKey)', '(404)'))
+
+def common_prefixes(s3_client, bucket_name, prefix='', delimiter=LISTING_DELIMITER,
+        max_pages=DISCOVERY_MAX_PAGES):
+    found = []
+    list_args = {
+        'Bucket': bucket_name,
+        'Prefix': prefix,
+        'Delimiter': delimiter
+    }
+    for _ in range(max_pages):
+        page = s3_client.list_objects_v2(**list_args)
+        found.extend(entry['Prefix'] for entry in page.get('CommonPrefixes', []))
+        if not page.get('IsTruncated'):
+            break
+        list_args['ContinuationToken'] = page['NextContinuationToken']
+
+    return found
+
+def spread(items, count):
+    # count items evenly spread over the sorted items
+    if len(items) <= count:
+        return list(items)
+    return [items[(index * len(items)) // count] for index in range(count)]
+
+class ParallelLister:
+    def __init__(self, bucket_name, s3_client=None,
+            max_workers=LISTING_CONCURRENCY, partitions=LISTING_PARTITIONS,
+            discovery_depth=LISTING_DISCOVERY_DEPTH, page_size=DEFAULT_BATCH_SIZE):
+        self.bucket_name = bucket_name
+        self.s3_client = s3_client or get_client('s3')
+        self.max_workers = max(1, max_workers)
+        self.partitions = max(1, partitions)
+        self.discovery_depth = discovery_depth
+        self.page_size = page_size
+
+    def discover(self):
+        '''
+        Return the key ranges of the bucket as cursor entries.
+        '''
+        boundaries = []
+        level = ['']
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            for _ in range(self.discovery_depth if self.partitions > 1 else 0):
+                found = [
+                    prefix
+                    for prefixes in executor.map(
+                        lambda prefix: common_prefixes(
+                            self.s3_client, self.bucket_name, prefix),
+                        level
+                    )
+                    for prefix in prefixes
+                ]
+                if not found:
+                    break
+                boundaries.extend(found)
+                if len(boundaries) >= self.partitions - 1:
+                    break
+                # Only descend into as many prefixes as partitions are missing
+                level = spread(sorted(found), self.partitions)
+
+        # Range i lists the keys after bounds[i] up to and including bounds[i + 1]
+        bounds = [None] + spread(sorted(set(boundaries)), self.partitions - 1) + [None]
+
+        return [
+            {
+                'startAfter': start_after,
+                'end': end,
+                'token': None,
+                'done': False
+            }
+            for start_after, end in zip(bounds, bounds[1:])
+        ]
+
+    def _list_range(self, key_range, put, stop):
+        token = key_range['token']
+        while not stop.is_set():
+            list_args = {
+                'Bucket': self.bucket_name,
+                'MaxKeys': self.page_size
+            }
+            if token:
+                list_args['ContinuationToken'] = token
+            elif key_range['startAfter']:
+                list_args['StartAfter'] = key_range['startAfter']
+            try:
+                page = self.s3_client.list_objects_v2(**list_args)
+            except Exception as e:
+                put(('error', e))
+                return
+
+            contents = page.get('Contents', [])
+            end = key_range['end']
+            past_end = end is not None and bool(contents) and contents[-1]['Key'] > end
+            if past_end:
+                contents = [key_data for key_data in contents if key_data['Key'] <= end]
+            token = page.get('NextContinuationToken')
+            done = past_end or not page.get('IsTruncated')
+            if not put(('page', key_range['index'], contents, token, done)) or done:
+                return
+
+    def pages(self, cursor=None):
+        '''
+        Yield (contents, cursor, last) for every page of the bucket, starting
+        from cursor, in no particular order. last is True for the final page.
+        '''
+        if cursor and cursor.get('ranges'):
+            cursor = copy.deepcopy(cursor)
+        else:
+            cursor = {'ranges': self.discover()}
+        ranges = cursor['ranges']
+        pending = [index for index, key_range in enumerate(ranges) if not key_range['done']]
+        if not pending:
+            yield [], copy.deepcopy(cursor), True
+            return
+
+        results = queue.Queue(maxsize = 2 * self.max_workers)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout = 0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        executor = ThreadPoolExecutor(max_workers = min(self.max_workers, len(pending)))
+        try:
+            for index in pending:
+                executor.submit(self._list_range, dict(ranges[index], index = index), put, stop)
+
+            remaining = len(pending)
+            while remaining:
+                item = results.get()
+                if item[0] == 'error':
+                    raise item[1]
+                _, index, contents, token, done = item
+                ranges[index]['token'] = token
+                ranges[index]['done'] = done
+                if done:
+                    remaining -= 1
+                yield contents, copy.deepcopy(cursor), remaining == 0
+        finally:
+            # Also reached when the caller stops early and closes the generator
+            stop.set()
+            executor.shutdown(wait = False)
+
+def latest_inventory_manifest(s3_client, inventory_bucket_name, inventory_prefix):
+    '''
+    Return the key of the manifest.json of the newest complete inventory
+    report under inventory_prefix (destination prefix, source bucket and
+    inventory configuration id), or None.
+    '''
+    report_prefixes = [
+        prefix for prefix in common_prefixes(
+            s3_client, inventory_bucket_name, inventory_prefix.rstrip('/') + '/')
+        if prefix.rstrip('/').rsplit('/', 1)[-1] not in ('data', 'hive')
+    ]
+    for report_prefix in sorted(report_prefixes, reverse = True):
+        try:
+            # Written after manifest.json once the report is complete
+            s3_client.head_object(
+                Bucket = inventory_bucket_name, Key = f'{report_prefix}manifest.checksum')
+        except ClientError:
+            continue
+        return f'{report_prefix}manifest.json'
+
+    return None
+
+def inventory_pages(bucket_name, cursor=None, inventory_bucket_name=INVENTORY_S3_BUCKET,
+        inventory_prefix=INVENTORY_PREFIX, s3_client=None, page_size=DEFAULT_BATCH_SIZE):
+    '''
+    Yield (contents, cursor, last) pages of the keys in the latest CSV S3
+    Inventory report of bucket_name, with the same list_objects_v2 'Contents'
+    entries and resumable cursor as ParallelLister.pages().
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    if cursor and cursor.get('inventory'):
+        cursor = dict(cursor)
+    else:
+        manifest_key = latest_inventory_manifest(
+            s3_client, inventory_bucket_name, inventory_prefix)
+        if manifest_key is None:
+            raise ValueError(f'No inventory report of {bucket_name} found under '
+                f's3://{inventory_bucket_name}/{inventory_prefix}')
+        cursor = {'inventory': manifest_key, 'file': 0, 'row': 0}
+
+    manifest = json.loads(s3_client.get_object(
+        Bucket = inventory_bucket_name, Key = cursor['inventory'])['Body'].read())
+    if manifest.get('fileFormat') != 'CSV':
+        raise ValueError(f"Unsupported inventory format {manifest.get('fileFormat')}")
+    schema = [field.strip() for field in manifest['fileSchema'].split(',')]
+    key_column = schema.index('Key')
+    size_column = schema.index('Size') if 'Size' in schema else None
+    etag_column = schema.index('ETag') if 'ETag' in schema else None
+    checksum_column = (
+        schema.index('ChecksumAlgorithm') if 'ChecksumAlgorithm' in schema else None)
+
+    files = manifest['files']
+    contents = []
+    while cursor['file'] < len(files):
+        body = s3_client.get_object(
+            Bucket = inventory_bucket_name, Key = files[cursor['file']]['key'])['Body']
+        with gzip.GzipFile(fileobj = body, mode = 'rb') as inventory_file:
+            rows = csv.reader(io.TextIOWrapper(inventory_file, encoding = 'utf-8'))
+            for row_number, row in enumerate(rows):
+                if row_number < cursor['row']:
+                    continue
+                key_data = {'Key': unquote_plus(row[key_column])}
+                if size_column is not None and row[size_column]:
+                    key_data['Size'] = int(row[size_column])
+                if etag_column is not None:
+                    key_data['ETag'] = f'"{row[etag_column]}"'
+                if checksum_column is not None and row[checksum_column]:
+                    key_data['ChecksumAlgorithm'] = [row[checksum_column]]
+                contents.append(key_data)
+                if len(contents) == page_size:
+                    cursor['row'] = row_number + 1
+                    yield contents, dict(cursor), False
+                    contents = []
+        cursor['file'] += 1
+        cursor['row'] = 0
+
+    yield contents, dict(cursor), True
@@ -0,0 +1,127 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import gzip
+import io
+import json
+from pipeline_common.clients import get_client
+
+'''
+Per-workflow key manifests.
+
+triggerMacieScan records the exact keys it staged for a workflow as gzipped
+newline-delimited JSON, one {"key": ..., "size": ...} record per line. Each
+invocation of a resumable handler writes its own numbered part. Downstream
+functions read the manifest instead of listing the scan stage bucket and
+reading the WorkflowId tag of every object in it.
+'''
+
+MANIFEST_PREFIX = 'manifests'
+STAGED_MANIFEST = 'staged'
+
+def manifest_key(workflow_id, name=STAGED_MANIFEST, part=0):
+    return f'{MANIFEST_PREFIX}/{workflow_id}/{name}-{part:05d}.ndjson.gz'
+
+def write_manifest(bucket_name, key, records, s3_client=None):
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    buffer = io.BytesIO()
+    count = 0
+    with gzip.GzipFile(fileobj = buffer, mode = 'wb') as manifest_file:
+        for record in records:
+            manifest_file.write(
+                json.dumps(record, separators = (',', ':')).encode('utf-8'))
+            manifest_file.write(b'\n')
+            count += 1
+
+    s3_client.put_object(
+        Bucket = bucket_name,
+        Key = key,
+        Body = buffer.getvalue(),
+        ContentType = 'application/x-ndjson',
+        ContentEncoding = 'gzip'
+    )
+
+    return count
+
+def read_manifest(bucket_name, key, s3_client=None):
+    '''
+    Yield the records of a manifest one at a time, streaming the object body
+    so large manifests are never held in memory as a whole.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    response = s3_client.get_object(Bucket = bucket_name, Key = key)
+    with gzip.GzipFile(fileobj = response['Body'], mode = 'rb') as manifest_file:
+        for line in manifest_file:
+            if line.strip():
+                yield json.loads(line)
+
+def manifest_part_keys(bucket_name, workflow_id, name=STAGED_MANIFEST,
+        s3_client=None):
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    part_keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    page_iterator = paginator.paginate(
+        Bucket = bucket_name,
+        Prefix = f'{MANIFEST_PREFIX}/{workflow_id}/{name}-'
+    )
+    for page in page_iterator:
+        part_keys.extend(key_data['Key'] for key_data in page.get('Contents', []))
+
+    return sorted(part_keys)
+
+def read_manifest_parts(bucket_name, workflow_id, name=STAGED_MANIFEST,
+        s3_client=None):
+    '''
+    Yield the records of every part of a workflow manifest in part order.
+    '''
+    part_keys = manifest_part_keys(bucket_name, workflow_id, name, s3_client)
+    for part_key in part_keys:
+        for record in read_manifest(bucket_name, part_key, s3_client):
+            yield record
+
+def staged_records(key_data_list, move_result):
+    # Objects whose source delete failed were still copied and tagged
+    staged_keys = set(move_result['moved'])
+    staged_keys.update(
+        failure['key'] for failure in move_result['failed']
+        if failure['stage'] == 'delete'
+    )
+
+    # key_data_list holds list_objects_v2 'Contents' entries or manifest records
+    records = []
+    for key_data in key_data_list:
+        key = key_data['Key'] if 'Key' in key_data else key_data['key']
+        if key in staged_keys:
+            record = {
+                'key': key,
+                'size': key_data.get('Size', key_data.get('size', 0)),
+                'etag': key_data.get('ETag', key_data.get('etag'))
+            }
+            checksum = key_data.get('ChecksumSHA256', key_data.get('checksumSha256'))
+            if checksum:
+                record['checksumSha256'] = checksum
+            # Name of the rule that excluded the object from the scan
+            if key_data.get('excluded'):
+                record['excluded'] = key_data['excluded']
+            records.append(record)
+
+    return records
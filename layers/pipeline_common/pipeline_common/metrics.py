@@ -0,0 +1,237 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+'''
+Per-invocation performance metrics of the pipeline functions.
+
+Every boto3 client created by pipeline_common.clients reports its calls
+through botocore event hooks: the number of calls, errors, retries and
+throttled attempts and the time spent, per service operation. The shared
+modules add domain counters (objects moved, bytes copied, findings fetched)
+with add_metric(). Handlers decorated with instrumented() reset the counters
+when they start and print them when they return as CloudWatch Embedded
+Metric Format records, which CloudWatch Logs turns into metrics without any
+PutMetricData call: one record for the invocation and one per API operation.
+
+Results of invocations by the state machine also carry a compact summary of
+the metrics under 'invocationMetrics', from which writeExecutionTimeline
+builds the timeline of the execution (see pipeline_common.timeline).
+'''
+
+METRICS_NAMESPACE = os.environ.get('metricsNamespace', 'MaciePipelineScan')
+METRICS_ENABLED = os.environ.get('metricsEnabled', 'true').lower() == 'true'
+
+THROTTLING_ERROR_CODES = [
+    'BandwidthLimitExceeded',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'SlowDown',
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException'
+]
+
+METRIC_UNITS = {
+    'ApiTime': 'Milliseconds',
+    'BytesCopied': 'Bytes',
+    'BytesStaged': 'Bytes',
+    'ConcurrencyLimit': 'Count',
+    'Duration': 'Milliseconds',
+    'RecommendedWait': 'Seconds'
+}
+
+class InvocationMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = Counter()
+            self.operations = {}
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def record_call(self, operation_name, duration_ms, retries=0, throttles=0,
+            error=False):
+        with self.lock:
+            operation = self.operations.setdefault(operation_name, Counter())
+            operation['ApiCalls'] += 1
+            operation['ApiTime'] += duration_ms
+            operation['ApiRetries'] += retries
+            operation['ApiThrottles'] += throttles
+            operation['ApiErrors'] += 1 if error else 0
+
+    def set_value(self, operation_name, name, value):
+        # Last value of a gauge such as the concurrency limit of the operation
+        with self.lock:
+            self.operations.setdefault(operation_name, Counter())[name] = value
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.counters), {
+                name: Counter(operation) for name, operation in self.operations.items()
+            }
+
+_metrics = InvocationMetrics()
+
+def add_metric(name, value=1):
+    _metrics.add(name, value)
+
+def set_operation_value(operation_name, name, value):
+    _metrics.set_value(operation_name, name, value)
+
+def _operation_name(model):
+    return f'{model.service_model.service_name}.{model.name}'
+
+def _before_call(model, context, **kwargs):
+    context['metricsOperation'] = _operation_name(model)
+    context['metricsStarted'] = time.monotonic()
+    context['metricsThrottles'] = 0
+
+def _needs_retry(response, request_dict, **kwargs):
+    if response is None:
+        return None
+    error_code = response[1].get('Error', {}).get('Code')
+    if error_code in THROTTLING_ERROR_CODES:
+        context = request_dict.get('context', {})
+        context['metricsThrottles'] = context.get('metricsThrottles', 0) + 1
+    return None
+
+def _after_call(http_response, parsed, context, **kwargs):
+    if 'metricsStarted' not in context:
+        return
+    _metrics.record_call(
+        context['metricsOperation'],
+        (time.monotonic() - context['metricsStarted']) * 1000,
+        parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+        context.get('metricsThrottles', 0),
+        http_response.status_code >= 300
+    )
+
+def _after_call_error(context, **kwargs):
+    # Connection errors that exhausted the retries
+    if 'metricsStarted' not in context:
+        return
+    _metrics.record_call(
+        context['metricsOperation'],
+        (time.monotonic() - context['metricsStarted']) * 1000,
+        throttles = context.get('metricsThrottles', 0),
+        error = True
+    )
+
+def register_api_hooks(client):
+    events = client.meta.events
+    events.register('before-call', _before_call)
+    events.register('needs-retry', _needs_retry)
+    events.register('after-call', _after_call)
+    events.register('after-call-error', _after_call_error)
+
+def emf_record(dimensions, metrics, properties=None):
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [
+                    {'Name': name, 'Unit': METRIC_UNITS.get(name, 'Count')}
+                    for name in metrics
+                ]
+            }]
+        }
+    }
+    record.update(properties or {})
+    record.update(dimensions)
+    record.update(metrics)
+
+    return record
+
+def flush_metrics(function_name, duration_ms, properties=None):
+    '''
+    Print the metrics of the invocation as Embedded Metric Format records.
+    '''
+    counters, operations = _metrics.snapshot()
+    for name in ('ApiCalls', 'ApiRetries', 'ApiThrottles', 'ApiErrors'):
+        counters[name] = sum(operation[name] for operation in operations.values())
+    counters['Duration'] = duration_ms
+
+    print(json.dumps(emf_record({'Function': function_name}, counters, properties)))
+    for operation_name, operation in sorted(operations.items()):
+        print(json.dumps(emf_record(
+            {'Function': function_name, 'Operation': operation_name}, operation)))
+
+def invocation_summary(duration_ms):
+    '''
+    Duration, domain counters and API calls per operation of the current
+    invocation, small enough to travel in the state of the execution.
+    '''
+    counters, operations = _metrics.snapshot()
+
+    return {
+        'durationMs': round(duration_ms),
+        'counters': {name: value for name, value in sorted(counters.items()) if value},
+        'apiCalls': {
+            name: operation['ApiCalls'] for name, operation in sorted(operations.items())
+        }
+    }
+
+def instrumented(function_name):
+    '''
+    Decorator of a Lambda handler that collects and prints the metrics of
+    each invocation.
+    '''
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if not METRICS_ENABLED:
+                return handler(event, context)
+
+            _metrics.reset()
+            started = time.monotonic()
+            try:
+                result = handler(event, context)
+                if isinstance(result, dict) and isinstance(event, dict) \
+                        and isinstance(event.get('Input'), dict):
+                    result['invocationMetrics'] = invocation_summary(
+                        (time.monotonic() - started) * 1000)
+                return result
+            finally:
+                properties = {}
+                if isinstance(event, dict) and isinstance(event.get('Input'), dict):
+                    properties['WorkflowId'] = event['Input'].get('id')
+                try:
+                    flush_metrics(
+                        function_name,
+                        (time.monotonic() - started) * 1000,
+                        properties
+                    )
+                except Exception as e:
+                    print('Could not write metrics')
+                    print(e)
+        return wrapper
+    return decorator
@@ -0,0 +1,55 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from pipeline_common.manifest import manifest_key, read_manifest, write_manifest
+
+'''
+Payload by reference for key lists passed between pipeline steps.
+
+Step Functions limits the state to 256 KB, so key lists longer than
+INLINE_KEY_LIMIT are written to the manifest bucket as a compressed manifest
+and only a pointer and the counts travel through the state machine. Small
+lists stay inline to save the S3 round trip. Consumers use finding_keys(),
+which streams the manifest instead of loading it at once.
+'''
+
+INLINE_KEY_LIMIT = int(os.environ.get('inlineKeyLimit', '100'))
+FINDINGS_MANIFEST = 'findings'
+
+def findings_payload(records, bucket_name, workflow_id, s3_client=None):
+    '''
+    Return the payload fields describing the findings records: the key list
+    itself when it is small, otherwise a pointer to a findings manifest.
+    '''
+    if len(records) <= INLINE_KEY_LIMIT:
+        return {'findingKeys': [record['key'] for record in records]}
+
+    key = manifest_key(workflow_id, FINDINGS_MANIFEST)
+    write_manifest(bucket_name, key, records, s3_client)
+
+    return {'findingsManifest': {'bucket': bucket_name, 'key': key}}
+
+def finding_records(findings_info, s3_client=None):
+    if 'findingKeys' in findings_info:
+        return ({'key': key} for key in findings_info['findingKeys'])
+
+    pointer = findings_info['findingsManifest']
+    return read_manifest(pointer['bucket'], pointer['key'], s3_client)
+
+def finding_keys(findings_info, s3_client=None):
+    return (
+        record['key'] for record in finding_records(findings_info, s3_client))
@@ -0,0 +1,264 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import run_batches
+from pipeline_common.metrics import add_metric
+from pipeline_common.s3_move import DEFAULT_MAX_WORKERS, move_objects, object_key
+from pipeline_common.tracing import subsegment
+
+'''
+Pipeline state transitions for the single-bucket layout.
+
+In the single-bucket layout the objects stay in the raw bucket for their
+whole life and their PipelineState tag records how far they went through the
+pipeline: untagged objects are raw, then scan-stage, manual-review and
+scanned-data. A state transition reads the tag set of the object, checks
+that the transition is allowed from its current state and writes the merged
+tag set back, so two small tagging requests replace the copy and delete of a
+move and no object data is rewritten. Tag-based bucket policies in
+template.yaml restrict reads of objects that are not scanned-data to the
+pipeline itself.
+
+advance_objects() and advance_in_batches() take the same arguments as
+move_objects() and move_in_batches() plus the target state. They transition
+the objects in place when the source and target bucket are the same bucket
+and move them otherwise, so each handler keeps a single code path for both
+layouts.
+
+S3 has no conditional tagging request, so a transition compares the current
+state and owner (WorkflowId tag) of the object before it sets the new tag
+set. Objects that are already in a later state, or that belong to another
+workflow, are reported as 'skipped' and left as they are. The only object
+two workflows can both read as theirs is a raw one; in this layout
+triggerMacieScan claims every raw object before staging it (see
+pipeline_common.claims), and the conditional write of the claim completes
+the compare-and-set.
+
+Objects keep their key and last modified time in every state, so a listing
+of the raw bucket also returns the objects that already went through the
+pipeline. After a sweep of the bucket settled every raw object it listed,
+triggerMacieScan records the time the sweep started, less
+SETTLED_MARGIN_SECONDS, in the manifest bucket. Later sweeps drop the listed
+objects last modified before that time without any per-object request. The
+margin covers multipart uploads, whose last modified time is the time the
+upload started, and must be longer than the longest upload.
+'''
+
+PIPELINE_STATE_TAG = 'PipelineState'
+WORKFLOW_ID_TAG = 'WorkflowId'
+
+SETTLED_BEFORE_KEY = 'pipeline-state/settled-before.json'
+SETTLED_MARGIN_SECONDS = int(os.environ.get('settledMarginSeconds', '86400'))
+
+RAW = 'raw'
+SCAN_STAGE = 'scan-stage'
+MANUAL_REVIEW = 'manual-review'
+SCANNED_DATA = 'scanned-data'
+
+# States an object may be in before it transitions to each state
+ALLOWED_TRANSITIONS = {
+    SCAN_STAGE: [RAW],
+    MANUAL_REVIEW: [SCAN_STAGE],
+    SCANNED_DATA: [RAW, SCAN_STAGE, MANUAL_REVIEW]
+}
+
+def in_place(src_bucket_name, target_bucket_name):
+    return src_bucket_name == target_bucket_name
+
+def current_state(tags):
+    return tags.get(PIPELINE_STATE_TAG, RAW)
+
+def owned_by_other(current_tags, tags):
+    owner = (tags or {}).get(WORKFLOW_ID_TAG)
+    current_owner = current_tags.get(WORKFLOW_ID_TAG)
+    return (current_state(current_tags) != RAW and owner is not None
+        and current_owner is not None and current_owner != owner)
+
+def state_tags(tags, state):
+    '''
+    Return tags, if any, with the PipelineState tag set to state.
+    '''
+    new_tags = dict(tags or {})
+    new_tags[PIPELINE_STATE_TAG] = state
+
+    return new_tags
+
+def _transition_object(s3_client, bucket_name, key, state, tags):
+    try:
+        response = s3_client.get_object_tagging(Bucket = bucket_name, Key = key)
+        current_tags = {tag['Key']: tag['Value'] for tag in response['TagSet']}
+        new_tags = dict(current_tags)
+        new_tags.update(tags or {})
+        new_tags = state_tags(new_tags, state)
+
+        if new_tags == current_tags:
+            # Transitioned by an earlier attempt of the same workflow
+            return 'moved', None
+        if (current_state(current_tags) not in ALLOWED_TRANSITIONS[state]
+                or owned_by_other(current_tags, tags)):
+            return 'skipped', None
+
+        s3_client.put_object_tagging(
+            Bucket = bucket_name,
+            Key = key,
+            Tagging = {
+                'TagSet': [
+                    {'Key': tag_key, 'Value': value}
+                    for tag_key, value in new_tags.items()
+                ]
+            }
+        )
+    except Exception as e:
+        return 'failed', {'key': key, 'stage': 'tag', 'error': str(e)}
+
+    return 'moved', None
+
+def transition_objects(bucket_name, keys, state, tags=None,
+        max_workers=DEFAULT_MAX_WORKERS, s3_client=None):
+    '''
+    Set the PipelineState tag of keys in bucket_name to state, keeping their
+    other tags. tags, if given, is a dict of tags to add or overwrite.
+
+    Returns a dict with the list of 'moved' keys, so the result can be used
+    wherever a move_objects result is, the 'failed' entries (stage 'tag')
+    and the 'skipped' keys that are in a state they cannot transition from
+    or belong to another workflow than the WorkflowId of tags.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    object_keys = [object_key(key_data) for key_data in keys]
+    result = {'moved': [], 'failed': [], 'skipped': []}
+    if not object_keys:
+        return result
+
+    worker_count = max(1, min(max_workers, len(object_keys)))
+    with subsegment('transitionObjects', objectCount = len(object_keys),
+            state = state), \
+            ThreadPoolExecutor(max_workers = worker_count) as executor:
+        outcomes = executor.map(
+            lambda key: _transition_object(
+                s3_client, bucket_name, key, state, tags),
+            object_keys
+        )
+        for key, (outcome, failure) in zip(object_keys, outcomes):
+            if outcome == 'failed':
+                result['failed'].append(failure)
+            else:
+                result[outcome].append(key)
+
+    add_metric('ObjectsTransitioned', len(result['moved']))
+    add_metric('ObjectTransitionFailures', len(result['failed']))
+    add_metric('ObjectTransitionsSkipped', len(result['skipped']))
+
+    return result
+
+def advance_objects(src_bucket_name, target_bucket_name, keys, state,
+        tags=None, s3_client=None):
+    '''
+    Bring keys to state: in place when both buckets are the same, otherwise
+    by moving them from src_bucket_name to target_bucket_name with tags.
+    '''
+    if in_place(src_bucket_name, target_bucket_name):
+        return transition_objects(
+            src_bucket_name, keys, state, tags, s3_client = s3_client)
+
+    return move_objects(
+        src_bucket_name, target_bucket_name, keys, tags = tags,
+        s3_client = s3_client)
+
+def advance_in_batches(src_bucket_name, target_bucket_name, keys, state,
+        deadline, offset=0, tags=None, s3_client=None, after_batch=None):
+    '''
+    advance_objects() batch by batch, starting at offset, until all keys are
+    done or the deadline is reached. The result is extended with the new
+    'offset' and whether the keys are 'done', as by move_in_batches().
+    '''
+    result = {'moved': [], 'failed': [], 'skipped': []}
+
+    def advance_batch(batch):
+        batch_result = advance_objects(
+            src_bucket_name,
+            target_bucket_name,
+            batch,
+            state,
+            tags = tags,
+            s3_client = s3_client
+        )
+        result['moved'].extend(batch_result['moved'])
+        result['failed'].extend(batch_result['failed'])
+        result['skipped'].extend(batch_result.get('skipped', []))
+        if after_batch:
+            after_batch(batch, batch_result)
+
+    result['offset'], result['done'] = run_batches(
+        keys, advance_batch, deadline, offset)
+
+    return result
+
+def load_settled_before(bucket_name, s3_client=None):
+    '''
+    Return the time, in seconds since the epoch, before which every object of
+    the raw bucket was last modified has left the raw state, or None.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    try:
+        response = s3_client.get_object(Bucket = bucket_name, Key = SETTLED_BEFORE_KEY)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+    return json.loads(response['Body'].read())['settledBefore']
+
+def save_settled_before(bucket_name, sweep_started, s3_client=None):
+    '''
+    Record that a sweep started at sweep_started settled every raw object it
+    listed. The recorded time never moves back.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    settled_before = sweep_started - SETTLED_MARGIN_SECONDS
+    if settled_before <= (load_settled_before(bucket_name, s3_client) or 0):
+        return
+    s3_client.put_object(
+        Bucket = bucket_name,
+        Key = SETTLED_BEFORE_KEY,
+        Body = json.dumps({'settledBefore': settled_before}).encode('utf-8'),
+        ContentType = 'application/json'
+    )
+
+def drop_settled(key_data_list, settled_before):
+    '''
+    Return the list_objects_v2 'Contents' entries last modified at or after
+    settled_before. Entries without a last modified time are kept.
+    '''
+    if settled_before is None:
+        return list(key_data_list)
+
+    return [
+        key_data for key_data in key_data_list
+        if 'LastModified' not in key_data
+            or key_data['LastModified'].timestamp() >= settled_before
+    ]
@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import datetime
+import os
+
+'''
+Recommended waits between Macie classification job status checks.
+
+A job is expected to take a fixed startup time plus a time proportional to
+the staged objects and bytes. While the expected duration has not elapsed the
+next check is scheduled halfway to the expected end, so a job is checked a
+few times close to when it should finish. Each check also backs off
+exponentially from MIN_WAIT_SECONDS, which bounds the number of checks of a
+job that runs much longer than expected. The wait never exceeds
+MAX_WAIT_SECONDS.
+'''
+
+MIN_WAIT_SECONDS = int(os.environ.get('pollMinWaitSeconds', '10'))
+MAX_WAIT_SECONDS = int(os.environ.get('pollMaxWaitSeconds', '600'))
+JOB_STARTUP_SECONDS = int(os.environ.get('macieJobStartupSeconds', '180'))
+SCAN_BYTES_PER_SECOND = int(os.environ.get('macieScanBytesPerSecond', '5000000'))
+SCAN_SECONDS_PER_OBJECT = float(os.environ.get('macieScanSecondsPerObject', '0.05'))
+
+def expected_job_seconds(staged_count, staged_bytes):
+    return (JOB_STARTUP_SECONDS
+        + staged_count * SCAN_SECONDS_PER_OBJECT
+        + staged_bytes / SCAN_BYTES_PER_SECOND)
+
+def job_age_seconds(created_at, now=None):
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return max(0, (now - created_at).total_seconds())
+
+def recommended_wait(job_age, poll_count, staged_count=0, staged_bytes=0,
+        min_wait=MIN_WAIT_SECONDS, max_wait=MAX_WAIT_SECONDS):
+    '''
+    Return the number of whole seconds to wait before the next status check
+    of a job that has been running for job_age seconds and was already
+    checked poll_count times.
+    '''
+    remaining = expected_job_seconds(staged_count, staged_bytes) - job_age
+    backoff = min_wait * 2 ** min(poll_count, 16)
+    wait = max(remaining / 2, backoff)
+
+    return int(min(max(wait, min_wait), max_wait))
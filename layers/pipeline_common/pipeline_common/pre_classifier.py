@@ -0,0 +1,255 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pipeline_common.metrics import add_metric
+from pipeline_common.s3_move import object_key, object_size
+from pipeline_common.tracing import subsegment
+
+'''
+In-Lambda pre-classifier for small text objects.
+
+A Macie job takes minutes to start and the state machine polls it for at
+least a minute more, which dominates the latency of small batches of small
+CSV and JSON files that mostly turn out clean. When the pre-classifier is
+enabled, triggerMacieScan reads such objects itself with ranged GETs and
+searches them for the detectors in PII_PATTERNS with a multi-pattern
+search: the literal triggers of all detectors are found with bytes.find,
+and a detector's regular expression only runs around its triggers. Objects
+without a match are clean, tagged PreClassified, and go straight to the
+scanned data bucket. Every other object goes to the Macie job as before:
+
+- Objects with a match, after the checksum test of card numbers, are
+  suspicious.
+- Objects with a NUL byte are binary and are also suspicious.
+- Objects not in a plain text format (PRE_CLASSIFIER_EXTENSIONS) are not
+  read at all.
+- Objects larger than PRE_CLASSIFIER_MAX_OBJECT_BYTES are not read at all.
+- Objects left once an invocation has read PRE_CLASSIFIER_BYTE_BUDGET bytes
+  are not read at all.
+
+Macie also finds sensitive data these patterns do not cover, such as names
+and addresses, and objects cleared here are never scanned by Macie. Only
+enable the pre-classifier when PII_PATTERNS covers the sensitive data types
+that matter for the pipeline.
+'''
+
+PRE_CLASSIFIER_ENABLED = os.environ.get('preClassifier', 'false').lower() == 'true'
+PRE_CLASSIFIER_MAX_OBJECT_BYTES = int(
+    os.environ.get('preClassifierMaxObjectBytes', str(1024 ** 2)))
+PRE_CLASSIFIER_BYTE_BUDGET = int(
+    os.environ.get('preClassifierByteBudget', str(64 * 1024 ** 2)))
+PRE_CLASSIFIER_CONCURRENCY = int(os.environ.get('preClassifierConcurrency', '8'))
+PRE_CLASSIFIER_EXTENSIONS = {'csv', 'json', 'jsonl', 'log', 'ndjson', 'tsv', 'txt'}
+
+# Bytes per ranged GET, and bytes of the previous range searched again so
+# that matches spanning two ranges are found
+CHUNK_BYTES = 256 * 1024
+OVERLAP_BYTES = 256
+
+PRE_CLASSIFIED_TAG = 'PreClassified'
+
+CLEAN = 'clean'
+SUSPICIOUS = 'suspicious'
+NOT_CLASSIFIED = 'notClassified'
+
+PII_PATTERNS = {
+    'emailAddress': rb'[A-Za-z0-9._%+-]{1,64}@[A-Za-z0-9-]{1,63}(?:\.[A-Za-z0-9-]{1,63})*\.[A-Za-z]{2,24}',
+    'usSocialSecurityNumber': rb'(?<![0-9-])(?!000|666|9[0-9]{2})[0-9]{3}-(?!00)[0-9]{2}-(?!0000)[0-9]{4}(?![0-9-])',
+    'creditCardNumber': rb'(?<![0-9])(?:[0-9][ -]?){12,18}[0-9](?![0-9])',
+    'usPhoneNumber': rb'(?<![0-9])(?:\+?1[ .-]?)?(?:\([0-9]{3}\) ?|[0-9]{3}[.-])[0-9]{3}[.-][0-9]{4}(?![0-9])',
+    'awsAccessKey': rb'(?<![A-Z0-9])(?:AKIA|ASIA)[A-Z0-9]{16}(?![A-Z0-9])',
+    'privateKey': rb'-----BEGIN (?:[A-Z]+ )?PRIVATE KEY-----',
+    'credential': rb'(?i:password|passwd|secret[_-]?key)["\']?\s*[:=]'
+}
+DETECTORS = {name: re.compile(pattern) for name, pattern in PII_PATTERNS.items()}
+
+# Searching all the patterns at every position of the data is slow in
+# Python, so each detector has literal triggers, searched with bytes.find,
+# and its pattern only runs around a trigger. Digit based triggers are found
+# in a copy of the data with every digit mapped to '0', the separators of
+# numbers to '-' and every other byte to 'x', so one template covers all
+# numbers of a shape.
+DIGIT_SHAPES = bytes(
+    ord('0') if 48 <= byte <= 57
+    else ord('-') if chr(byte) in ' -.()+' else ord('x')
+    for byte in range(256)
+)
+SHAPE_TRIGGERS = [
+    ('usSocialSecurityNumber', b'000-00-0000'),
+    # 206-555-0100, 206.555.0100, (206)555-0100 and (206) 555-0100
+    ('usPhoneNumber', b'000-000-0000'),
+    ('usPhoneNumber', b'000--000-0000'),
+    ('creditCardNumber', b'0000000000000'),
+    ('creditCardNumber', b'0000-0000-0000-0'),
+    ('creditCardNumber', b'0000-000000-00000')
+]
+LITERAL_TRIGGERS = [
+    ('emailAddress', b'@'),
+    ('awsAccessKey', b'AKIA'),
+    ('awsAccessKey', b'ASIA'),
+    ('privateKey', b'PRIVATE KEY-----')
+]
+# Searched in the lower-cased data
+LOWER_TRIGGERS = [
+    ('credential', b'password'),
+    ('credential', b'passwd'),
+    ('credential', b'secret')
+]
+# Bytes around a trigger the detector pattern is run on
+WINDOW_BYTES = 96
+
+def luhn_valid(digits):
+    total = 0
+    for index, digit in enumerate(reversed(digits)):
+        value = digit - 48
+        if index % 2:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return total % 10 == 0
+
+def is_detection(name, match):
+    if name == 'creditCardNumber':
+        digits = bytes(byte for byte in match.group() if 48 <= byte <= 57)
+        return 13 <= len(digits) <= 19 and luhn_valid(digits)
+    return True
+
+def search_triggers(data, searched, triggers):
+    for name, trigger in triggers:
+        position = searched.find(trigger)
+        while position != -1:
+            window = data[max(0, position - WINDOW_BYTES):position + len(trigger) + WINDOW_BYTES]
+            for match in DETECTORS[name].finditer(window):
+                if is_detection(name, match):
+                    return name
+            position = searched.find(trigger, position + 1)
+    return None
+
+def find_pii(data):
+    '''
+    Return the name of the first detector matching data, or None.
+    '''
+    return (search_triggers(data, data, LITERAL_TRIGGERS)
+        or search_triggers(data, data.translate(DIGIT_SHAPES), SHAPE_TRIGGERS)
+        or search_triggers(data, data.lower(), LOWER_TRIGGERS))
+
+def classify_bytes(data):
+    if b'\x00' in data:
+        return SUSPICIOUS, 'binary'
+    detector = find_pii(data)
+    if detector:
+        return SUSPICIOUS, detector
+    return CLEAN, None
+
+def eligible(key, size):
+    name = key.rsplit('/', 1)[-1]
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    return (extension in PRE_CLASSIFIER_EXTENSIONS and size is not None
+        and size <= PRE_CLASSIFIER_MAX_OBJECT_BYTES)
+
+class ByteBudget:
+    def __init__(self, total_bytes):
+        self.remaining = total_bytes
+        self.lock = threading.Lock()
+
+    def take(self, size):
+        with self.lock:
+            if size > self.remaining:
+                return False
+            self.remaining -= size
+            return True
+
+class PreClassifier:
+    def __init__(self, bucket_name, s3_client, byte_budget=PRE_CLASSIFIER_BYTE_BUDGET,
+            max_workers=PRE_CLASSIFIER_CONCURRENCY):
+        self.bucket_name = bucket_name
+        self.s3_client = s3_client
+        self.budget = ByteBudget(byte_budget)
+        self.max_workers = max_workers
+
+    def classify_object(self, key, size, etag=None):
+        '''
+        Return the verdict of one object and the detector or reason behind
+        a suspicious verdict.
+        '''
+        tail = b''
+        for first in range(0, size, CHUNK_BYTES):
+            get_args = {
+                'Bucket': self.bucket_name,
+                'Key': key,
+                'Range': f'bytes={first}-{min(first + CHUNK_BYTES, size) - 1}'
+            }
+            # The verdict must be for the content that was listed
+            if etag:
+                get_args['IfMatch'] = etag
+            chunk = self.s3_client.get_object(**get_args)['Body'].read()
+            verdict, reason = classify_bytes(tail + chunk)
+            if verdict != CLEAN:
+                return verdict, reason
+            tail = chunk[-OVERLAP_BYTES:]
+
+        return CLEAN, None
+
+    def _classify(self, key_data):
+        key = object_key(key_data)
+        size = object_size(key_data)
+        if not eligible(key, size) or not self.budget.take(size):
+            return NOT_CLASSIFIED, None
+        try:
+            return self.classify_object(key, size, key_data.get('ETag', key_data.get('etag')))
+        except Exception as e:
+            # Changed or removed since it was listed, or not readable
+            return NOT_CLASSIFIED, str(e)
+
+    def split_clean(self, key_data_list):
+        '''
+        Split list_objects_v2 'Contents' entries or manifest records into the
+        objects found clean and the rest.
+        '''
+        key_data_list = list(key_data_list)
+        if not key_data_list:
+            return [], []
+
+        with subsegment('preClassify'), ThreadPoolExecutor(
+                max_workers = min(self.max_workers, len(key_data_list))) as executor:
+            verdicts = list(executor.map(self._classify, key_data_list))
+
+        clean = []
+        remaining = []
+        for key_data, (verdict, _) in zip(key_data_list, verdicts):
+            if verdict == CLEAN:
+                clean.append(key_data)
+            else:
+                remaining.append(key_data)
+
+        add_metric('ObjectsPreClassifiedClean', len(clean))
+        add_metric('ObjectsPreClassifiedSuspicious',
+            sum(1 for verdict, _ in verdicts if verdict == SUSPICIOUS))
+        add_metric('BytesPreClassified', sum(
+            object_size(key_data) for key_data, (verdict, _) in zip(key_data_list, verdicts)
+            if verdict != NOT_CLASSIFIED
+        ))
+        return clean, remaining
+
+def open_pre_classifier(bucket_name, s3_client):
+    if not PRE_CLASSIFIER_ENABLED:
+        return None
+    return PreClassifier(bucket_name, s3_client)
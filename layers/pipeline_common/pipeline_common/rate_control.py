@@ -0,0 +1,178 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import threading
+import time
+from pipeline_common.metrics import THROTTLING_ERROR_CODES, set_operation_value
+
+'''
+Adaptive concurrency of AWS API calls.
+
+The thread pools of the move, delete and findings paths are sized for the
+best case. When S3 answers SlowDown on a hot prefix or Macie throttles
+get_findings, every extra concurrent call only adds retries. Each service
+operation (for example s3.CopyObject) therefore gets an AIMD limiter on the
+number of attempts in flight: every attempt that completes without being
+throttled raises the limit by 1 / limit, so by about one per round of
+attempts, and a throttled attempt halves it. Attempts started before the
+last decrease do not decrease it again, so one burst of throttling backs off
+once.
+
+The limiters are attached to every client of pipeline_common.clients through
+botocore event hooks, so callers keep calling the client directly.
+Attempts beyond the limit wait on the calling thread. botocore still retries
+the throttled attempts itself, and a slot is not held while it backs off.
+Clients use botocore's standard retry mode by default: its adaptive mode adds
+a client side token bucket that, combined with these limiters, backs off
+twice. It can still be selected with the apiRetryMode environment variable.
+'''
+
+ADAPTIVE_CONCURRENCY = os.environ.get('adaptiveConcurrency', 'true').lower() == 'true'
+INITIAL_CONCURRENCY = int(os.environ.get('initialConcurrency', '8'))
+MAX_CONCURRENCY = int(os.environ.get('maxConcurrency', '50'))
+MIN_CONCURRENCY = 1
+BACKOFF_RATIO = 0.5
+
+class AimdLimiter:
+    def __init__(self, initial_limit=INITIAL_CONCURRENCY, min_limit=MIN_CONCURRENCY,
+            max_limit=MAX_CONCURRENCY, backoff_ratio=BACKOFF_RATIO):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self.generation = 0
+        self.condition = threading.Condition()
+        self.stats = {
+            'attempts': 0,
+            'throttled': 0,
+            'decreases': 0,
+            'peakInFlight': 0,
+            'waitMs': 0.0
+        }
+
+    def acquire(self):
+        '''
+        Wait until an attempt may start. Returns the generation to pass to
+        release().
+        '''
+        started = time.monotonic()
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            self.stats['attempts'] += 1
+            self.stats['peakInFlight'] = max(self.stats['peakInFlight'], self.in_flight)
+            self.stats['waitMs'] += (time.monotonic() - started) * 1000
+            return self.generation
+
+    def release(self, generation, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.stats['throttled'] += 1
+                if generation == self.generation:
+                    # Multiplicative decrease, once per burst
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                    self.generation += 1
+                    self.stats['decreases'] += 1
+            else:
+                # Additive increase of about one per round of attempts
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return dict(
+                self.stats,
+                limit = round(self.limit, 2),
+                inFlight = self.in_flight
+            )
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(operation_name):
+    limiter = _limiters.get(operation_name)
+    if limiter is not None:
+        return limiter
+
+    with _limiters_lock:
+        limiter = _limiters.get(operation_name)
+        if limiter is None:
+            limiter = AimdLimiter()
+            _limiters[operation_name] = limiter
+
+    return limiter
+
+def limiter_stats():
+    '''
+    Current limit and counters of every limiter, keyed by operation name.
+    The limiters live as long as the execution environment, so warm
+    invocations start from the limit the previous ones converged to.
+    '''
+    with _limiters_lock:
+        limiters = dict(_limiters)
+
+    return {name: limiter.snapshot() for name, limiter in sorted(limiters.items())}
+
+def _before_call(model, context, **kwargs):
+    context['limiterOperation'] = f'{model.service_model.service_name}.{model.name}'
+
+def _request_created(request, **kwargs):
+    # Emitted for every attempt, retries included
+    context = getattr(request, 'context', None)
+    if not context or 'limiterOperation' not in context:
+        return
+    limiter = get_limiter(context['limiterOperation'])
+    context['limiterGeneration'] = limiter.acquire()
+    context['limiter'] = limiter
+
+def _release(context, throttled):
+    limiter = context.pop('limiter', None)
+    if limiter is None:
+        return
+    limiter.release(context['limiterGeneration'], throttled)
+    set_operation_value(context['limiterOperation'], 'ConcurrencyLimit', limiter.limit)
+
+def _needs_retry(response, request_dict, **kwargs):
+    # Emitted after every attempt, before botocore sleeps for the retry, so
+    # the slot is not held during the backoff
+    throttled = False
+    if response is not None:
+        parsed = response[1]
+        # DeleteObjects reports SlowDown per key in a successful response
+        throttled = parsed.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES or any(
+            error.get('Code') in THROTTLING_ERROR_CODES
+            for error in parsed.get('Errors', [])
+            if isinstance(error, dict)
+        )
+    _release(request_dict.get('context', {}), throttled)
+    return None
+
+def _after_call_error(context, **kwargs):
+    # Errors raised before the attempt reached needs-retry
+    _release(context, False)
+
+def register_limiter_hooks(client):
+    if not ADAPTIVE_CONCURRENCY:
+        return
+    events = client.meta.events
+    events.register('before-call', _before_call)
+    events.register('request-created', _request_created)
+    events.register('needs-retry', _needs_retry)
+    events.register('after-call-error', _after_call_error)
@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+
+'''
+Structured results returned by the pipeline Lambda functions.
+
+The state machine branches on 'status' instead of relying on a handler
+returning nothing after printing an exception. Resumable handlers also
+return 'done' and a 'cursor' (see pipeline_common.continuation).
+'''
+
+SUCCEEDED = 'SUCCEEDED'
+PARTIAL = 'PARTIAL'
+FAILED = 'FAILED'
+
+# Failures beyond this are only counted, to keep the state payload small
+MAX_REPORTED_FAILURES = int(os.environ.get('maxReportedFailures', '100'))
+
+def summarize(processed, failed, previous=None, failed_count=None, **extra):
+    '''
+    Build a status summary. processed is a list or a count of processed
+    keys and failed a list of failure entries. previous is the summary returned by
+    an earlier invocation of a resumable handler; its counts and failures
+    are carried forward. failed_count overrides len(failed) when the list
+    has already been truncated.
+
+    Only the first MAX_REPORTED_FAILURES entries are kept in 'failed';
+    'failedCount' always counts every failure.
+    '''
+    processed_count = processed if isinstance(processed, int) else len(processed)
+    failed = list(failed)
+    if failed_count is None:
+        failed_count = len(failed)
+    if previous:
+        processed_count += previous.get('processedCount', 0)
+        failed_count += previous.get('failedCount', 0)
+        failed = previous.get('failed', []) + failed
+
+    if not failed_count:
+        status = SUCCEEDED
+    elif processed_count:
+        status = PARTIAL
+    else:
+        status = FAILED
+
+    summary = {
+        'status': status,
+        'processedCount': processed_count,
+        'failedCount': failed_count,
+        'failed': failed[:MAX_REPORTED_FAILURES]
+    }
+    summary.update(extra)
+    return summary
+
+def error_result(message, error):
+    print(message)
+    print(error)
+    return {
+        'status': FAILED,
+        'processedCount': 0,
+        'failedCount': 0,
+        'failed': [],
+        'error': f'{message}: {error}',
+        'done': True
+    }
+
+def log_failures(message, failed):
+    if failed:
+        print(message)
+        for failure in failed:
+            print(f"{failure['key']} ({failure['stage']}): {failure['error']}")
@@ -0,0 +1,162 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import run_batches
+from pipeline_common.metrics import THROTTLING_ERROR_CODES, add_metric
+from pipeline_common.tracing import subsegment
+
+'''
+Batched S3 deletes.
+
+Keys are grouped into DeleteObjects requests of up to 1000 keys. The
+per-key Errors array of each response is parsed and only the keys that
+failed with a retryable error code are sent again, with exponential
+backoff between attempts. A request that fails as a whole is only sent
+again after throttling, a server error or a connection error; any other
+error, such as AccessDenied or NoSuchBucket, fails its keys at once.
+'''
+
+MAX_KEYS_PER_REQUEST = 1000
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_MAX_WORKERS = 4
+RETRY_BASE_DELAY_SECONDS = 0.2
+
+RETRYABLE_ERROR_CODES = {
+    'InternalError',
+    'RequestTimeout',
+    'ServiceUnavailable',
+    'SlowDown',
+    'Throttling',
+    'ThrottlingException'
+}
+
+def retryable(error):
+    if isinstance(error, (ConnectionError, HTTPClientError)):
+        return True
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get('Error', {}).get('Code')
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+    return code in RETRYABLE_ERROR_CODES or code in THROTTLING_ERROR_CODES or status >= 500
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _delete_chunk(s3_client, bucket_name, keys, max_attempts):
+    pending = list(keys)
+    failed = []
+    attempt = 0
+
+    while pending:
+        attempt += 1
+        retry = []
+        try:
+            response = s3_client.delete_objects(
+                Bucket = bucket_name,
+                Delete = {
+                    'Objects': [{'Key': key} for key in pending],
+                    'Quiet': True
+                }
+            )
+            for error in response.get('Errors', []):
+                failure = {
+                    'key': error['Key'],
+                    'stage': 'delete',
+                    'error': f"{error.get('Code')}: {error.get('Message')}"
+                }
+                if error.get('Code') in RETRYABLE_ERROR_CODES:
+                    retry.append(failure)
+                else:
+                    failed.append(failure)
+        except Exception as e:
+            failures = [
+                {'key': key, 'stage': 'delete', 'error': str(e)}
+                for key in pending
+            ]
+            if retryable(e):
+                retry = failures
+            else:
+                failed.extend(failures)
+
+        if not retry:
+            break
+        if attempt >= max_attempts:
+            failed.extend(retry)
+            break
+
+        add_metric('DeleteRetries', len(retry))
+
+        time.sleep(RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1)))
+        pending = [failure['key'] for failure in retry]
+
+    return failed
+
+def delete_objects(bucket_name, keys, max_attempts=DEFAULT_MAX_ATTEMPTS,
+        max_workers=DEFAULT_MAX_WORKERS, s3_client=None):
+    '''
+    Delete keys from bucket_name in batches of up to 1000 keys.
+
+    Returns a dict with the list of 'deleted' keys and a list of 'failed'
+    entries, each holding the key, the stage ('delete') and the last error.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    result = {'deleted': [], 'failed': []}
+    if not keys:
+        return result
+
+    batches = list(chunks(list(keys), MAX_KEYS_PER_REQUEST))
+    worker_count = max(1, min(max_workers, len(batches)))
+    with subsegment('deleteObjects', objectCount = len(keys)), \
+            ThreadPoolExecutor(max_workers = worker_count) as executor:
+        outcomes = executor.map(
+            lambda batch: _delete_chunk(
+                s3_client, bucket_name, batch, max_attempts),
+            batches
+        )
+        for batch, failed in zip(batches, outcomes):
+            failed_keys = set(failure['key'] for failure in failed)
+            result['deleted'].extend(
+                key for key in batch if key not in failed_keys)
+            result['failed'].extend(failed)
+
+    add_metric('ObjectsDeleted', len(result['deleted']))
+    return result
+
+def delete_in_batches(bucket_name, keys, deadline, offset=0, s3_client=None):
+    '''
+    Delete keys batch by batch, starting at offset, until all keys are
+    deleted or the deadline is reached. The result of delete_objects is
+    extended with the new 'offset' and whether the keys are 'done'.
+    '''
+    result = {'deleted': [], 'failed': []}
+
+    def delete_batch(batch):
+        batch_result = delete_objects(bucket_name, batch, s3_client = s3_client)
+        result['deleted'].extend(batch_result['deleted'])
+        result['failed'].extend(batch_result['failed'])
+
+    result['offset'], result['done'] = run_batches(
+        keys, delete_batch, deadline, offset,
+        batch_size = MAX_KEYS_PER_REQUEST * DEFAULT_MAX_WORKERS)
+
+    return result
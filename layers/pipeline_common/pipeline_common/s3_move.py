@@ -0,0 +1,169 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from botocore.exceptions import ClientError
+from pipeline_common.clients import get_client
+from pipeline_common.continuation import run_batches
+from pipeline_common.metrics import add_metric
+from pipeline_common.s3_delete import delete_objects
+from pipeline_common.s3_multipart import multipart_copy, needs_multipart
+from pipeline_common.tracing import subsegment
+
+'''
+Shared S3 move engine.
+
+Objects are copied to the target bucket on a bounded thread pool over one
+pooled S3 client, then the copied sources are removed with batched
+DeleteObjects requests. Tags are applied as part of the copy (TaggingDirective
+REPLACE) so no separate tagging call is needed. Every object is reported
+individually as moved or failed so a single bad key no longer aborts the rest
+of the batch. Large objects are copied with a parallel multipart copy (see
+pipeline_common.s3_multipart) when their size is known from the listing or
+manifest, or when CopyObject rejects them as too large.
+'''
+
+DEFAULT_MAX_WORKERS = int(os.environ.get('moveConcurrency', '16'))
+
+def object_key(key_data):
+    # Accept plain key names, list_objects_v2 'Contents' entries or manifest records
+    if isinstance(key_data, dict):
+        return key_data['Key'] if 'Key' in key_data else key_data['key']
+    return key_data
+
+def object_size(key_data):
+    if isinstance(key_data, dict):
+        return key_data.get('Size', key_data.get('size'))
+    return None
+
+def _too_large_for_copy(error):
+    return (error.response['Error']['Code'] == 'InvalidRequest'
+        and 'maximum allowable size' in error.response['Error'].get('Message', ''))
+
+def copy_object(s3_client, src_bucket_name, target_bucket_name, key, tags=None,
+        size=None):
+    if needs_multipart(size):
+        return multipart_copy(
+            s3_client, src_bucket_name, target_bucket_name, key, tags)
+
+    copy_args = {
+        'Bucket': target_bucket_name,
+        'CopySource': {
+            'Bucket': src_bucket_name,
+            'Key': key
+        },
+        'Key': key
+    }
+    if tags is not None:
+        copy_args['TaggingDirective'] = 'REPLACE'
+        copy_args['Tagging'] = urlencode(tags)
+
+    try:
+        return s3_client.copy_object(**copy_args)
+    except ClientError as e:
+        if size is not None or not _too_large_for_copy(e):
+            raise
+
+    return multipart_copy(s3_client, src_bucket_name, target_bucket_name, key, tags)
+
+def _copy_object(s3_client, src_bucket_name, target_bucket_name, key, tags,
+        size):
+    try:
+        copy_object(
+            s3_client, src_bucket_name, target_bucket_name, key, tags, size)
+    except Exception as e:
+        return {'key': key, 'stage': 'copy', 'error': str(e)}
+
+    if size:
+        add_metric('BytesCopied', size)
+    return None
+
+def move_objects(src_bucket_name, target_bucket_name, keys, tags=None,
+        max_workers=DEFAULT_MAX_WORKERS, s3_client=None):
+    '''
+    Move keys from src_bucket_name to target_bucket_name.
+
+    keys may be key names, list_objects_v2 'Contents' entries or manifest
+    records; the size of the latter two selects the copy method. tags, if
+    given, is a dict that replaces the tag set of the copied objects.
+
+    Returns a dict with the list of 'moved' keys and a list of 'failed'
+    entries, each holding the key, the stage that failed ('copy' or
+    'delete') and the error message. A 'delete' failure means the object
+    exists in both buckets.
+    '''
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    objects = [(object_key(key_data), object_size(key_data)) for key_data in keys]
+    result = {'moved': [], 'failed': []}
+    if not objects:
+        return result
+
+    copied = []
+    worker_count = max(1, min(max_workers, len(objects)))
+    with subsegment('copyObjects', objectCount = len(objects)), \
+            ThreadPoolExecutor(max_workers = worker_count) as executor:
+        outcomes = executor.map(
+            lambda item: _copy_object(
+                s3_client, src_bucket_name, target_bucket_name, item[0], tags,
+                item[1]),
+            objects
+        )
+        for (key, size), failure in zip(objects, outcomes):
+            if failure is None:
+                copied.append(key)
+            else:
+                result['failed'].append(failure)
+
+    delete_result = delete_objects(
+        src_bucket_name, copied, s3_client = s3_client)
+    result['moved'] = delete_result['deleted']
+    result['failed'].extend(delete_result['failed'])
+    add_metric('ObjectsMoved', len(result['moved']))
+    add_metric('ObjectMoveFailures', len(result['failed']))
+
+    return result
+
+def move_in_batches(src_bucket_name, target_bucket_name, keys, deadline,
+        offset=0, tags=None, s3_client=None, after_batch=None):
+    '''
+    Move keys batch by batch, starting at offset, until all keys are moved
+    or the deadline is reached. The result of move_objects is extended with
+    the new 'offset' and whether the keys are 'done'. after_batch, if given,
+    is called with each batch and its move_objects result.
+    '''
+    result = {'moved': [], 'failed': []}
+
+    def move_batch(batch):
+        batch_result = move_objects(
+            src_bucket_name,
+            target_bucket_name,
+            batch,
+            tags = tags,
+            s3_client = s3_client
+        )
+        result['moved'].extend(batch_result['moved'])
+        result['failed'].extend(batch_result['failed'])
+        if after_batch:
+            after_batch(batch, batch_result)
+
+    result['offset'], result['done'] = run_batches(
+        keys, move_batch, deadline, offset)
+
+    return result
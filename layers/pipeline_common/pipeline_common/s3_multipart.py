@@ -0,0 +1,143 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from pipeline_common.metrics import add_metric
+
+'''
+Parallel multipart server-side copy for large S3 objects.
+
+CopyObject is a single request that is slow for multi-GB objects and fails
+for objects above 5 GB. Objects of at least MULTIPART_THRESHOLD_BYTES are
+instead copied with UploadPartCopy, one request per byte range of
+MULTIPART_PART_SIZE_BYTES, on a pool of MULTIPART_MAX_WORKERS threads. The
+source content type, metadata and (unless tags are given) tags are carried
+over as CopyObject does, and every part is copied only if the source ETag is
+unchanged. An upload that fails is aborted so no incomplete parts are left
+behind.
+'''
+
+MAX_COPY_OBJECT_BYTES = 5 * 1024 ** 3
+MIN_PART_SIZE_BYTES = 5 * 1024 ** 2
+MAX_PARTS = 10000
+
+MULTIPART_THRESHOLD_BYTES = int(
+    os.environ.get('multipartThresholdBytes', str(1024 ** 3)))
+MULTIPART_PART_SIZE_BYTES = int(
+    os.environ.get('multipartPartSizeBytes', str(256 * 1024 ** 2)))
+MULTIPART_MAX_WORKERS = int(os.environ.get('multipartCopyConcurrency', '8'))
+
+# Headers CopyObject copies from the source object by default
+COPIED_HEADERS = [
+    'CacheControl',
+    'ContentDisposition',
+    'ContentEncoding',
+    'ContentLanguage',
+    'ContentType',
+    'Expires',
+    'Metadata'
+]
+
+def needs_multipart(size, threshold=MULTIPART_THRESHOLD_BYTES):
+    return size is not None and size >= min(threshold, MAX_COPY_OBJECT_BYTES + 1)
+
+def part_ranges(size, part_size=MULTIPART_PART_SIZE_BYTES):
+    '''
+    Split size bytes into inclusive (first, last) byte ranges, growing the
+    part size when needed to stay within the S3 limit of MAX_PARTS parts.
+    '''
+    part_size = max(part_size, MIN_PART_SIZE_BYTES, math.ceil(size / MAX_PARTS))
+    return [
+        (first, min(first + part_size, size) - 1)
+        for first in range(0, size, part_size)
+    ]
+
+def _copy_part(s3_client, upload, src_bucket_name, key, etag, part_number,
+        byte_range):
+    response = s3_client.upload_part_copy(
+        Bucket = upload['Bucket'],
+        Key = key,
+        UploadId = upload['UploadId'],
+        PartNumber = part_number,
+        CopySource = {'Bucket': src_bucket_name, 'Key': key},
+        CopySourceIfMatch = etag,
+        CopySourceRange = 'bytes=%d-%d' % byte_range
+    )
+
+    return {
+        'ETag': response['CopyPartResult']['ETag'],
+        'PartNumber': part_number
+    }
+
+def multipart_copy(s3_client, src_bucket_name, target_bucket_name, key,
+        tags=None, part_size=MULTIPART_PART_SIZE_BYTES,
+        max_workers=MULTIPART_MAX_WORKERS):
+    source = s3_client.head_object(Bucket = src_bucket_name, Key = key)
+
+    upload_args = {
+        header: source[header] for header in COPIED_HEADERS if header in source
+    }
+    if tags is None:
+        tag_set = s3_client.get_object_tagging(
+            Bucket = src_bucket_name, Key = key)['TagSet']
+        tags = {tag['Key']: tag['Value'] for tag in tag_set}
+    if tags:
+        upload_args['Tagging'] = urlencode(tags)
+
+    upload = s3_client.create_multipart_upload(
+        Bucket = target_bucket_name,
+        Key = key,
+        **upload_args
+    )
+
+    try:
+        ranges = part_ranges(source['ContentLength'], part_size)
+        worker_count = max(1, min(max_workers, len(ranges)))
+        with ThreadPoolExecutor(max_workers = worker_count) as executor:
+            parts = list(executor.map(
+                lambda part: _copy_part(
+                    s3_client,
+                    upload,
+                    src_bucket_name,
+                    key,
+                    source['ETag'],
+                    part[0],
+                    part[1]
+                ),
+                enumerate(ranges, 1)
+            ))
+
+        add_metric('MultipartCopies')
+        return s3_client.complete_multipart_upload(
+            Bucket = target_bucket_name,
+            Key = key,
+            UploadId = upload['UploadId'],
+            MultipartUpload = {'Parts': parts}
+        )
+    except Exception:
+        try:
+            s3_client.abort_multipart_upload(
+                Bucket = target_bucket_name,
+                Key = key,
+                UploadId = upload['UploadId']
+            )
+        except Exception as e:
+            print(f'Could not abort multipart upload of {key}')
+            print(e)
+        raise
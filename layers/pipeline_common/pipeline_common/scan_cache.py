@@ -0,0 +1,297 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pipeline_common.clients import get_client
+from pipeline_common.metrics import add_metric
+from pipeline_common.s3_delete import chunks
+
+'''
+Scan verdict cache keyed by object content.
+
+Producers often upload identical files again (daily full extracts, retried
+uploads). The cache records the verdict of every scanned object under its
+SHA-256 checksum and size; triggerMacieScan sends objects with a recent
+CLEAN verdict straight to the scanned data bucket instead of into the next
+Macie job. SENSITIVE verdicts never skip a scan, but replace an earlier
+CLEAN verdict of the same content.
+
+Only objects uploaded with a SHA-256 checksum are looked up. An ETag is an
+MD5 digest or depends on the part size, and content with the ETag of a
+clean object can be crafted, so objects without a SHA-256 checksum are
+always scanned. list_objects_v2 only returns the checksum algorithm of each
+object; the checksum itself is read with one HeadObject request per object
+that has one. Object events carry no checksum algorithm, so the checksum of
+every object of an event batch is read.
+
+Verdicts expire after SCAN_CACHE_TTL_SECONDS. The production backend is a
+DynamoDB table with TTL enabled on 'expiresAt'; as TTL deletion is lazy,
+expired items are also ignored on read. A SQLite file backend can be used
+for local runs and tests. open_scan_cache() returns None when no backend is
+configured, and callers then scan everything as before.
+'''
+
+CLEAN = 'CLEAN'
+SENSITIVE = 'SENSITIVE'
+
+SCAN_CACHE_TTL_SECONDS = int(os.environ.get('scanCacheTtlSeconds', '604800'))
+
+# DynamoDB limits per BatchGetItem and BatchWriteItem request
+MAX_GET_KEYS = 100
+MAX_WRITE_ITEMS = 25
+MAX_UNPROCESSED_ATTEMPTS = 5
+
+DEFAULT_MAX_WORKERS = int(os.environ.get('scanCacheConcurrency', '16'))
+
+def content_key(checksum, size):
+    '''
+    Return the cache key of an object, or None when it has no SHA-256
+    checksum. Checksums of multipart uploads depend on the part size, so a
+    file uploaded with a different part size is simply not found.
+    '''
+    if not checksum or size is None:
+        return None
+    return f'{checksum}:{size}'
+
+def record_content_key(record):
+    # Accept list_objects_v2 'Contents' entries or manifest records
+    return content_key(
+        record.get('ChecksumSHA256', record.get('checksumSha256')),
+        record.get('Size', record.get('size'))
+    )
+
+def has_sha256_checksum(key_data):
+    return 'SHA256' in (key_data.get('ChecksumAlgorithm') or [])
+
+def _read_checksum(s3_client, bucket_name, key_data):
+    try:
+        response = s3_client.head_object(
+            Bucket = bucket_name,
+            Key = key_data['Key'],
+            ChecksumMode = 'ENABLED'
+        )
+    except Exception as e:
+        print(f"Could not read checksum of {key_data['Key']}")
+        print(e)
+        return None
+
+    return response.get('ChecksumSHA256')
+
+def add_checksums(bucket_name, key_data_list, s3_client=None, listed=True,
+        max_workers=DEFAULT_MAX_WORKERS):
+    '''
+    Return copies of the list_objects_v2 'Contents' entries with the
+    'ChecksumSHA256' of the objects that have one. The other entries are
+    returned as they are. Unless the entries are listed, their checksum
+    algorithm is unknown and the checksum of every object is read.
+    '''
+    key_data_list = list(key_data_list)
+    candidates = [
+        index for index, key_data in enumerate(key_data_list)
+        if (has_sha256_checksum(key_data) or not listed)
+            and not key_data.get('ChecksumSHA256')
+    ]
+    if not candidates:
+        return key_data_list
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    with ThreadPoolExecutor(max_workers = min(max_workers, len(candidates))) as executor:
+        checksums = executor.map(
+            lambda index: _read_checksum(s3_client, bucket_name, key_data_list[index]),
+            candidates
+        )
+        for index, checksum in zip(candidates, checksums):
+            if checksum:
+                key_data_list[index] = dict(
+                    key_data_list[index], ChecksumSHA256 = checksum)
+    add_metric('ChecksumsRead', len(candidates))
+
+    return key_data_list
+
+class DynamoDBScanCache:
+    def __init__(self, table_name, dynamodb_client=None,
+            ttl_seconds=SCAN_CACHE_TTL_SECONDS):
+        self.table_name = table_name
+        self.dynamodb_client = dynamodb_client or get_client('dynamodb')
+        self.ttl_seconds = ttl_seconds
+
+    def get_verdicts(self, keys):
+        '''
+        Return a dict of content key to verdict for the keys with an
+        unexpired verdict.
+        '''
+        now = int(time.time())
+        verdicts = {}
+        for chunk in chunks(sorted(set(keys)), MAX_GET_KEYS):
+            request = {self.table_name: {
+                'Keys': [{'contentKey': {'S': key}} for key in chunk],
+                'ProjectionExpression': 'contentKey, verdict, expiresAt'
+            }}
+            for attempt in range(MAX_UNPROCESSED_ATTEMPTS):
+                response = self.dynamodb_client.batch_get_item(
+                    RequestItems = request)
+                for item in response['Responses'].get(self.table_name, []):
+                    if int(item['expiresAt']['N']) > now:
+                        verdicts[item['contentKey']['S']] = item['verdict']['S']
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+
+        return verdicts
+
+    def put_verdicts(self, verdicts):
+        expires_at = str(int(time.time()) + self.ttl_seconds)
+        items = sorted(verdicts.items())
+        for chunk in chunks(items, MAX_WRITE_ITEMS):
+            request = {self.table_name: [
+                {'PutRequest': {'Item': {
+                    'contentKey': {'S': key},
+                    'verdict': {'S': verdict},
+                    'expiresAt': {'N': expires_at}
+                }}}
+                for key, verdict in chunk
+            ]}
+            for attempt in range(MAX_UNPROCESSED_ATTEMPTS):
+                response = self.dynamodb_client.batch_write_item(
+                    RequestItems = request)
+                request = response.get('UnprocessedItems')
+                if not request:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+
+class SQLiteScanCache:
+    def __init__(self, path, ttl_seconds=SCAN_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts ('
+            'content_key TEXT PRIMARY KEY, verdict TEXT, expires_at INTEGER)')
+
+    def get_verdicts(self, keys):
+        now = int(time.time())
+        verdicts = {}
+        with self.lock:
+            for chunk in chunks(sorted(set(keys)), MAX_GET_KEYS):
+                rows = self.connection.execute(
+                    'SELECT content_key, verdict FROM verdicts '
+                    'WHERE expires_at > ? AND content_key IN (%s)'
+                    % ','.join('?' * len(chunk)),
+                    [now] + chunk
+                )
+                verdicts.update(rows)
+
+        return verdicts
+
+    def put_verdicts(self, verdicts):
+        expires_at = int(time.time()) + self.ttl_seconds
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM verdicts WHERE expires_at <= ?', [int(time.time())])
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?)',
+                [(key, verdict, expires_at) for key, verdict in verdicts.items()]
+            )
+
+def open_scan_cache():
+    backend = os.environ.get('scanCacheBackend', 'none')
+    if backend == 'dynamodb':
+        return DynamoDBScanCache(os.environ['scanCacheTable'])
+    if backend == 'sqlite':
+        return SQLiteScanCache(os.environ.get('scanCachePath', '/tmp/scan-cache.db'))
+    return None
+
+def split_cached_clean(scan_cache, bucket_name, key_data_list, s3_client=None,
+        listed=True):
+    '''
+    Split list_objects_v2 'Contents' entries of bucket_name into those with
+    a cached CLEAN verdict and the rest, adding the SHA-256 checksum of the
+    objects that have one (see add_checksums()), so their verdict can be
+    recorded once they are scanned. A cache error is logged and treated as a
+    miss.
+    '''
+    if scan_cache is None:
+        return [], list(key_data_list)
+
+    key_data_list = add_checksums(bucket_name, key_data_list, s3_client, listed)
+    try:
+        verdicts = scan_cache.get_verdicts(
+            key for key in map(record_content_key, key_data_list) if key)
+    except Exception as e:
+        print('Could not read scan cache')
+        print(e)
+        return [], list(key_data_list)
+
+    clean = []
+    remaining = []
+    for key_data in key_data_list:
+        if verdicts.get(record_content_key(key_data)) == CLEAN:
+            clean.append(key_data)
+        else:
+            remaining.append(key_data)
+
+    add_metric('ScanCacheHits', len(clean))
+    return clean, remaining
+
+def record_verdicts(scan_cache, records, verdict):
+    '''
+    Record verdict for the records with a SHA-256 checksum and size. Cache
+    errors are logged and never fail the pipeline step.
+    '''
+    if scan_cache is None:
+        return
+
+    verdicts = {}
+    for record in records:
+        key = record_content_key(record)
+        if key:
+            verdicts[key] = verdict
+
+    try:
+        if verdicts:
+            scan_cache.put_verdicts(verdicts)
+    except Exception as e:
+        print(f'Could not record {verdict} verdicts in scan cache')
+        print(e)
+
+def moved_verdict_recorder(scan_cache, verdict):
+    '''
+    Return an after_batch callback for move_in_batches that records verdict
+    for the moved manifest records of each batch, or None without a cache.
+    Objects excluded from the scan have no verdict and are not recorded.
+    '''
+    if scan_cache is None:
+        return None
+
+    def record_batch(batch, batch_result):
+        moved = set(batch_result['moved'])
+        record_verdicts(
+            scan_cache,
+            [
+                record for record in batch
+                if isinstance(record, dict) and record.get('key') in moved
+                    and not record.get('excluded')
+            ],
+            verdict
+        )
+
+    return record_batch
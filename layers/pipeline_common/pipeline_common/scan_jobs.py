@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import math
+import os
+
+'''
+Split the objects of one workflow across several concurrent Macie
+classification jobs.
+
+Objects are assigned to scan shards while they are staged: each object goes
+to the shard with the lowest load, where the load is the object size
+weighted by how expensive its file type is to scan. A new shard is opened
+once every open shard holds SCAN_JOB_TARGET_BYTES, up to MAX_SCAN_JOBS
+shards, so small batches still run as a single job. When the total size is
+known up front, as for event-driven batches, the shards are opened at once
+so they end up evenly loaded. Each shard is tagged
+with its ScanShard value and scanned by its own job, so the wall-clock time
+of a large batch drops with the number of shards.
+'''
+
+SCAN_SHARD_TAG = 'ScanShard'
+
+MAX_SCAN_JOBS = int(os.environ.get('maxScanJobs', '4'))
+SCAN_JOB_TARGET_BYTES = int(
+    os.environ.get('scanJobTargetBytes', str(50 * 1024 ** 3)))
+
+# Relative scan cost per byte of file types that are decompressed or parsed
+TYPE_WEIGHTS = {
+    'avro': 2.0,
+    'bz2': 3.0,
+    'docx': 2.0,
+    'gz': 3.0,
+    'orc': 2.0,
+    'parquet': 2.0,
+    'pdf': 2.0,
+    'snappy': 3.0,
+    'xlsx': 2.0,
+    'zip': 3.0
+}
+
+# Statuses of a job set, from the one that wins when jobs disagree
+JOB_STATUS_PRIORITY = [
+    'CANCELLED',
+    'USER_PAUSED',
+    'PAUSED',
+    'RUNNING',
+    'IDLE',
+    'COMPLETE'
+]
+
+def object_weight(key, size):
+    extension = key.rsplit('.', 1)[-1].lower() if '.' in key else ''
+    return size * TYPE_WEIGHTS.get(extension, 1.0)
+
+class ScanShardPlanner:
+    '''
+    Online, load-balanced assignment of objects to scan shards. loads is the
+    list of shard loads returned by an earlier invocation, if any, and
+    total_bytes the size of all objects when it is known.
+    '''
+    def __init__(self, loads=None, total_bytes=None,
+            target_bytes=SCAN_JOB_TARGET_BYTES, max_shards=MAX_SCAN_JOBS):
+        self.target_bytes = target_bytes
+        self.max_shards = max(1, max_shards)
+        if loads:
+            self.loads = list(loads)
+        elif total_bytes:
+            self.loads = [0] * min(
+                self.max_shards, max(1, math.ceil(total_bytes / target_bytes)))
+        else:
+            self.loads = []
+
+    def assign(self, key, size):
+        weight = object_weight(key, size or 0)
+        if not self.loads or (min(self.loads) >= self.target_bytes
+                and len(self.loads) < self.max_shards):
+            self.loads.append(0)
+        shard = self.loads.index(min(self.loads))
+        self.loads[shard] += weight
+
+        return shard
+
+def job_ids(job_info):
+    '''
+    Return the classification job ids of a triggerMacieScan result.
+    '''
+    if job_info.get('jobIds'):
+        return job_info['jobIds']
+    return [job_info['jobId']]
+
+def combined_job_status(statuses):
+    '''
+    Return the status of a job set: COMPLETE only when every job is, and
+    otherwise the status of the least advanced job.
+    '''
+    for status in JOB_STATUS_PRIORITY:
+        if status in statuses:
+            return status
+    return statuses[0]
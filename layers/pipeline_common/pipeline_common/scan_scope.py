@@ -0,0 +1,185 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pipeline_common.metrics import add_metric
+from pipeline_common.s3_move import object_key, object_size
+
+'''
+Pre-scan scoping rules.
+
+Some staged objects are not worth a Macie scan: zero-byte markers, job
+output markers such as _SUCCESS, media and binary formats Macie cannot
+classify, and objects larger than a classification job analyzes. They still
+go through the pipeline with the rest of the workflow, but triggerMacieScan
+tags them with ScanExcluded while staging them and the classification jobs
+exclude that tag, so the jobs do not spend time on them. The jobs report no
+findings for them, and excluded objects are not recorded as clean in the
+scan cache.
+
+The rules are a JSON list read from the scanExclusionRules environment
+variable, or DEFAULT_EXCLUSION_RULES when it is not set. A rule matches an
+object when all of its conditions hold, and an object is excluded by the
+first rule that matches:
+
+    extensions    file extensions, without the dot
+    keyPattern    regular expression searched in the key
+    minSize       objects of at least this many bytes
+    maxSize       objects of at most this many bytes
+    contentTypes  Content-Type prefixes, such as "video/"
+
+Listings and S3 events do not carry the content type, so contentTypes is
+only checked, with a HeadObject request, for objects that match the other
+conditions of the rule. Objects whose HeadObject request fails, for example
+because they were deleted since they were listed, are not excluded by a
+contentTypes rule. An empty list disables the rules.
+'''
+
+SCAN_EXCLUDED_TAG = 'ScanExcluded'
+EXCLUDED_SHARD = 'excluded'
+
+DEFAULT_EXCLUSION_RULES = [
+    {'name': 'empty', 'maxSize': 0},
+    {'name': 'marker', 'keyPattern': r'(^|/)(_SUCCESS|_SUCCESS\.crc|\.keep|\.gitkeep|[^/]*_\$folder\$)$'},
+    {'name': 'unsupportedType', 'extensions': [
+        'avi', 'dll', 'dmg', 'exe', 'flac', 'iso', 'm4a', 'mkv', 'mov',
+        'mp3', 'mp4', 'mpeg', 'ogg', 'so', 'wav', 'webm', 'wmv'
+    ]},
+    {'name': 'oversized', 'minSize': 8 * 1024 ** 3}
+]
+RULE_CONDITIONS = ['extensions', 'keyPattern', 'minSize', 'maxSize', 'contentTypes']
+
+HEAD_CONCURRENCY = 8
+
+class ExclusionRule:
+    def __init__(self, rule):
+        conditions = [name for name in RULE_CONDITIONS if name in rule]
+        if not conditions:
+            raise ValueError(f'Scan exclusion rule {rule} has no conditions')
+        self.name = rule.get('name', ','.join(conditions))
+        self.extensions = set(
+            extension.lower().lstrip('.') for extension in rule.get('extensions', []))
+        self.key_pattern = re.compile(rule['keyPattern']) if 'keyPattern' in rule else None
+        self.min_size = rule.get('minSize')
+        self.max_size = rule.get('maxSize')
+        self.content_types = tuple(
+            content_type.lower() for content_type in rule.get('contentTypes', []))
+
+    def matches_listing(self, key, size):
+        '''
+        Whether the conditions known from a listing hold. Rules on the size
+        never match objects of unknown size.
+        '''
+        if self.extensions:
+            extension = key.rsplit('.', 1)[-1].lower() if '.' in key.rsplit('/', 1)[-1] else ''
+            if extension not in self.extensions:
+                return False
+        if self.key_pattern is not None and not self.key_pattern.search(key):
+            return False
+        if self.min_size is not None and (size is None or size < self.min_size):
+            return False
+        if self.max_size is not None and (size is None or size > self.max_size):
+            return False
+        return True
+
+    def matches_content_type(self, content_type):
+        return not self.content_types or (content_type or '').lower().startswith(
+            self.content_types)
+
+def load_exclusion_rules():
+    rules = os.environ.get('scanExclusionRules')
+    if rules is None or not rules.strip():
+        rules = DEFAULT_EXCLUSION_RULES
+    else:
+        rules = json.loads(rules)
+
+    return [ExclusionRule(rule) for rule in rules]
+
+EXCLUSION_RULES = load_exclusion_rules()
+
+def split_excluded(bucket_name, key_data_list, s3_client, rules=None):
+    '''
+    Split list_objects_v2 'Contents' entries or manifest records into those
+    excluded from the scan and the rest. The excluded entries are returned
+    as copies with the name of the matching rule in 'excluded'.
+    '''
+    rules = EXCLUSION_RULES if rules is None else rules
+    if not rules:
+        return [], list(key_data_list)
+
+    # First rule matching the listing, and the rules that also need a HEAD
+    candidates = []
+    for key_data in key_data_list:
+        key = object_key(key_data)
+        size = object_size(key_data)
+        candidates.append([
+            rule for rule in rules if rule.matches_listing(key, size)
+        ])
+
+    needs_head = [
+        index for index, matching in enumerate(candidates)
+        if matching and matching[0].content_types
+    ]
+    content_types = {}
+    if needs_head:
+        def head(index):
+            key = object_key(key_data_list[index])
+            try:
+                response = s3_client.head_object(Bucket = bucket_name, Key = key)
+            except Exception as e:
+                # Scanned like any object whose content type does not match
+                print(f'Could not read the content type of {key}')
+                print(e)
+                return index, None
+            return index, response.get('ContentType')
+
+        with ThreadPoolExecutor(max_workers = min(HEAD_CONCURRENCY, len(needs_head))) as executor:
+            content_types = dict(executor.map(head, needs_head))
+
+    excluded = []
+    remaining = []
+    for index, key_data in enumerate(key_data_list):
+        rule = next((
+            rule for rule in candidates[index]
+            if not rule.content_types or rule.matches_content_type(content_types.get(index))
+        ), None)
+        if rule is None:
+            remaining.append(key_data)
+        else:
+            excluded.append(dict(key_data, excluded = rule.name))
+
+    if excluded:
+        add_metric('ObjectsExcludedFromScan', len(excluded))
+        add_metric('BytesExcludedFromScan', sum(object_size(key_data) or 0 for key_data in excluded))
+    return excluded, remaining
+
+def exclusion_scope():
+    '''
+    Classification job 'excludes' scope of the objects tagged as excluded.
+    '''
+    return {
+        'and': [{
+            'tagScopeTerm': {
+                'comparator': 'EQ',
+                'key': 'TAG',
+                'tagValues': [{'key': SCAN_EXCLUDED_TAG, 'value': 'true'}],
+                'target': 'S3_OBJECT'
+            }
+        }]
+    }
@@ -0,0 +1,42 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import itertools
+import os
+
+'''
+Shard planning for fanned-out object moves.
+
+A shard is an {"offset": ..., "count": ...} range over an ordered key source
+(a workflow manifest or the findings key list), so the shard plan stays small
+no matter how many keys it covers. Each shard is processed by a separate
+invocation of a move or delete function inside a Step Functions Map state.
+'''
+
+DEFAULT_SHARD_SIZE = int(os.environ.get('shardSize', '5000'))
+
+def plan_shards(key_count, shard_size=DEFAULT_SHARD_SIZE):
+    return [
+        {'offset': offset, 'count': min(shard_size, key_count - offset)}
+        for offset in range(0, key_count, shard_size)
+    ]
+
+def shard_items(items, shard):
+    # Without a shard the whole key source is processed
+    if not shard:
+        return items
+    return itertools.islice(
+        items, shard['offset'], shard['offset'] + shard['count'])
@@ -0,0 +1,317 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import datetime
+import json
+import math
+from collections import Counter, OrderedDict
+from pipeline_common.clients import get_client
+
+'''
+Execution timelines.
+
+When an execution of the state machine ends, writeExecutionTimeline reads
+its history and writes a compact timeline to the manifest bucket under
+timelines/<execution name>.json: when each top-level state ran and for how
+long, the objects and bytes of the batch, the API calls of the functions
+(from the 'invocationMetrics' of their results, see
+pipeline_common.metrics) and the statistics of the Macie jobs.
+
+States are grouped into phases so executions can be compared:
+
+    staging       listing, claiming and staging the raw objects
+    macieWait     waiting for the Macie jobs, polled or event driven
+    findings      collecting and disposing of the findings
+    approvalWait  manual approval, from the notification to the decisions
+    moves         moving and deleting the objects after the scan
+
+The Macie job statistics split macieWait further: 'queueSeconds' is the
+time from the creation of a job to its last run, and 'runToDoneSeconds'
+the time from that run until the state machine saw the job complete, which
+includes the polling delay.
+
+benchmarks/pipeline_timelines.py aggregates timelines into percentiles and
+replays the batch shape of a timeline against the local stand-ins.
+'''
+
+TIMELINE_PREFIX = 'timelines'
+
+PHASES = OrderedDict([
+    ('staging', ['triggerMacieScan', 'waitForStagingJob']),
+    ('macieWait', ['checkMacieStatus', 'pollForCompletionWait', 'waitForMacieJobEvent']),
+    ('findings', ['getMacieFindingsCount', 'disposeFindings']),
+    ('approvalWait', ['triggerManualApproval', 'applyApprovalDecisions']),
+    ('moves', [
+        'planStagedShards', 'moveAllScanStageS3Files', 'moveAllScanStageS3FilesMap',
+        'waitForMoveAllScanStageJob', 'planFindingsShards', 'moveToManualReviewS3Files',
+        'moveToManualReviewS3FilesMap', 'waitForMoveToManualReviewJob',
+        'aggregateManualReviewShards', 'moveToScannedDataS3Files',
+        'moveToScannedDataS3FilesMap', 'waitForMoveToScannedDataJob',
+        'deleteManualReviewS3Files', 'deleteManualReviewS3FilesMap',
+        'aggregateFileOperationShards'
+    ])
+])
+STATE_PHASES = {
+    state_name: phase for phase, state_names in PHASES.items() for state_name in state_names
+}
+
+# Counts reported by the final result of the staging and findings states
+BATCH_COUNTS = {
+    'triggerMacieScan': ['stagedCount', 'stagedBytes', 'cachedCleanCount',
+        'excludedCount', 'excludedBytes', 'preClassifiedCleanCount'],
+    'getMacieFindingsCount': ['findingsCount', 'disposedCount']
+}
+
+def timeline_key(execution_name):
+    return f'{TIMELINE_PREFIX}/{execution_name}.json'
+
+def write_timeline(bucket_name, timeline, s3_client=None):
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    key = timeline_key(timeline['execution']['name'])
+    s3_client.put_object(
+        Bucket = bucket_name,
+        Key = key,
+        Body = json.dumps(timeline, indent = 1).encode('utf-8'),
+        ContentType = 'application/json'
+    )
+
+    return key
+
+def _seconds(timestamp):
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.timestamp()
+    return float(timestamp)
+
+def _iso(seconds):
+    return datetime.datetime.fromtimestamp(
+        seconds, datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def top_level_spans(history_events):
+    '''
+    Pair the StateEntered and StateExited events of the top-level states of
+    an execution history, in the order of get_execution_history. Yields
+    (state name, started, ended, output) with the times in epoch seconds
+    and the output parsed; states of Map iterations are left out, as the
+    span of their Map state covers them.
+    '''
+    depth = 0
+    entered = None
+    for event in history_events:
+        event_type = event['type']
+        if event_type == 'MapIterationStarted':
+            depth += 1
+        elif event_type in ('MapIterationSucceeded', 'MapIterationFailed',
+                'MapIterationAborted'):
+            depth -= 1
+        elif depth:
+            continue
+        elif event_type.endswith('StateEntered'):
+            entered = (
+                event['stateEnteredEventDetails']['name'],
+                _seconds(event['timestamp'])
+            )
+        elif event_type.endswith('StateExited') and entered:
+            details = event['stateExitedEventDetails']
+            output = details.get('output')
+            yield (
+                entered[0],
+                entered[1],
+                _seconds(event['timestamp']),
+                json.loads(output) if output else None
+            )
+            entered = None
+
+def _result(output, result_path):
+    # The Payload a state stored at its ResultPath, if any
+    value = output
+    for name in result_path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(name)
+    if isinstance(value, dict) and 'Payload' in value:
+        return value['Payload']
+    return value
+
+# ResultPath of the states whose results the timeline reads
+RESULT_PATHS = {
+    'triggerMacieScan': ['jobId'],
+    'checkMacieStatus': ['jobStatus'],
+    'waitForMacieJobEvent': ['jobEvent'],
+    'getMacieFindingsCount': ['macieFindingsInfo'],
+    'disposeFindings': ['dispositionResult'],
+    'planStagedShards': ['stagedShardPlan'],
+    'planFindingsShards': ['findingsShardPlan'],
+    'moveToManualReviewS3Files': ['reviewMoveResult'],
+    'moveToManualReviewS3FilesMap': ['reviewMoveResult'],
+    'aggregateManualReviewShards': ['reviewMoveResult'],
+    'triggerManualApproval': ['taskresult'],
+    'applyApprovalDecisions': ['approvalResult']
+}
+FILE_OPERATION_RESULT = ['fileOperationResult']
+
+def state_result(spans, state_name):
+    '''
+    Result of the last run of a top-level state, None if it did not run.
+    '''
+    result = None
+    for name, entered, exited, output in spans:
+        if name == state_name:
+            result = _result(output, RESULT_PATHS.get(state_name, FILE_OPERATION_RESULT))
+
+    return result
+
+def _invocation_metrics(result):
+    if isinstance(result, list):
+        for item in result:
+            yield from _invocation_metrics(item)
+    elif isinstance(result, dict) and 'invocationMetrics' in result:
+        yield result['invocationMetrics']
+
+def build_timeline(execution, spans, macie_jobs=None, batch_shape=None):
+    '''
+    Build the timeline of an execution from its top-level state spans.
+    execution holds the 'name', 'workflowId', 'status', 'startDate' and
+    'stopDate' of the execution; macie_jobs the describe_classification_job
+    responses of its jobs and batch_shape the result of batch_shape().
+    '''
+    started = _seconds(execution['startDate'])
+    stopped = _seconds(execution['stopDate'])
+
+    stages = OrderedDict()
+    phases = OrderedDict((phase, 0.0) for phase in list(PHASES) + ['other'])
+    counts = OrderedDict()
+    api_calls = Counter()
+    macie_checks = 0
+    macie_wait_end = None
+    for state_name, entered, exited, output in spans:
+        seconds = max(0.0, exited - entered)
+        phase = STATE_PHASES.get(state_name, 'other')
+        stage = stages.setdefault(state_name, {
+            'phase': phase,
+            'entries': 0,
+            'seconds': 0.0,
+            'startOffset': round(entered - started, 3),
+            'endOffset': None,
+            'invocationSeconds': 0.0,
+            'apiCalls': Counter(),
+            'counters': Counter()
+        })
+        stage['entries'] += 1
+        stage['seconds'] += seconds
+        stage['endOffset'] = round(exited - started, 3)
+        phases[phase] += seconds
+
+        result = _result(output, RESULT_PATHS.get(state_name, FILE_OPERATION_RESULT))
+        for metrics in _invocation_metrics(result):
+            stage['invocationSeconds'] += metrics['durationMs'] / 1000
+            stage['apiCalls'].update(metrics['apiCalls'])
+            stage['counters'].update(metrics['counters'])
+            api_calls.update(metrics['apiCalls'])
+        if isinstance(result, dict):
+            for name in BATCH_COUNTS.get(state_name, []):
+                if name in result:
+                    counts[name] = result[name]
+            if 'processedCount' in result and result.get('done', True):
+                # Counts of summarize(), cumulative over the continuations
+                stage['processedCount'] = result['processedCount']
+                stage['failedCount'] = result['failedCount']
+        if state_name == 'checkMacieStatus':
+            macie_checks += 1
+        if phase == 'macieWait':
+            macie_wait_end = exited
+
+    for stage in stages.values():
+        stage['seconds'] = round(stage['seconds'], 3)
+        stage['invocationSeconds'] = round(stage['invocationSeconds'], 3)
+        stage['apiCalls'] = dict(stage['apiCalls'])
+        stage['counters'] = dict(stage['counters'])
+
+    seconds = stopped - started
+    timeline = OrderedDict([
+        ('execution', {
+            'name': execution['name'],
+            'workflowId': execution.get('workflowId'),
+            'status': execution['status'],
+            'start': _iso(started),
+            'end': _iso(stopped),
+            'seconds': round(seconds, 3)
+        }),
+        ('phases', OrderedDict(
+            (phase, round(value, 3)) for phase, value in phases.items())),
+        ('stages', stages),
+        ('counts', dict(counts)),
+        ('throughput', {
+            'objectsPerSecond': round(counts['stagedCount'] / seconds, 3)
+                if counts.get('stagedCount') and seconds else None,
+            'bytesPerSecond': round(counts['stagedBytes'] / seconds, 3)
+                if counts.get('stagedBytes') and seconds else None
+        }),
+        ('apiCalls', dict(api_calls)),
+        ('macie', macie_summary(macie_jobs or [], macie_checks, macie_wait_end))
+    ])
+    if batch_shape is not None:
+        timeline['batchShape'] = batch_shape
+
+    return timeline
+
+def macie_summary(jobs, checks, wait_end):
+    summary = {'jobs': [], 'checks': checks}
+    run_starts = []
+    for job in jobs:
+        created = _seconds(job['createdAt'])
+        last_run = _seconds(job['lastRunTime']) if job.get('lastRunTime') else None
+        if last_run is not None:
+            run_starts.append(last_run)
+        summary['jobs'].append({
+            'jobId': job['jobId'],
+            'status': job.get('jobStatus'),
+            'objects': job.get('statistics', {}).get('approximateNumberOfObjectsToProcess'),
+            'queueSeconds': round(last_run - created, 3) if last_run is not None else None
+        })
+    if summary['jobs'] and run_starts:
+        summary['queueSeconds'] = max(job['queueSeconds'] or 0 for job in summary['jobs'])
+        if wait_end is not None:
+            summary['runToDoneSeconds'] = round(max(0.0, wait_end - min(run_starts)), 3)
+
+    return summary
+
+def batch_shape(records):
+    '''
+    Number of objects and bytes of a workflow manifest, with the object
+    sizes as a histogram of powers of two (the key is the upper bound) and
+    the number of objects per file extension, enough to replay a batch of
+    the same shape.
+    '''
+    objects = 0
+    total_bytes = 0
+    sizes = Counter()
+    extensions = Counter()
+    for record in records:
+        size = record.get('size') or 0
+        objects += 1
+        total_bytes += size
+        sizes[str(2 ** math.ceil(math.log2(size)) if size > 1 else size)] += 1
+        name = record['key'].rsplit('/', 1)[-1]
+        extensions[name.rsplit('.', 1)[-1].lower() if '.' in name else ''] += 1
+
+    return {
+        'objects': objects,
+        'bytes': total_bytes,
+        'sizeHistogram': dict(sorted(sizes.items(), key = lambda item: int(item[0]))),
+        'extensions': dict(extensions.most_common(20))
+    }
@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+from contextlib import contextmanager
+
+'''
+Optional AWS X-Ray subsegments around the hot loops of the pipeline.
+
+The X-Ray SDK is only imported when the tracingEnabled environment variable,
+set from the EnableTracing parameter, is true, so functions without active
+tracing do not pay for the import. Lambda sets _X_AMZN_TRACE_ID under
+PassThrough tracing too, so it cannot tell whether tracing is on. Without
+the SDK or an active segment, subsegment() does nothing. Subsegments are
+opened on the handler thread only, as the X-Ray context does not follow
+work submitted to thread pools.
+'''
+
+TRACING_ENABLED = os.environ.get('tracingEnabled', 'false').lower() == 'true'
+
+_recorder = None
+_recorder_loaded = False
+
+def _xray_recorder():
+    global _recorder, _recorder_loaded
+
+    if not TRACING_ENABLED:
+        return None
+    if not _recorder_loaded:
+        _recorder_loaded = True
+        try:
+            from aws_xray_sdk.core import xray_recorder
+            _recorder = xray_recorder
+        except ImportError:
+            _recorder = None
+    return _recorder
+
+@contextmanager
+def subsegment(name, **annotations):
+    '''
+    Record the enclosed block as an X-Ray subsegment with the given
+    annotations. Yields the subsegment, or None when tracing is off.
+    '''
+    recorder = _xray_recorder()
+    segment = None
+    if recorder is not None:
+        try:
+            segment = recorder.begin_subsegment(name)
+        except Exception as e:
+            print(f'Could not start X-Ray subsegment {name}')
+            print(e)
+        if segment is not None:
+            for key, value in annotations.items():
+                segment.put_annotation(key, value)
+
+    try:
+        yield segment
+    finally:
+        if segment is not None:
+            recorder.end_subsegment()
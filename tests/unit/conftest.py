@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [
+    ROOT,
+    os.path.join(ROOT, 'layers', 'pipeline_common'),
+    os.path.join(ROOT, 'benchmarks')
+]
+
+# Read by the pipeline_common modules when they are first imported
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('scanCacheBackend', 'none')
+os.environ.setdefault('metricsEnabled', 'false')
+
+class LambdaContext:
+    def __init__(self, remaining_ms=600000):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+@pytest.fixture
+def aws():
+    '''
+    The in-process AWS stand-ins of the benchmarks, returned by
+    pipeline_common.clients.get_client for the duration of a test.
+    '''
+    from pipeline_common import clients
+    from stand_ins import AwsStandIns, install
+
+    stand_ins = AwsStandIns()
+    install(stand_ins)
+    yield stand_ins
+    with clients._clients_lock:
+        clients._clients.clear()
+
+@pytest.fixture
+def context():
+    return LambdaContext()
+
+@pytest.fixture
+def expired_context():
+    # Less time than the safety margin of a Deadline
+    return LambdaContext(remaining_ms = 0)
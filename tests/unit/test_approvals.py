@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import botocore.session
+import pytest
+from botocore.stub import ANY, Stubber
+
+from pipeline_common.approvals import (ALLOW, DELETE, ApprovalDecisions, applied_decisions,
+    decision_log_key, decision_log_keys, parse_decisions, put_decisions, save_applied_count,
+    undecided)
+
+def test_parse_decisions_normalizes_actions():
+    assert parse_decisions('Approve', keys = ['a.csv', ''], prefixes = ['logs/']) == [
+        {'action': ALLOW, 'key': 'a.csv'},
+        {'action': ALLOW, 'prefix': 'logs/'}
+    ]
+    assert parse_decisions('deny') == [{'action': DELETE}]
+    with pytest.raises(ValueError):
+        parse_decisions('maybe')
+
+def test_latest_decision_for_a_key_wins():
+    decisions = ApprovalDecisions([
+        [{'action': ALLOW, 'key': 'logs/a.csv'}],
+        [{'action': DELETE, 'prefix': 'logs/'}],
+        [{'action': ALLOW, 'key': 'logs/b.csv'}]
+    ])
+
+    assert decisions.decision_for('logs/a.csv') == DELETE
+    assert decisions.decision_for('logs/b.csv') == ALLOW
+    assert decisions.decision_for('logs/c.csv') == DELETE
+    assert decisions.decision_for('other.csv') is None
+
+def test_batch_wide_decision_leaves_keys_undecided():
+    decisions = ApprovalDecisions([[{'action': DELETE}]])
+    records = [{'key': 'a.csv'}]
+
+    assert decisions.final_action == DELETE
+    assert not decisions
+    assert list(undecided(records, decisions)) == records
+
+def test_applied_decisions_are_the_first_applied_requests(aws):
+    put_decisions('manifests', 'workflow', [{'action': ALLOW, 'key': 'a.csv'}], aws.s3)
+    put_decisions('manifests', 'workflow', [{'action': DELETE, 'key': 'b.csv'}], aws.s3)
+    save_applied_count('manifests', 'workflow', 1, aws.s3)
+    put_decisions('manifests', 'workflow', [{'action': DELETE, 'key': 'a.csv'}], aws.s3)
+
+    decisions = applied_decisions('manifests', 'workflow')
+
+    assert decisions.decision_for('a.csv') == ALLOW
+    assert decisions.decision_for('b.csv') is None
+
+def test_no_applied_decisions(aws):
+    put_decisions('manifests', 'workflow', [{'action': ALLOW, 'key': 'a.csv'}], aws.s3)
+
+    assert not applied_decisions('manifests', 'workflow')
+
+def test_decisions_racing_for_a_sequence_number_land_after_it(aws):
+    list_objects = aws.s3.list_objects_v2
+
+    def list_objects_before_a_racing_request(**kwargs):
+        response = list_objects(**kwargs)
+        aws.s3.list_objects_v2 = list_objects
+        put_decisions('manifests', 'workflow', [{'action': ALLOW, 'key': 'a.csv'}], aws.s3)
+        return response
+    aws.s3.list_objects_v2 = list_objects_before_a_racing_request
+
+    assert put_decisions('manifests', 'workflow', [{'action': DELETE, 'key': 'a.csv'}], aws.s3) == 1
+    assert decision_log_keys('manifests', 'workflow', aws.s3) == [
+        decision_log_key('workflow', 0), decision_log_key('workflow', 1)]
+
+def test_put_decisions_is_a_valid_conditional_write():
+    # The stand-ins accept any parameter, a stubbed client validates them
+    s3_client = botocore.session.get_session().create_client(
+        's3', region_name = 'us-east-1',
+        aws_access_key_id = 'testing', aws_secret_access_key = 'testing')
+    with Stubber(s3_client) as stubber:
+        stubber.add_response('list_objects_v2', {
+            'Contents': [{'Key': decision_log_key('workflow', 0)}]
+        }, {'Bucket': 'manifests', 'Prefix': 'approvals/workflow/decisions/'})
+        stubber.add_client_error('put_object', 'PreconditionFailed', http_status_code = 412)
+        stubber.add_response('put_object', {}, {
+            'Bucket': 'manifests',
+            'Key': decision_log_key('workflow', 2),
+            'Body': ANY,
+            'ContentType': 'application/json',
+            'IfNoneMatch': '*'
+        })
+
+        assert put_decisions('manifests', 'workflow', [{'action': ALLOW}], s3_client) == 2
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,76 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import pytest
+
+from pipeline_common.claims import SQLiteClaimStore, claim_objects, release_objects
+
+@pytest.fixture
+def claim_store(tmp_path):
+    return SQLiteClaimStore(str(tmp_path / 'claims.db'))
+
+def test_keys_claimed_by_another_owner_are_not_claimed(claim_store):
+    assert claim_store.claim(['a', 'b'], 'first') == ['a', 'b']
+
+    assert claim_store.claim(['b', 'c'], 'second') == ['c']
+
+def test_owner_claims_its_keys_again(claim_store):
+    claim_store.claim(['a'], 'first')
+
+    assert claim_store.claim(['a', 'a'], 'first') == ['a']
+
+def test_expired_claims_are_claimed_by_another_owner(tmp_path):
+    claim_store = SQLiteClaimStore(str(tmp_path / 'claims.db'), lease_seconds = 0)
+    claim_store.claim(['a'], 'first')
+
+    assert claim_store.claim(['a'], 'second') == ['a']
+
+def test_claims_are_shared_through_the_file(claim_store, tmp_path):
+    claim_store.claim(['a'], 'first')
+
+    other_process = SQLiteClaimStore(str(tmp_path / 'claims.db'))
+
+    assert other_process.claim(['a'], 'second') == []
+
+def test_only_the_owner_releases_its_claims(claim_store):
+    claim_store.claim(['a', 'b'], 'first')
+
+    claim_store.release(['a'], 'second')
+    claim_store.release(['b'], 'first')
+
+    assert claim_store.claim(['a', 'b'], 'second') == ['b']
+
+def test_claim_objects_keeps_the_entries_claimed(claim_store):
+    claim_store.claim(['raw/taken.csv'], 'other')
+    key_data_list = [{'Key': 'free.csv'}, {'Key': 'taken.csv'}, {'key': 'record.csv'}]
+
+    owned = claim_objects(claim_store, 'raw', key_data_list, 'workflow')
+
+    assert owned == [{'Key': 'free.csv'}, {'key': 'record.csv'}]
+
+def test_claim_objects_without_store_keeps_every_entry():
+    key_data_list = [{'Key': 'a.csv'}, {'Key': 'b.csv'}]
+
+    assert claim_objects(None, 'raw', iter(key_data_list), 'workflow') == key_data_list
+
+def test_release_errors_are_logged(capsys):
+    class FailingStore:
+        def release(self, keys, owner):
+            raise RuntimeError('Table not found')
+
+    release_objects(FailingStore(), 'raw', ['a.csv'], 'workflow')
+
+    assert 'Could not release claims of workflow workflow' in capsys.readouterr().out
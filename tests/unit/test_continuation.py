@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from pipeline_common.continuation import Deadline, resume_payload, run_batches
+
+def test_run_batches_processes_every_item_with_time_left(context):
+    processed = []
+
+    offset, done = run_batches(range(10), processed.extend, Deadline(context), batch_size = 3)
+
+    assert (offset, done) == (10, True)
+    assert processed == list(range(10))
+
+def test_run_batches_resumes_from_offset(context):
+    processed = []
+
+    offset, done = run_batches(range(10), processed.extend, Deadline(context), 4, batch_size = 3)
+
+    assert (offset, done) == (10, True)
+    assert processed == list(range(4, 10))
+
+def test_run_batches_processes_one_batch_without_time_left(expired_context):
+    processed = []
+
+    offset, done = run_batches(range(10), processed.extend, Deadline(expired_context), batch_size = 3)
+
+    assert (offset, done) == (3, False)
+    assert processed == [0, 1, 2]
+
+def test_invocations_without_time_left_still_finish(expired_context):
+    processed = []
+    offset, done = 0, False
+    invocations = 0
+    while not done:
+        offset, done = run_batches(
+            range(10), processed.extend, Deadline(expired_context), offset, batch_size = 3)
+        invocations += 1
+
+    assert invocations == 4
+    assert processed == list(range(10))
+
+def test_deadline_expires_only_after_a_step(expired_context):
+    deadline = Deadline(expired_context)
+
+    assert not deadline.expired()
+    deadline.record_step(0)
+    assert deadline.expired()
+
+def test_deadline_without_context_never_expires():
+    deadline = Deadline(None)
+    deadline.record_step(0)
+
+    assert not deadline.expired()
+
+def test_resume_payload_only_returns_unfinished_results():
+    assert resume_payload({'Input': {'jobId': {'Payload': {'done': False, 'cursor': 1}}}},
+        'jobId') == {'done': False, 'cursor': 1}
+    assert resume_payload({'Input': {'jobId': {'Payload': {'done': True}}}}, 'jobId') is None
+    assert resume_payload({'Input': {'jobId': {'Payload': None}}}, 'jobId') is None
+    assert resume_payload({'Input': {}}, 'jobId') is None
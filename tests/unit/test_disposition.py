@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import pytest
+
+from pipeline_common import disposition
+from pipeline_common.disposition import (ALLOW, DENY, DispositionRule, disposed_keys, dispose,
+    disposition_payload)
+
+PERSONAL = 'SensitiveData:S3Object/Personal'
+CREDENTIALS = 'SensitiveData:S3Object/Credentials'
+
+RULES = [
+    DispositionRule({'action': 'deny', 'anyTypes': [CREDENTIALS]}),
+    DispositionRule({'action': 'allow', 'name': 'few-personal', 'severities': ['Low'],
+        'onlyTypes': [PERSONAL], 'maxFindings': 5})
+]
+
+def record(key, severity, types, count=1):
+    return {'key': key, 'size': 100, 'severity': severity, 'types': types, 'count': count}
+
+def test_first_matching_rule_disposes_of_a_key():
+    records = [
+        record('credentials.csv', 'Low', [PERSONAL, CREDENTIALS]),
+        record('personal.csv', 'Low', [PERSONAL], 5),
+        record('many.csv', 'Low', [PERSONAL], 6),
+        record('medium.csv', 'Medium', [PERSONAL]),
+        record('financial.csv', 'Low', [PERSONAL, 'SensitiveData:S3Object/Financial'])
+    ]
+
+    disposed, review = dispose(records, RULES)
+
+    assert [(entry['key'], entry['disposition'], entry['rule']) for entry in disposed] == [
+        ('credentials.csv', DENY, 'deny-anyTypes'),
+        ('personal.csv', ALLOW, 'few-personal')
+    ]
+    assert review == records[2:]
+
+def test_empty_policy_reviews_every_key():
+    records = [record('a.csv', 'High', [CREDENTIALS])]
+
+    assert dispose(records, []) == ([], records)
+
+@pytest.mark.parametrize('rule', [
+    {'action': 'ignore', 'severities': ['Low']},
+    {'action': 'allow'}
+])
+def test_invalid_rules_are_refused(rule):
+    with pytest.raises(ValueError):
+        DispositionRule(rule)
+
+def test_payload_holds_few_records_inline():
+    disposed, _ = dispose([record('a.csv', 'Low', [CREDENTIALS])], RULES)
+
+    info = disposition_payload(disposed, 'manifests', 'workflow')
+
+    assert info == {'allowCount': 0, 'denyCount': 1, 'records': [
+        {'key': 'a.csv', 'size': 100, 'disposition': DENY, 'rule': 'deny-anyTypes'}]}
+    assert disposed_keys({'disposition': info}) == {'a.csv'}
+
+def test_payload_points_to_a_manifest_of_many_records(aws, monkeypatch):
+    monkeypatch.setattr(disposition, 'INLINE_KEY_LIMIT', 2)
+    disposed, _ = dispose(
+        [record(f'{number}.csv', 'Low', [PERSONAL]) for number in range(3)], RULES)
+
+    info = disposition_payload(disposed, 'manifests', 'workflow')
+
+    assert info['allowCount'] == 3
+    assert 'records' not in info
+    assert disposed_keys({'disposition': info}) == {'0.csv', '1.csv', '2.csv'}
+    assert disposed_keys({}) == set()
@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import time
+
+from pipeline_common.continuation import Deadline
+from pipeline_common.findings import FindingsCollector, FindingsIndex
+
+class CountdownContext:
+    def __init__(self, remaining_ms):
+        self.ends = time.monotonic() + remaining_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return (self.ends - time.monotonic()) * 1000
+
+def scan_job(aws, sensitive_count):
+    for number in range(sensitive_count):
+        aws.s3.add_object('scan', f'data/object-{number:04d}.csv', 100, sensitive = True)
+    job_id = aws.macie.create_classification_job(name = 'scan', s3JobDefinition = {
+        'bucketDefinitions': [{'accountId': '123456789012', 'buckets': ['scan']}]
+    })['jobId']
+    aws.clock.advance(aws.macie.jobs[job_id]['completesAt'] - aws.clock.now())
+    return job_id
+
+def test_collects_every_finding_of_the_job(aws, context):
+    job_id = scan_job(aws, 120)
+    index = FindingsIndex()
+
+    next_token, done = FindingsCollector(aws.macie, job_id).collect(index, Deadline(context))
+
+    assert (next_token, done) == (None, True)
+    assert len(index) == 120
+    assert sum(entry['count'] for entry in index.entries.values()) == \
+        len(aws.macie.jobs[job_id]['findingIds'])
+
+def test_stops_in_time_for_the_fetches_in_flight(aws):
+    job_id = scan_job(aws, 300)
+    get_findings = aws.macie.get_findings
+
+    def slow_get_findings(**kwargs):
+        time.sleep(0.1)
+        return get_findings(**kwargs)
+    aws.macie.get_findings = slow_get_findings
+    context = CountdownContext(400)
+    deadline = Deadline(context, safety_margin_ms = 100)
+
+    next_token, done = FindingsCollector(aws.macie, job_id, max_workers = 2).collect(
+        FindingsIndex(), deadline)
+
+    assert done is False and next_token
+    assert context.get_remaining_time_in_millis() > 0
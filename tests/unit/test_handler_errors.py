@@ -0,0 +1,146 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+
+import pytest
+
+from functions.check_macie_status import checkMacieStatus
+from functions.delete_manual_review_s3_files import deleteManualReviewS3Files
+from functions.move_all_scan_stage_s3_files import moveAllScanStageS3Files
+from functions.receive_approval_decision_api import receiveApprovalDecisionAPI
+from pipeline_common.approvals import save_approval_request
+from pipeline_common.results import FAILED, SUCCEEDED
+
+@pytest.fixture
+def environment(monkeypatch):
+    for name, value in {
+        'accountId': '123456789012',
+        'sourceS3Bucket': 'source',
+        'targetS3Bucket': 'target',
+        'manifestS3Bucket': 'manifests'
+    }.items():
+        monkeypatch.setenv(name, value)
+
+def fail_s3_operation(aws, operation_name):
+    def operation(**kwargs):
+        raise RuntimeError('Access Denied')
+    setattr(aws.s3, operation_name, operation)
+
+def workflow_event(**fields):
+    return {'Input': dict({
+        'id': 'workflow',
+        'macieFindingsInfo': {'Payload': {'findingKeys': ['a.csv']}}
+    }, **fields)}
+
+def test_check_macie_status_without_job_id(aws, context):
+    assert checkMacieStatus.lambda_handler({'Input': {}}, context) is None
+
+def test_check_macie_status_of_unknown_job(aws, context):
+    event = {'Input': {'jobId': {'Payload': {'jobId': 'missing'}}}}
+
+    assert checkMacieStatus.lambda_handler(event, context) is None
+
+def test_move_reports_a_manifest_read_error(aws, environment, context):
+    fail_s3_operation(aws, 'list_objects_v2')
+
+    result = moveAllScanStageS3Files.lambda_handler(workflow_event(), context)
+
+    assert result['status'] == FAILED
+    assert result['done'] is True
+    assert 'Access Denied' in result['error']
+
+def test_move_without_staged_objects_succeeds(aws, environment, context):
+    result = moveAllScanStageS3Files.lambda_handler(workflow_event(), context)
+
+    assert result['status'] == SUCCEEDED
+    assert result['processedCount'] == 0
+
+def test_delete_reports_an_approval_decision_read_error(aws, environment, context):
+    fail_s3_operation(aws, 'get_object')
+
+    result = deleteManualReviewS3Files.lambda_handler(workflow_event(), context)
+
+    assert result['status'] == FAILED
+    assert 'Could not read approval decisions' in result['error']
+
+def test_delete_reports_a_findings_manifest_read_error(aws, environment, context):
+    event = workflow_event(macieFindingsInfo = {'Payload': {
+        'findingsManifest': {'bucket': 'manifests', 'key': 'missing/findings.jsonl'}}})
+
+    result = deleteManualReviewS3Files.lambda_handler(event, context)
+
+    assert result['status'] == FAILED
+    assert 'Could not delete S3 objects' in result['error']
+
+def api_event(resource_path, **parameters):
+    return {
+        'requestContext': {'resourcePath': resource_path},
+        'queryStringParameters': parameters
+    }
+
+def test_decision_api_refuses_requests_without_token(aws, environment, context):
+    response = receiveApprovalDecisionAPI.lambda_handler(api_event('/allow', id = 'workflow'), context)
+
+    assert response['statusCode'] == 400
+
+def test_decision_api_refuses_invalid_actions(aws, environment, context):
+    event = {
+        'requestContext': {'resourcePath': '/decisions'},
+        'body': json.dumps({'id': 'workflow', 'token': 'secret', 'decisions': [{'action': 'maybe'}]})
+    }
+
+    response = receiveApprovalDecisionAPI.lambda_handler(event, context)
+
+    assert response['statusCode'] == 400
+
+def test_decision_api_refuses_wrong_tokens(aws, environment, context):
+    save_approval_request('manifests', 'workflow', 'task', aws.s3, reviewer_token = 'secret')
+
+    response = receiveApprovalDecisionAPI.lambda_handler(
+        api_event('/allow', id = 'workflow', token = 'guess'), context)
+
+    assert response['statusCode'] == 403
+    assert not aws.s3.objects('manifests').keys() - {'approvals/workflow/request.json'}
+
+def test_decision_api_records_decisions_without_waiting_task(aws, environment, context):
+    save_approval_request('manifests', 'workflow', 'finished-task', aws.s3,
+        reviewer_token = 'secret')
+
+    response = receiveApprovalDecisionAPI.lambda_handler(
+        api_event('/deny', id = 'workflow', token = 'secret', key = 'a.csv'), context)
+
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['decisions'] == [{'action': 'delete', 'key': 'a.csv'}]
+
+def test_decision_api_completes_the_token_saved_while_deciding(aws, environment, context):
+    save_approval_request('manifests', 'workflow', 'finished-task', aws.s3,
+        reviewer_token = 'secret')
+    waiting_task = aws.stepfunctions.new_task_token()
+    put_object = aws.s3.put_object
+
+    def put_object_while_waiting_again(**kwargs):
+        response = put_object(**kwargs)
+        if '/decisions/' in kwargs['Key']:
+            save_approval_request('manifests', 'workflow', waiting_task, aws.s3)
+        return response
+    aws.s3.put_object = put_object_while_waiting_again
+
+    response = receiveApprovalDecisionAPI.lambda_handler(
+        api_event('/deny', id = 'workflow', token = 'secret', key = 'a.csv'), context)
+
+    assert response['statusCode'] == 200
+    assert aws.stepfunctions.tasks[waiting_task]['status'] == 'SUCCEEDED'
@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import csv
+import gzip
+import io
+import json
+
+from pipeline_common.listing import ParallelLister, inventory_pages
+
+KEYS = sorted(
+    [f'{prefix}/{sub}/object-{number}.csv'
+        for prefix in ['a', 'b', 'c', 'd'] for sub in ['x', 'y'] for number in range(40)]
+    + [f'top-{number}.csv' for number in range(30)]
+)
+
+def add_objects(aws, keys, bucket_name='raw'):
+    for number, key in enumerate(keys):
+        aws.s3.add_object(bucket_name, key, 100, seed = number)
+
+def listed_keys(pages):
+    keys = []
+    for contents, _, _ in pages:
+        keys.extend(key_data['Key'] for key_data in contents)
+    return keys
+
+def test_ranges_cover_every_key_once(aws):
+    add_objects(aws, KEYS)
+    lister = ParallelLister('raw', max_workers = 4, partitions = 6, page_size = 7)
+
+    ranges = lister.discover()
+    keys = listed_keys(lister.pages({'ranges': ranges}))
+
+    assert len(ranges) == 6
+    assert ranges[0]['startAfter'] is None and ranges[-1]['end'] is None
+    assert all(
+        earlier['end'] == later['startAfter'] for earlier, later in zip(ranges, ranges[1:]))
+    assert sorted(keys) == KEYS
+
+def test_lists_a_key_space_without_prefixes_as_one_range(aws):
+    keys = sorted(f'object-{number}.csv' for number in range(25))
+    add_objects(aws, keys)
+    lister = ParallelLister('raw', partitions = 8, page_size = 10)
+
+    assert len(lister.discover()) == 1
+    assert sorted(listed_keys(lister.pages())) == keys
+
+def test_resumes_from_the_cursor_of_the_last_processed_page(aws):
+    add_objects(aws, KEYS)
+    lister = ParallelLister('raw', max_workers = 4, partitions = 6, page_size = 7)
+
+    processed = []
+    pages = lister.pages()
+    for contents, cursor, last in pages:
+        processed.extend(key_data['Key'] for key_data in contents)
+        if len(processed) > len(KEYS) // 3:
+            break
+    pages.close()
+    assert not last
+
+    resumed = listed_keys(lister.pages(cursor))
+
+    assert sorted(processed + resumed) == KEYS
+
+def test_finished_cursor_yields_one_empty_last_page(aws):
+    add_objects(aws, KEYS)
+    lister = ParallelLister('raw', page_size = 1000)
+    for _, cursor, _ in lister.pages():
+        pass
+
+    assert list(lister.pages(cursor)) == [([], cursor, True)]
+
+def add_inventory(aws, keys, files=2):
+    report_prefix = 'inventory/raw/daily/2026-10-17T01-00Z/'
+    file_keys = []
+    for number in range(files):
+        rows = io.StringIO()
+        writer = csv.writer(rows)
+        for key in keys[number::files]:
+            writer.writerow(['raw', key.replace(' ', '+'), '100', 'etag'])
+        file_key = f'inventory/raw/daily/data/{number}.csv.gz'
+        aws.s3.put_object(
+            Bucket = 'inventory', Key = file_key,
+            Body = gzip.compress(rows.getvalue().encode('utf-8')))
+        file_keys.append(file_key)
+
+    aws.s3.put_object(Bucket = 'inventory', Key = report_prefix + 'manifest.json', Body = json.dumps({
+        'fileFormat': 'CSV',
+        'fileSchema': 'Bucket, Key, Size, ETag',
+        'files': [{'key': file_key} for file_key in file_keys]
+    }))
+    aws.s3.put_object(Bucket = 'inventory', Key = report_prefix + 'manifest.checksum', Body = '')
+
+def test_inventory_pages_resume_from_the_cursor(aws):
+    keys = [f'data/object {number}.csv' for number in range(25)]
+    add_inventory(aws, keys)
+    options = {
+        'inventory_bucket_name': 'inventory',
+        'inventory_prefix': 'inventory/raw/daily',
+        'page_size': 4
+    }
+
+    pages = inventory_pages('raw', **options)
+    first, cursor, last = next(pages)
+    pages.close()
+    resumed = listed_keys(inventory_pages('raw', cursor, **options))
+
+    assert not last
+    assert first[0] == {'Key': keys[0], 'Size': 100, 'ETag': '"etag"'}
+    assert sorted([key_data['Key'] for key_data in first] + resumed) == sorted(keys)
@@ -0,0 +1,59 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from pipeline_common.manifest import (manifest_key, read_manifest, read_manifest_parts,
+    staged_records, write_manifest)
+
+def test_round_trips_records(aws):
+    records = [{'key': f'data/object-{number}.csv', 'size': number} for number in range(1500)]
+
+    count = write_manifest('manifests', 'manifest.ndjson.gz', iter(records))
+
+    assert count == 1500
+    assert list(read_manifest('manifests', 'manifest.ndjson.gz')) == records
+
+def test_reads_parts_in_part_order(aws):
+    for part in [2, 0, 10, 1]:
+        write_manifest('manifests', manifest_key('workflow', part = part), [{'part': part}])
+    write_manifest('manifests', manifest_key('other', part = 0), [{'part': 'other'}])
+
+    records = list(read_manifest_parts('manifests', 'workflow'))
+
+    assert records == [{'part': 0}, {'part': 1}, {'part': 2}, {'part': 10}]
+
+def test_reads_no_records_without_parts(aws):
+    assert list(read_manifest_parts('manifests', 'workflow')) == []
+
+def test_staged_records_include_objects_whose_delete_failed():
+    key_data_list = [
+        {'Key': 'moved.csv', 'Size': 1, 'ETag': '"a"'},
+        {'Key': 'copied.csv', 'Size': 2, 'ETag': '"b"'},
+        {'Key': 'failed.csv', 'Size': 3, 'ETag': '"c"'},
+        {'key': 'excluded.bin', 'size': 4, 'excluded': 'extension'}
+    ]
+    move_result = {
+        'moved': ['moved.csv', 'excluded.bin'],
+        'failed': [
+            {'key': 'copied.csv', 'stage': 'delete', 'error': 'AccessDenied'},
+            {'key': 'failed.csv', 'stage': 'copy', 'error': 'NoSuchKey'}
+        ]
+    }
+
+    assert staged_records(key_data_list, move_result) == [
+        {'key': 'moved.csv', 'size': 1, 'etag': '"a"'},
+        {'key': 'copied.csv', 'size': 2, 'etag': '"b"'},
+        {'key': 'excluded.bin', 'size': 4, 'etag': None, 'excluded': 'extension'}
+    ]
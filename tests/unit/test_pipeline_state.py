@@ -0,0 +1,126 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import datetime
+
+from pipeline_common import pipeline_state
+from pipeline_common.continuation import Deadline
+from pipeline_common.pipeline_state import (MANUAL_REVIEW, PIPELINE_STATE_TAG, SCAN_STAGE,
+    SCANNED_DATA, advance_in_batches, advance_objects, drop_settled, load_settled_before,
+    save_settled_before, transition_objects)
+
+def add_object(aws, key, state=None, tags=None):
+    tags = dict(tags or {})
+    if state:
+        tags[PIPELINE_STATE_TAG] = state
+    aws.s3.add_object('bucket', key, 100, tags = tags)
+
+def tags(aws, key, bucket_name='bucket'):
+    return aws.s3.objects(bucket_name)[key].tags
+
+def test_transitions_raw_objects_keeping_their_tags(aws):
+    add_object(aws, 'a.csv', tags = {'Owner': 'team'})
+
+    result = transition_objects('bucket', ['a.csv'], SCAN_STAGE, {'WorkflowId': 'workflow'})
+
+    assert result == {'moved': ['a.csv'], 'failed': [], 'skipped': []}
+    assert tags(aws, 'a.csv') == {
+        'Owner': 'team', 'WorkflowId': 'workflow', PIPELINE_STATE_TAG: SCAN_STAGE}
+
+def test_skips_objects_that_cannot_transition(aws):
+    add_object(aws, 'raw.csv')
+    add_object(aws, 'scanned.csv', SCANNED_DATA)
+    add_object(aws, 'other-workflow.csv', SCAN_STAGE, {'WorkflowId': 'other'})
+
+    result = transition_objects(
+        'bucket', ['raw.csv', 'scanned.csv', 'other-workflow.csv'], SCAN_STAGE,
+        {'WorkflowId': 'workflow'})
+
+    assert result['moved'] == ['raw.csv']
+    assert sorted(result['skipped']) == ['other-workflow.csv', 'scanned.csv']
+    assert tags(aws, 'scanned.csv') == {PIPELINE_STATE_TAG: SCANNED_DATA}
+
+def test_repeated_transition_of_the_same_workflow_succeeds(aws):
+    add_object(aws, 'a.csv', SCAN_STAGE, {'WorkflowId': 'workflow'})
+
+    result = transition_objects('bucket', ['a.csv'], SCAN_STAGE, {'WorkflowId': 'workflow'})
+
+    assert result['moved'] == ['a.csv']
+
+def test_follows_the_allowed_transitions(aws):
+    add_object(aws, 'a.csv')
+
+    assert transition_objects('bucket', ['a.csv'], MANUAL_REVIEW)['skipped'] == ['a.csv']
+    for state in [SCAN_STAGE, MANUAL_REVIEW, SCANNED_DATA]:
+        assert transition_objects('bucket', ['a.csv'], state)['moved'] == ['a.csv']
+    assert transition_objects('bucket', ['a.csv'], SCAN_STAGE)['skipped'] == ['a.csv']
+
+def test_reports_tagging_failures(aws):
+    result = transition_objects('bucket', [{'Key': 'missing.csv'}], SCAN_STAGE)
+
+    assert result['moved'] == []
+    assert result['failed'][0]['key'] == 'missing.csv'
+    assert result['failed'][0]['stage'] == 'tag'
+
+def test_advance_moves_objects_between_buckets(aws):
+    add_object(aws, 'a.csv')
+
+    result = advance_objects('bucket', 'scanned', ['a.csv'], SCANNED_DATA)
+
+    assert result['moved'] == ['a.csv']
+    assert not aws.s3.objects('bucket')
+    assert 'a.csv' in aws.s3.objects('scanned')
+
+def test_advance_in_batches_transitions_in_place(aws, context):
+    keys = [f'object-{number}.csv' for number in range(5)]
+    for key in keys:
+        add_object(aws, key, SCAN_STAGE)
+
+    result = advance_in_batches(
+        'bucket', 'bucket', keys, SCANNED_DATA, Deadline(context), offset = 2)
+
+    assert (result['offset'], result['done']) == (5, True)
+    assert sorted(result['moved']) == keys[2:]
+    assert tags(aws, keys[0]) == {PIPELINE_STATE_TAG: SCAN_STAGE}
+    assert tags(aws, keys[4]) == {PIPELINE_STATE_TAG: SCANNED_DATA}
+
+def test_skips_objects_of_another_workflow(aws):
+    add_object(aws, 'a.csv', SCAN_STAGE, {'WorkflowId': 'other'})
+
+    result = transition_objects('bucket', ['a.csv'], SCANNED_DATA, {'WorkflowId': 'workflow'})
+
+    assert result['skipped'] == ['a.csv']
+    assert tags(aws, 'a.csv') == {'WorkflowId': 'other', PIPELINE_STATE_TAG: SCAN_STAGE}
+
+def test_settled_before_only_moves_forward(aws, monkeypatch):
+    monkeypatch.setattr(pipeline_state, 'SETTLED_MARGIN_SECONDS', 100)
+    assert load_settled_before('manifests') is None
+
+    save_settled_before('manifests', 1000)
+    save_settled_before('manifests', 500)
+
+    assert load_settled_before('manifests') == 900
+
+def test_drop_settled_keeps_objects_modified_since():
+    settled_before = datetime.datetime(2026, 10, 1, tzinfo = datetime.timezone.utc).timestamp()
+    key_data_list = [
+        {'Key': 'old.csv', 'LastModified': datetime.datetime(2026, 9, 30, tzinfo = datetime.timezone.utc)},
+        {'Key': 'new.csv', 'LastModified': datetime.datetime(2026, 10, 1, tzinfo = datetime.timezone.utc)},
+        {'Key': 'unknown.csv'}
+    ]
+
+    assert drop_settled(key_data_list, settled_before) == key_data_list[1:]
+    assert drop_settled(key_data_list, None) == key_data_list
@@ -0,0 +1,149 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import pytest
+from botocore.exceptions import EndpointConnectionError
+
+from stand_ins import client_error
+from pipeline_common import s3_delete
+from pipeline_common.continuation import Deadline
+from pipeline_common.s3_delete import delete_in_batches, delete_objects
+
+@pytest.fixture(autouse = True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(s3_delete, 'RETRY_BASE_DELAY_SECONDS', 0)
+
+def add_objects(aws, count):
+    keys = [f'data/object-{number}.csv' for number in range(count)]
+    for number, key in enumerate(keys):
+        aws.s3.add_object('bucket', key, 100, seed = number)
+    return keys
+
+def fail_deletes(aws, errors):
+    '''
+    Make DeleteObjects report the next error code listed in errors for each
+    key, and delete the other keys. Returns the list of requests.
+    '''
+    delete_objects = aws.s3.delete_objects
+    requests = []
+
+    def delete_objects_failing(Bucket, Delete, **kwargs):
+        keys = [entry['Key'] for entry in Delete['Objects']]
+        requests.append(keys)
+        failing = {key: errors[key].pop(0) for key in keys if errors.get(key)}
+        delete_objects(Bucket = Bucket, Delete = {
+            'Objects': [{'Key': key} for key in keys if key not in failing],
+            'Quiet': True
+        })
+        return {'Errors': [
+            {'Key': key, 'Code': code, 'Message': code}
+            for key, code in failing.items()
+        ]}
+    aws.s3.delete_objects = delete_objects_failing
+
+    return requests
+
+def test_deletes_in_requests_of_up_to_1000_keys(aws):
+    keys = add_objects(aws, 2500)
+    requests = fail_deletes(aws, {})
+
+    result = delete_objects('bucket', keys)
+
+    assert sorted(result['deleted']) == sorted(keys)
+    assert result['failed'] == []
+    assert sorted(len(request) for request in requests) == [500, 1000, 1000]
+    assert not aws.s3.objects('bucket')
+
+def test_retries_only_the_keys_with_retryable_errors(aws):
+    keys = add_objects(aws, 3)
+    requests = fail_deletes(aws, {keys[0]: ['SlowDown']})
+
+    result = delete_objects('bucket', keys)
+
+    assert sorted(result['deleted']) == keys
+    assert requests == [keys, [keys[0]]]
+
+def test_reports_keys_still_failing_after_the_last_attempt(aws):
+    keys = add_objects(aws, 3)
+    requests = fail_deletes(aws, {keys[0]: ['InternalError'] * 10})
+
+    result = delete_objects('bucket', keys, max_attempts = 3)
+
+    assert sorted(result['deleted']) == keys[1:]
+    assert result['failed'] == [
+        {'key': keys[0], 'stage': 'delete', 'error': 'InternalError: InternalError'}]
+    assert len(requests) == 3
+
+def test_reports_keys_with_other_errors_without_retrying(aws):
+    keys = add_objects(aws, 3)
+    requests = fail_deletes(aws, {keys[1]: ['AccessDenied']})
+
+    result = delete_objects('bucket', keys)
+
+    assert sorted(result['deleted']) == [keys[0], keys[2]]
+    assert [failure['key'] for failure in result['failed']] == [keys[1]]
+    assert len(requests) == 1
+
+def fail_requests(aws, errors):
+    # Raise the next exception of errors for each DeleteObjects request
+    delete_objects = aws.s3.delete_objects
+    requests = []
+
+    def delete_objects_raising(Bucket, Delete, **kwargs):
+        requests.append([entry['Key'] for entry in Delete['Objects']])
+        if errors:
+            raise errors.pop(0)
+        return delete_objects(Bucket = Bucket, Delete = Delete, **kwargs)
+    aws.s3.delete_objects = delete_objects_raising
+
+    return requests
+
+def test_retries_requests_failing_with_throttling_or_connection_errors(aws):
+    keys = add_objects(aws, 3)
+    requests = fail_requests(aws, [
+        client_error('SlowDown', 'Please reduce your request rate', 'DeleteObjects', 503),
+        client_error('InternalError', 'We encountered an internal error', 'DeleteObjects', 500),
+        EndpointConnectionError(endpoint_url = 'https://s3.amazonaws.com')
+    ])
+
+    result = delete_objects('bucket', keys)
+
+    assert sorted(result['deleted']) == keys
+    assert len(requests) == 4
+
+@pytest.mark.parametrize('error', [
+    client_error('AccessDenied', 'Access Denied', 'DeleteObjects', 403),
+    client_error('NoSuchBucket', 'The specified bucket does not exist', 'DeleteObjects', 404),
+    RuntimeError('Unexpected response')
+])
+def test_reports_requests_failing_with_other_errors_without_retrying(aws, error):
+    keys = add_objects(aws, 3)
+    requests = fail_requests(aws, [error])
+
+    result = delete_objects('bucket', keys)
+
+    assert result['deleted'] == []
+    assert sorted(failure['key'] for failure in result['failed']) == keys
+    assert len(requests) == 1
+
+def test_delete_in_batches_resumes_from_offset(aws, context):
+    keys = add_objects(aws, 10)
+
+    result = delete_in_batches('bucket', iter(keys), Deadline(context), 4)
+
+    assert (result['offset'], result['done']) == (10, True)
+    assert sorted(result['deleted']) == keys[4:]
+    assert sorted(aws.s3.objects('bucket')) == keys[:4]
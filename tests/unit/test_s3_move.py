@@ -0,0 +1,91 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from pipeline_common.continuation import Deadline
+from pipeline_common.s3_move import move_in_batches, move_objects
+
+def add_objects(aws, count):
+    keys = [f'data/object-{number}.csv' for number in range(count)]
+    for number, key in enumerate(keys):
+        aws.s3.add_object('src', key, 100, seed = number)
+    return keys
+
+def test_moves_objects_with_replaced_tags(aws):
+    keys = add_objects(aws, 3)
+
+    result = move_objects('src', 'dst', keys, tags = {'WorkflowId': 'workflow'})
+
+    assert sorted(result['moved']) == keys
+    assert result['failed'] == []
+    assert not aws.s3.objects('src')
+    assert all(
+        s3_object.tags == {'WorkflowId': 'workflow'}
+        for s3_object in aws.s3.objects('dst').values())
+
+def test_reports_copy_failures_and_moves_the_rest(aws):
+    keys = add_objects(aws, 3)
+
+    result = move_objects('src', 'dst', keys + ['data/missing.csv'])
+
+    assert sorted(result['moved']) == keys
+    assert len(result['failed']) == 1
+    assert result['failed'][0]['key'] == 'data/missing.csv'
+    assert result['failed'][0]['stage'] == 'copy'
+    assert 'NoSuchKey' in result['failed'][0]['error']
+
+def test_reports_delete_failures_of_copied_objects(aws):
+    keys = add_objects(aws, 3)
+    delete_objects = aws.s3.delete_objects
+
+    def delete_objects_denied(Bucket, Delete, **kwargs):
+        denied = [entry for entry in Delete['Objects'] if entry['Key'] == keys[0]]
+        delete_objects(Bucket = Bucket, Delete = {
+            'Objects': [entry for entry in Delete['Objects'] if entry not in denied],
+            'Quiet': True
+        })
+        return {'Errors': [
+            {'Key': entry['Key'], 'Code': 'AccessDenied', 'Message': 'Access Denied'}
+            for entry in denied
+        ]}
+    aws.s3.delete_objects = delete_objects_denied
+
+    result = move_objects('src', 'dst', keys)
+
+    assert sorted(result['moved']) == keys[1:]
+    assert result['failed'] == [
+        {'key': keys[0], 'stage': 'delete', 'error': 'AccessDenied: Access Denied'}]
+    # The object exists in both buckets
+    assert keys[0] in aws.s3.objects('src')
+    assert keys[0] in aws.s3.objects('dst')
+
+def test_accepts_listing_entries_and_manifest_records(aws):
+    keys = add_objects(aws, 2)
+
+    result = move_objects('src', 'dst', [
+        {'Key': keys[0], 'Size': 100},
+        {'key': keys[1], 'size': 100}
+    ])
+
+    assert sorted(result['moved']) == keys
+
+def test_move_in_batches_resumes_from_offset(aws, context):
+    keys = add_objects(aws, 10)
+
+    result = move_in_batches('src', 'dst', keys, Deadline(context), offset = 4)
+
+    assert (result['offset'], result['done']) == (10, True)
+    assert sorted(result['moved']) == keys[4:]
+    assert sorted(aws.s3.objects('src')) == keys[:4]
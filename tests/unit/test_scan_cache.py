@@ -0,0 +1,137 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import pytest
+
+from pipeline_common.scan_cache import (CLEAN, SENSITIVE, SQLiteScanCache, moved_verdict_recorder,
+    record_verdicts, split_cached_clean)
+
+@pytest.fixture
+def scan_cache(tmp_path):
+    return SQLiteScanCache(str(tmp_path / 'scan-cache.db'))
+
+def listed(aws, bucket_name='raw'):
+    return aws.s3.list_objects_v2(Bucket = bucket_name)['Contents']
+
+def staged_record(key_data):
+    return {
+        'key': key_data['Key'],
+        'size': key_data['Size'],
+        'checksumSha256': key_data.get('ChecksumSHA256')
+    }
+
+def scan(aws, scan_cache, verdict):
+    # Split and record the verdict of every object in the raw bucket
+    _, remaining = split_cached_clean(scan_cache, 'raw', listed(aws))
+    record_verdicts(scan_cache, [staged_record(key_data) for key_data in remaining], verdict)
+
+def test_objects_with_the_checksum_of_clean_content_are_split_off(aws, scan_cache):
+    aws.s3.add_object('raw', 'day-1.csv', 100, seed = 1, checksum = True)
+    scan(aws, scan_cache, CLEAN)
+    aws.s3.delete_object(Bucket = 'raw', Key = 'day-1.csv')
+    aws.s3.add_object('raw', 'day-2.csv', 100, seed = 1, checksum = True)
+    aws.s3.add_object('raw', 'changed.csv', 100, seed = 2, checksum = True)
+
+    clean, remaining = split_cached_clean(scan_cache, 'raw', listed(aws))
+
+    assert [key_data['Key'] for key_data in clean] == ['day-2.csv']
+    assert [key_data['Key'] for key_data in remaining] == ['changed.csv']
+    assert remaining[0]['ChecksumSHA256']
+
+def test_objects_without_checksum_are_always_scanned(aws, scan_cache):
+    aws.s3.add_object('raw', 'a.csv', 100, seed = 1)
+    scan(aws, scan_cache, CLEAN)
+    head_object = aws.s3.head_object
+    heads = []
+
+    def counting_head_object(**kwargs):
+        heads.append(kwargs['Key'])
+        return head_object(**kwargs)
+    aws.s3.head_object = counting_head_object
+
+    clean, remaining = split_cached_clean(scan_cache, 'raw', listed(aws))
+
+    assert clean == []
+    assert [key_data['Key'] for key_data in remaining] == ['a.csv']
+    assert heads == []
+
+def test_etag_of_clean_content_is_not_enough(scan_cache):
+    record_verdicts(scan_cache, [{'key': 'a.csv', 'etag': '"clean"', 'size': 100}], CLEAN)
+
+    clean, _ = split_cached_clean(scan_cache, 'raw', [{'Key': 'b.csv', 'ETag': '"clean"', 'Size': 100}])
+
+    assert clean == []
+
+def test_checksums_of_unlisted_objects_are_read(aws, scan_cache):
+    aws.s3.add_object('raw', 'a.csv', 100, seed = 1, checksum = True)
+    scan(aws, scan_cache, CLEAN)
+
+    clean, _ = split_cached_clean(
+        scan_cache, 'raw', [{'Key': 'a.csv', 'Size': 100}], listed = False)
+
+    assert [key_data['Key'] for key_data in clean] == ['a.csv']
+
+def test_sensitive_verdicts_replace_clean_ones(aws, scan_cache):
+    aws.s3.add_object('raw', 'a.csv', 100, seed = 1, checksum = True)
+    scan(aws, scan_cache, CLEAN)
+    record_verdicts(scan_cache, [
+        staged_record(key_data)
+        for key_data in split_cached_clean(scan_cache, 'raw', listed(aws))[0]
+    ], SENSITIVE)
+
+    clean, _ = split_cached_clean(scan_cache, 'raw', listed(aws))
+
+    assert clean == []
+
+def test_expired_verdicts_are_ignored(aws, tmp_path):
+    scan_cache = SQLiteScanCache(str(tmp_path / 'scan-cache.db'), ttl_seconds = 0)
+    aws.s3.add_object('raw', 'a.csv', 100, seed = 1, checksum = True)
+    scan(aws, scan_cache, CLEAN)
+
+    clean, _ = split_cached_clean(scan_cache, 'raw', listed(aws))
+
+    assert clean == []
+
+def test_cache_errors_are_misses(aws):
+    class FailingCache:
+        def get_verdicts(self, keys):
+            raise RuntimeError('Table not found')
+
+    aws.s3.add_object('raw', 'a.csv', 100, seed = 1, checksum = True)
+
+    clean, remaining = split_cached_clean(FailingCache(), 'raw', listed(aws))
+
+    assert clean == []
+    assert [key_data['Key'] for key_data in remaining] == ['a.csv']
+
+def test_recorder_records_moved_objects_not_excluded(scan_cache):
+    record_clean = moved_verdict_recorder(scan_cache, CLEAN)
+    batch = [
+        {'key': 'moved.csv', 'checksumSha256': 'moved', 'size': 100},
+        {'key': 'failed.csv', 'checksumSha256': 'failed', 'size': 100},
+        {'key': 'excluded.bin', 'checksumSha256': 'excluded', 'size': 100, 'excluded': 'extension'}
+    ]
+
+    record_clean(batch, {'moved': ['moved.csv', 'excluded.bin'], 'failed': []})
+
+    assert scan_cache.get_verdicts(['moved:100', 'failed:100', 'excluded:100']) == {
+        'moved:100': CLEAN}
+
+def test_no_cache_scans_everything():
+    key_data_list = [{'Key': 'a.csv', 'Size': 100, 'ChecksumAlgorithm': ['SHA256']}]
+
+    assert split_cached_clean(None, 'raw', key_data_list) == ([], key_data_list)
+    assert moved_verdict_recorder(None, CLEAN) is None
@@ -0,0 +1,47 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from pipeline_common.scan_scope import ExclusionRule, split_excluded
+
+VIDEO_RULE = ExclusionRule({'name': 'video', 'contentTypes': ['video/']})
+
+def listing(aws, bucket_name='bucket'):
+    return aws.s3.list_objects_v2(Bucket = bucket_name)['Contents']
+
+def test_excludes_by_content_type(aws):
+    aws.s3.add_object('bucket', 'clip.bin', 100, content_type = 'video/mp4')
+    aws.s3.add_object('bucket', 'data.csv', 100, content_type = 'text/csv')
+
+    excluded, remaining = split_excluded('bucket', listing(aws), aws.s3, [VIDEO_RULE])
+
+    assert [(entry['Key'], entry['excluded']) for entry in excluded] == [('clip.bin', 'video')]
+    assert [entry['Key'] for entry in remaining] == ['data.csv']
+
+def test_failed_head_leaves_the_object_to_the_scan(aws):
+    for key in ['clip-0.bin', 'clip-1.bin', 'clip-2.bin']:
+        aws.s3.add_object('bucket', key, 100, content_type = 'video/mp4')
+    head_object = aws.s3.head_object
+
+    def head_object_failing(**kwargs):
+        if kwargs['Key'] == 'clip-1.bin':
+            raise RuntimeError('Not Found')
+        return head_object(**kwargs)
+    aws.s3.head_object = head_object_failing
+
+    excluded, remaining = split_excluded('bucket', listing(aws), aws.s3, [VIDEO_RULE])
+
+    assert [entry['Key'] for entry in excluded] == ['clip-0.bin', 'clip-2.bin']
+    assert [entry['Key'] for entry in remaining] == ['clip-1.bin']
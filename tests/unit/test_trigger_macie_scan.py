@@ -0,0 +1,167 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import datetime
+import functools
+
+import pytest
+
+from functions.trigger_macie_scan import triggerMacieScan
+
+@pytest.fixture
+def environment(monkeypatch):
+    for name, value in {
+        'accountId': '123456789012',
+        'rawS3Bucket': 'raw',
+        'scanS3Bucket': 'scan',
+        'scannedS3Bucket': 'scanned',
+        'manifestS3Bucket': 'manifests'
+    }.items():
+        monkeypatch.setenv(name, value)
+
+def add_raw_objects(aws, count, prefix='data'):
+    for number in range(count):
+        aws.s3.add_object('raw', f'{prefix}/object-{number:04d}.csv', 100, seed = number)
+
+def invoke_until_done(event, context, limit=100):
+    for invocation in range(1, limit + 1):
+        result = triggerMacieScan.lambda_handler(event, context)
+        event['Input']['jobId'] = {'Payload': result}
+        if result is None or result['done']:
+            return result, invocation
+    raise AssertionError('triggerMacieScan did not finish')
+
+def test_stages_and_creates_one_job(aws, environment, context):
+    add_raw_objects(aws, 10)
+
+    result, invocations = invoke_until_done({'Input': {'id': 'workflow'}}, context)
+
+    assert invocations == 1
+    assert result['stagedCount'] == 10
+    assert len(aws.s3.objects('scan')) == 10
+    assert list(aws.macie.jobs) == result['jobIds']
+
+def test_stages_a_page_per_invocation_without_time_left(aws, environment, expired_context):
+    add_raw_objects(aws, 600)
+
+    result, invocations = invoke_until_done({'Input': {'id': 'workflow'}}, expired_context)
+
+    assert invocations > 1
+    assert result['stagedCount'] == 600
+    assert len(aws.s3.objects('raw')) == 0
+    assert len(aws.macie.jobs) == 1
+
+def test_no_objects_needs_no_job(aws, environment, context):
+    result, _ = invoke_until_done({'Input': {'id': 'workflow'}}, context)
+
+    assert result['jobId'] == 'NoKeysFound'
+    assert not aws.macie.jobs
+
+def test_retries_only_the_jobs_not_created(aws, environment, context, monkeypatch):
+    monkeypatch.setattr(triggerMacieScan, 'JOB_CREATION_RETRY_SECONDS', 0)
+    # Three scan shards of 400 bytes
+    monkeypatch.setattr(triggerMacieScan, 'ScanShardPlanner', functools.partial(
+        triggerMacieScan.ScanShardPlanner, target_bytes = 400, max_shards = 3))
+    add_raw_objects(aws, 12)
+    create_job = aws.macie.create_classification_job
+    calls = []
+
+    def create_job_failing_once(**kwargs):
+        calls.append(kwargs['name'])
+        if len(calls) == 2:
+            raise RuntimeError('Rate exceeded')
+        return create_job(**kwargs)
+    aws.macie.create_classification_job = create_job_failing_once
+
+    event = {'Input': {'id': 'workflow'}}
+    first = triggerMacieScan.lambda_handler(event, context)
+    assert first['done'] is False
+    assert len(first['createdJobIds']) == 1
+    assert first['jobAttempts'] == 1
+
+    event['Input']['jobId'] = {'Payload': first}
+    result, _ = invoke_until_done(event, context)
+    assert result['jobIds'][0] == first['createdJobIds'][0]
+    assert len(result['jobIds']) == len(aws.macie.jobs) == 3
+    assert result['stagedCount'] == 12
+
+def test_finished_result_never_creates_jobs_again(aws, environment, context):
+    add_raw_objects(aws, 10)
+    event = {'Input': {'id': 'workflow'}}
+    result, _ = invoke_until_done(event, context)
+
+    again = triggerMacieScan.lambda_handler(event, context)
+
+    assert again['jobIds'] == result['jobIds']
+    assert len(aws.macie.jobs) == 1
+
+def test_fails_after_the_job_creation_attempts(aws, environment, context):
+    add_raw_objects(aws, 10)
+
+    def create_job_failing(**kwargs):
+        raise RuntimeError('Service unavailable')
+    aws.macie.create_classification_job = create_job_failing
+
+    result, invocations = invoke_until_done({'Input': {'id': 'workflow'}}, context)
+
+    assert result is None
+    assert invocations == triggerMacieScan.JOB_CREATION_ATTEMPTS
+
+def backdate_objects(aws, bucket_name, days):
+    for s3_object in aws.s3.objects(bucket_name).values():
+        s3_object.last_modified -= datetime.timedelta(days = days)
+
+def count_tagging_reads(aws):
+    get_tagging = aws.s3.get_object_tagging
+    keys = []
+
+    def counting_get_tagging(**kwargs):
+        keys.append(kwargs['Key'])
+        return get_tagging(**kwargs)
+    aws.s3.get_object_tagging = counting_get_tagging
+    return keys
+
+def test_single_bucket_sweeps_skip_settled_objects(aws, environment, context, monkeypatch):
+    monkeypatch.setenv('scanS3Bucket', 'raw')
+    add_raw_objects(aws, 10)
+    backdate_objects(aws, 'raw', 2)
+    invoke_until_done({'Input': {'id': 'first'}}, context)
+    aws.s3.add_object('raw', 'data/late.csv', 100)
+    tagging_reads = count_tagging_reads(aws)
+
+    result, _ = invoke_until_done({'Input': {'id': 'second'}}, context)
+
+    assert result['stagedCount'] == 1
+    assert 'data/object-0000.csv' not in tagging_reads
+
+def test_single_bucket_sweep_with_failures_keeps_checking(aws, environment, context, monkeypatch):
+    monkeypatch.setenv('scanS3Bucket', 'raw')
+    add_raw_objects(aws, 10)
+    backdate_objects(aws, 'raw', 2)
+    put_tagging = aws.s3.put_object_tagging
+
+    def put_tagging_failing_once(**kwargs):
+        if kwargs['Key'] == 'data/object-0000.csv':
+            aws.s3.put_object_tagging = put_tagging
+            raise RuntimeError('Service unavailable')
+        return put_tagging(**kwargs)
+    aws.s3.put_object_tagging = put_tagging_failing_once
+    invoke_until_done({'Input': {'id': 'first'}}, context)
+
+    result, _ = invoke_until_done({'Input': {'id': 'second'}}, context)
+
+    assert result['stagedCount'] == 1
+    assert aws.s3.objects('raw')['data/object-0000.csv'].tags['WorkflowId'] == 'second'